@@ -0,0 +1,406 @@
+# bench.py
+# قياس أداء البوت مع بيانات اصطناعية (مستخدمين/طلبات/أزرار) بدون اتصال بتيليجرام:
+# - يولّد users.json / orders.json / buttons.json بالحجم المطلوب في مجلد مؤقت
+# - يشغّل تدفقات تحديثات واقعية (/start، تنقل BTN|، إرسال request_info، موافقة الأدمن)
+#   عبر نفس معالجات main.py مع كائن bot وهمي
+# - يطبع p50/p99 والإنتاجية والذاكرة ويحفظ النتائج JSON للمقارنة بين النسخ
+#
+# الاستخدام:
+# python bench.py --orders 100000 --users 20000 --out bench_results.json
+# python bench.py --orders 100000 --compare bench_results.json   # يفشل (exit 1) عند تراجع > 20%
+# python bench.py --memory --users 1000000 --orders 200000        # ذاكرة dict عادي مقابل UserRecord/OrderRecord
+# python bench.py --workers 1,2,4,8 --updates 4000 --latency 0.05  # main_workers.py: تحديثات/ثانية لكل عدد عمليات
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ADMIN_ID = 1
+STATUSES = ["pending", "approved", "rejected", "needs_more"]
+
+# ---------------- synthetic data ----------------
+def make_buttons(n_buttons, per_submenu=8):
+    main_menu, leaves = [], []
+    i = 0
+    while i < n_buttons:
+        sid = f"menu{i}"
+        sub = []
+        for j in range(per_submenu):
+            bid = f"item{i}_{j}"
+            sub.append({"id": bid, "text": f"خدمة {i}-{j} ({random.choice([1, 2.5, 5, 10])}$)", "type": "request_info",
+                        "info_request": "أرسل ID والباقة المطلوبة (السعر 1$)"})
+            leaves.append(bid)
+        main_menu.append({"id": sid, "text": f"🎮 قسم {i}", "type": "submenu", "submenu": sub,
+                          "image": "", "description": "أسعار تبدأ من 1$"})
+        i += per_submenu + 1
+    main_menu.append({"id": "contact", "text": "📩 تواصل مع الأدمن", "type": "contact_admin", "image": "", "description": ""})
+    return {"main_menu": main_menu}, [b["id"] for b in main_menu if b["type"] == "submenu"], leaves
+
+def make_users(n_users):
+    now = datetime.now()
+    return {str(1000 + i): {"id": 1000 + i, "name": f"user{i}", "first_seen": (now - timedelta(minutes=i)).isoformat(),
+                            "currency_pref": random.choice(["AUTO", "USD", "SYP"])}
+            for i in range(n_users)}
+
+def make_orders(n_orders, n_users, leaves):
+    now = datetime.now()
+    orders = []
+    for i in range(n_orders):
+        uid = 1000 + random.randrange(max(n_users, 1))
+        leaf = random.choice(leaves)
+        created = now - timedelta(seconds=(n_orders - i) * 7)
+        status = random.choice(STATUSES)
+        o = {"order_id": str(uuid.uuid4()), "user_id": uid, "user_name": f"user{uid - 1000}", "button_id": leaf,
+             "button_text": f"خدمة {leaf}", "info": {"type": "text", "text": f"ID {random.randrange(10**8)}"},
+             "status": status, "created_at": created.isoformat()}
+        if status in ("approved", "rejected"):
+            o["handled_at"] = (created + timedelta(minutes=random.randrange(1, 120))).isoformat()
+        orders.append(o)
+    return orders
+
+# ---------------- synthetic updates ----------------
+class Updates:
+    def __init__(self):
+        self.next_id = 1
+
+    def _nid(self):
+        self.next_id += 1
+        return self.next_id
+
+    def message(self, uid, text):
+        msg = {"message_id": self._nid(), "date": 0, "chat": {"id": uid, "type": "private"},
+               "from": {"id": uid, "is_bot": False, "first_name": f"u{uid}"}, "text": text}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self._nid(), "message": msg}
+
+    def callback(self, uid, data):
+        return {"update_id": self._nid(), "callback_query": {
+            "id": str(self._nid()), "from": {"id": uid, "is_bot": False, "first_name": f"u{uid}"}, "chat_instance": "b",
+            "data": data, "message": {"message_id": 1, "date": 0, "chat": {"id": uid, "type": "private"}, "text": "x"}}}
+
+class StubMessage:
+    __slots__ = ("message_id",)
+
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+class StubApi:
+    """Replaces the network methods of main.bot; only counts calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def install(self, bot):
+        for name in ("send_message", "edit_message_text", "send_photo", "answer_callback_query", "reply_to",
+                     "register_next_step_handler"):
+            setattr(bot, name, self._call)
+
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+        return StubMessage(self.calls)
+
+# ---------------- measurement ----------------
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def summarize(samples, wall):
+    samples = sorted(samples)
+    n = len(samples)
+    if not n:
+        return {"n": 0}
+    pick = lambda q: samples[min(n - 1, int(q * n))] * 1000
+    return {"n": n, "p50_ms": round(pick(0.50), 4), "p99_ms": round(pick(0.99), 4),
+            "max_ms": round(samples[-1] * 1000, 4), "mean_ms": round(sum(samples) / n * 1000, 4),
+            "ops_per_s": round(n / wall, 1) if wall else None}
+
+def run_stream(process, updates):
+    samples = []
+    t0 = time.perf_counter()
+    for u in updates:
+        s = time.perf_counter()
+        process(u)
+        samples.append(time.perf_counter() - s)
+    return summarize(samples, time.perf_counter() - t0)
+
+def timed(fn, repeat):
+    samples = []
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        s = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - s)
+    return summarize(samples, time.perf_counter() - t0)
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "-C", HERE, "describe", "--always", "--dirty"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+# ---------------- benchmark ----------------
+def bench(args):
+    random.seed(args.seed)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="botbench-")
+    os.makedirs(workdir, exist_ok=True)
+    buttons, menus, leaves = make_buttons(args.buttons)
+    users = make_users(args.users)
+    orders = make_orders(args.orders, args.users, leaves)
+    config = {"BOT_TOKEN": "123456:BENCH", "ADMIN_IDS": [ADMIN_ID], "EXCHANGE_RATE": 15000, "CURRENCY_DEFAULT": "AUTO",
+              "BUTTON_LAYOUT": {"type": "grid", "grid_columns": 2}, "STORAGE_BACKEND": args.backend}
+    for name, data in (("config.json", config), ("buttons.json", buttons), ("users.json", users), ("orders.json", orders)):
+        with open(os.path.join(workdir, name), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    pending_ids = [o["order_id"] for o in orders if o["status"] == "pending"]
+    del users, orders
+    gc.collect()
+
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    import main
+    load_s = time.perf_counter() - t0
+    rss_loaded = rss_mb()
+    import telebot
+    stub = StubApi()
+    stub.install(main.bot)
+    main.scheduler.pause()
+    process = lambda raw: telebot.TeleBot.process_new_updates(main.bot, [telebot.types.Update.de_json(raw)])
+
+    ups = Updates()
+    n = args.updates
+    user_ids = [1000 + random.randrange(max(args.users, 1)) for _ in range(n)]
+    results = {}
+    results["start_new"] = run_stream(process, [ups.message(10**9 + i, "/start") for i in range(n)])
+    results["start_existing"] = run_stream(process, [ups.message(uid, "/start") for uid in user_ids])
+    results["nav_submenu"] = run_stream(process, [ups.callback(uid, f"BTN|{random.choice(menus)}") for uid in user_ids])
+    results["nav_home"] = run_stream(process, [ups.callback(uid, "NAV|home") for uid in user_ids])
+    # one chat hammering a menu through the full update path: all but the burst is throttled
+    flood = lambda raw: main.handle_update(telebot.types.Update.de_json(raw))
+    results["flood_one_chat"] = run_stream(flood, [ups.callback(user_ids[0], f"BTN|{menus[0]}") for _ in range(n)])
+    results["toggle_currency"] = run_stream(process, [ups.callback(uid, "NAV|toggle_currency") for uid in user_ids[:max(n // 10, 1)]])
+    flow = []
+    for uid in user_ids:
+        flow.append(ups.callback(uid, f"BTN|{random.choice(leaves)}"))
+        flow.append(ups.message(uid, f"ID {random.randrange(10**8)}"))
+    results["request_info_flow"] = run_stream(process, flow)
+    approvals = [ups.callback(ADMIN_ID, f"ORDER|{oid}|{random.choice(['approve', 'reject'])}")
+                 for oid in random.sample(pending_ids, min(n, len(pending_ids)))]
+    results["admin_approve"] = run_stream(process, approvals)
+    results["admin_stats"] = run_stream(process, [ups.callback(ADMIN_ID, "ADMIN|stats") for _ in range(max(n // 100, 5))])
+    results["admin_manage_orders"] = run_stream(process, [ups.callback(ADMIN_ID, "ADMIN|manage_orders") for _ in range(max(n // 100, 5))])
+    def build_main_uncached():
+        # what the first NAV|home after a button/rate/layout change costs
+        main.invalidate_menus()
+        return main.build_menu_kb(main.MAIN_MENU_ID, "1000")
+    results["build_keyboard_uncached"] = timed(build_main_uncached, max(n // 10, 10))
+    results["build_keyboard_cached"] = timed(lambda: main.build_menu_kb(main.MAIN_MENU_ID, "1000"), max(n // 10, 10))
+    all_texts = [b.get("text", "") for b in main.BUTTON_INDEX.values()]
+    def render_all_syp():
+        # rate-change path: rendered texts dropped, price templates kept
+        main.TEXT_CACHE.clear()
+        for text in all_texts:
+            main.render_prices(text, "SYP")
+    results["render_prices_syp_cold"] = timed(render_all_syp, max(n // 10, 10))
+    rates = iter(range(15001, 10**9))
+    def render_all_new_rate():
+        # admin changed the SYP rate: every price is formatted once more
+        main.PRICING.set_rate("SYP", next(rates), save=False)
+        main.TEXT_CACHE.clear()
+        for text in all_texts:
+            main.render_prices(text, "SYP")
+    results["render_prices_rate_change"] = timed(render_all_new_rate, max(n // 10, 10))
+    if main.STORE.name == "json":
+        # what compaction writes: untouched profiles copied from the mmap, changed ones re-dumped
+        results["save_json_users"] = timed(lambda: main._atomic_write_text("bench_users_snapshot.json", main.STORE.index._snapshot()),
+                                           args.snapshots)
+        results["save_json_orders"] = timed(lambda: main.save_json("bench_orders_snapshot.json", main.STORE.orders), args.snapshots)
+    total = sum(r.get("n", 0) for r in results.values())
+
+    report = {
+        "meta": {"version": git_version(), "date": datetime.now().isoformat(), "python": platform.python_version(),
+                 "backend": main.STORE.name, "users": args.users, "orders": args.orders, "buttons": args.buttons,
+                 "updates": n, "seed": args.seed, "workdir": workdir},
+        "startup": {"load_s": round(load_s, 3), "rss_before_mb": round(rss_before, 1), "rss_after_load_mb": round(rss_loaded, 1)},
+        "results": results,
+        "memory": {"peak_rss_mb": round(rss_mb(), 1)},
+        "api_calls": stub.calls,
+        "operations": total,
+    }
+    return report
+
+# ---------------- memory: plain dicts vs compact records ----------------
+def traced(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+def memory_report(args):
+    random.seed(args.seed)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="botbench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    with open("config.json", "w", encoding="utf-8") as f:
+        json.dump({"BOT_TOKEN": "123456:BENCH", "ARCHIVE_AFTER_DAYS": 0}, f)
+    sys.path.insert(0, HERE)
+    import main
+    main.scheduler.shutdown(wait=False)
+    _, _, leaves = make_buttons(args.buttons)
+    rows = {}
+    # both sides are built from the same JSON text, the way load_json reads it
+    for name, raw, compact in (("users", json.dumps(make_users(args.users), ensure_ascii=False), main.compact_users),
+                               ("orders", json.dumps(make_orders(args.orders, args.users, leaves), ensure_ascii=False), main.compact_orders)):
+        plain, plain_bytes = traced(lambda: json.loads(raw))
+        n = len(plain)
+        del plain
+        records, compact_bytes = traced(lambda: compact(json.loads(raw)))
+        assert json.dumps(records, ensure_ascii=False, default=main._json_default) == raw
+        del records
+        rows[name] = {"n": n, "plain_mb": round(plain_bytes / 2**20, 1), "compact_mb": round(compact_bytes / 2**20, 1),
+                      "plain_bytes_per_record": round(plain_bytes / max(n, 1)), "compact_bytes_per_record": round(compact_bytes / max(n, 1)),
+                      "saved_pct": round((1 - compact_bytes / plain_bytes) * 100, 1) if plain_bytes else 0.0}
+    return {"meta": {"version": git_version(), "date": datetime.now().isoformat(), "python": platform.python_version(),
+                     "users": args.users, "orders": args.orders, "seed": args.seed}, "memory": rows}
+
+def print_memory(report):
+    print(f"{'records':10s} {'n':>9s} {'plain MB':>10s} {'compact MB':>11s} {'B/rec':>7s} {'B/rec':>7s} {'saved':>7s}")
+    for name, r in report["memory"].items():
+        print(f"{name:10s} {r['n']:9d} {r['plain_mb']:10.1f} {r['compact_mb']:11.1f} {r['plain_bytes_per_record']:7d} "
+              f"{r['compact_bytes_per_record']:7d} {r['saved_pct']:6.1f}%")
+
+# ---------------- multi-process ----------------
+def workers_report(args):
+    # end-to-end: fake Bot API -> Supervisor (polling) -> N worker processes -> replies back to the fake API
+    sys.path.insert(0, HERE)
+    import fake_api
+    import main_workers
+    fake, server = fake_api.serve(port=args.api_port, latency=args.latency)
+    root = args.workdir or tempfile.mkdtemp(prefix="botbench-")
+    rows = {}
+    for n in [int(x) for x in args.workers.split(",") if x.strip()]:
+        workdir = os.path.join(root, f"workers{n}")
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        config = {"BOT_TOKEN": "123456:BENCH", "STORAGE_BACKEND": "sqlite", "FLOOD_ENABLED": False, "ARCHIVE_AFTER_DAYS": 0,
+                  "API_URL": f"http://127.0.0.1:{args.api_port}", "WORKERS": args.threads, "METRICS_PORT": args.api_port + 1}
+        with open("config.json", "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        sup = main_workers.Supervisor(n, config, args.updates)
+        t0 = time.perf_counter()
+        sup.start()
+        startup = time.perf_counter() - t0
+        poller = threading.Thread(target=main_workers.poll, args=(sup, config, True), daemon=True)
+        poller.start()
+        time.sleep(1)
+        mark = len(fake.calls)
+        chats = [1000 + i for i in range(args.updates)]
+        updates = Updates()
+        t0 = time.perf_counter()
+        fake.inject([{k: v for k, v in updates.message(chat, "/start").items() if k != "update_id"} for chat in chats])
+        deadline = time.time() + args.updates * max(args.latency, 0.01) * 2 + 60
+        done = 0
+        while time.time() < deadline:
+            done = sum(1 for c in fake.calls[mark:] if c["method"] == "sendMessage")
+            if done >= len(chats):
+                break
+            time.sleep(0.02)
+        wall = time.perf_counter() - t0
+        sup.stop()
+        poller.join()
+        rows[str(n)] = {"workers": n, "updates": len(chats), "replied": done, "wall_s": round(wall, 3),
+                        "updates_per_s": round(done / wall, 1) if wall else None, "startup_s": round(startup, 2)}
+        print(f"workers={n:2d}  {done}/{len(chats)} replies in {wall:.2f}s  {rows[str(n)]['updates_per_s']} updates/s  "
+              f"(startup {startup:.1f}s)", flush=True)
+    server.shutdown()
+    return {"meta": {"version": git_version(), "date": datetime.now().isoformat(), "python": platform.python_version(),
+                     "cpus": os.cpu_count(), "latency": args.latency, "threads": args.threads}, "workers": rows}
+
+def compare(report, baseline, threshold):
+    regressions = []
+    for name, cur in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("n") or not cur.get("n"):
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            a, b = old[metric], cur[metric]
+            delta = (b - a) / a * 100 if a else 0.0
+            flag = " <-- REGRESSION" if delta > threshold else ""
+            print(f"{name:26s} {metric:7s} {a:10.4f} -> {b:10.4f} ms ({delta:+.1f}%){flag}")
+            if flag:
+                regressions.append((name, metric, delta))
+    return regressions
+
+def print_report(report):
+    meta = report["meta"]
+    print(f"version {meta['version']}  backend={meta['backend']}  users={meta['users']}  orders={meta['orders']}  "
+          f"buttons={meta['buttons']}  updates={meta['updates']}")
+    print(f"startup {report['startup']['load_s']}s  peak rss {report['memory']['peak_rss_mb']} MB")
+    print(f"{'scenario':26s} {'n':>7s} {'p50 ms':>10s} {'p99 ms':>10s} {'ops/s':>10s}")
+    for name, r in report["results"].items():
+        if r.get("n"):
+            print(f"{name:26s} {r['n']:7d} {r['p50_ms']:10.4f} {r['p99_ms']:10.4f} {r['ops_per_s'] or 0:10.1f}")
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark main.py handlers with synthetic users/orders/buttons")
+    ap.add_argument("--users", type=int, default=10000)
+    ap.add_argument("--orders", type=int, default=10000, help="synthetic order history size (1k - 1M)")
+    ap.add_argument("--buttons", type=int, default=100, help="approximate number of buttons in the tree")
+    ap.add_argument("--updates", type=int, default=2000, help="updates per scenario")
+    ap.add_argument("--snapshots", type=int, default=3, help="repetitions of full save_json snapshots")
+    ap.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workdir", default="", help="where to write the data files (default: new temp dir)")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", default="", help="previous results JSON to compare p50/p99 against")
+    ap.add_argument("--threshold", type=float, default=20.0, help="regression threshold in percent")
+    ap.add_argument("--memory", action="store_true", help="only compare memory of plain dicts vs compact records")
+    ap.add_argument("--workers", default="", help="comma separated process counts for main_workers.py, e.g. 1,2,4,8")
+    ap.add_argument("--threads", type=int, default=8, help="update threads per worker process (--workers)")
+    ap.add_argument("--latency", type=float, default=0.05, help="fake Bot API latency in seconds (--workers)")
+    ap.add_argument("--api-port", type=int, default=18181, help="port of the in-process fake Bot API (--workers)")
+    return ap.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    out = os.path.abspath(args.out)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.memory:
+        report = memory_report(args)
+        print_memory(report)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os._exit(0)
+    if args.workers:
+        report = workers_report(args)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os._exit(0)
+    report = bench(args)
+    print_report(report)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"results saved to {out}")
+    failed = baseline is not None and bool(compare(report, baseline, args.threshold))
+    os._exit(1 if failed else 0)  # don't wait for the scheduler / dispatcher threads of main.py
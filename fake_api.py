@@ -0,0 +1,195 @@
+# fake_api.py
+# خادم Bot API وهمي محلي للتجربة بدون تيليجرام حقيقي:
+# - يرد على getMe / getUpdates / sendMessage / editMessageText / sendPhoto / answerCallbackQuery
+# - POST /inject  : إضافة تحديث (update) أو قائمة تحديثات ليستلمها البوت عبر getUpdates
+# - GET  /calls   : كل الطلبات التي أرسلها البوت (للفحص)
+# - POST /config  : تغيير latency / error_rate / flood_every / retry_after أثناء التشغيل
+#   (مثلاً {"error_rate": 1} لمحاكاة انقطاع API ثم {"error_rate": 0} للعودة)
+# - حقن تأخير وأخطاء: --latency 0.2 --error-rate 0.1 --flood-every 50
+# - sendPhoto برابط يأخذ --fetch-latency إضافية (جلب الصورة من المصدر) ويعيد file_id
+#   ثابتاً؛ إرسال نفس file_id لاحقاً لا يجلب شيئاً. GET /stats : عدد مرات الجلب
+#
+# الاستخدام:
+# python fake_api.py --port 8081
+# ثم ضع "API_URL": "http://127.0.0.1:8081" في config.json
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+class FakeTelegram:
+    def __init__(self, latency=0.0, error_rate=0.0, flood_every=0, retry_after=1, fetch_latency=0.0):
+        self.latency = latency
+        self.fetch_latency = fetch_latency
+        self.file_ids = set()  # file_ids handed out by sendPhoto
+        self.fetches = 0       # sendPhoto calls that had to fetch a URL
+        self.error_rate = error_rate
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.updates = []
+        self.calls = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.cond = threading.Condition()
+
+    def inject(self, updates):
+        with self.cond:
+            for u in updates:
+                u = dict(u)
+                u.setdefault("update_id", self.next_update_id)
+                self.next_update_id = max(self.next_update_id, u["update_id"]) + 1
+                self.updates.append(u)
+            self.cond.notify_all()
+
+    def _message(self, params, **extra):
+        with self.cond:
+            mid = self.next_message_id
+            self.next_message_id += 1
+        chat_id = int(params.get("chat_id") or 0)
+        msg = {"message_id": mid, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+               "from": {"id": 1, "is_bot": True, "first_name": "fake"}}
+        msg.update(extra)
+        return msg
+
+    def handle(self, method, params):
+        with self.cond:
+            self.calls.append({"method": method, "params": params, "at": time.time()})
+            n = len(self.calls)
+        if method == "getUpdates":
+            return True, self._get_updates(params)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.flood_every and n % self.flood_every == 0:
+            return False, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry later",
+                           "parameters": {"retry_after": self.retry_after}}
+        if self.error_rate and random.random() < self.error_rate:
+            return False, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+        if method == "getMe":
+            return True, {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        if method == "answerCallbackQuery":
+            return True, True
+        if method == "sendPhoto":
+            photo = params.get("photo", "")
+            if photo in self.file_ids:
+                fid = photo
+            elif photo.startswith(("http://", "https://")):
+                with self.cond:
+                    self.fetches += 1
+                if self.fetch_latency:
+                    time.sleep(self.fetch_latency)
+                fid = "F" + hashlib.sha1(photo.encode("utf-8")).hexdigest()[:16]
+                self.file_ids.add(fid)
+            else:
+                return False, {"ok": False, "error_code": 400, "description": "Bad Request: wrong file identifier/HTTP URL specified"}
+            return True, self._message(params, caption=params.get("caption", ""),
+                                       photo=[{"file_id": fid, "file_unique_id": fid[:8], "width": 1, "height": 1}])
+        if method in ("sendMessage", "editMessageText"):
+            return True, self._message(params, text=params.get("text", ""))
+        return True, True
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), 5.0)
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                if offset < 0:
+                    out = self.updates[offset:]
+                else:
+                    out = [u for u in self.updates if u["update_id"] >= offset]
+                    self.updates = out[:]  # confirmed updates are dropped
+                if out or time.time() >= deadline:
+                    return out[:100]
+                self.cond.wait(deadline - time.time())
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, code, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _params(self):
+            # telebot (sync) sends parameters in the query string, aiohttp in the body
+            params = dict(parse_qsl(urlsplit(self.path).query))
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+            if "json" in (self.headers.get("Content-Type") or ""):
+                body = json.loads(raw or "{}")
+                if isinstance(body, list):
+                    return body
+                params.update(body)
+            else:
+                params.update(parse_qsl(raw))
+            return params
+
+        def do_GET(self):
+            if self.path == "/calls":
+                self._reply(200, fake.calls)
+                return
+            if self.path == "/stats":
+                self._reply(200, {"calls": len(fake.calls), "fetches": fake.fetches, "file_ids": len(fake.file_ids)})
+                return
+            self._dispatch(self._params())
+
+        def do_POST(self):
+            params = self._params()
+            if self.path == "/inject":
+                fake.inject(params if isinstance(params, list) else [params])
+                self._reply(200, {"ok": True})
+                return
+            if self.path == "/config":
+                for key in ("latency", "error_rate", "flood_every", "retry_after"):
+                    if key in params:
+                        setattr(fake, key, type(getattr(fake, key))(params[key]))
+                self._reply(200, {"ok": True})
+                return
+            self._dispatch(params)
+
+        def _dispatch(self, params):
+            # /bot<token>/<method>
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            if len(parts) != 2 or not parts[0].startswith("bot"):
+                self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                return
+            ok, result = fake.handle(parts[1], params)
+            if ok:
+                self._reply(200, {"ok": True, "result": result})
+            else:
+                self._reply(result["error_code"], result)
+    return Handler
+
+def serve(host="127.0.0.1", port=8081, **opts):
+    fake = FakeTelegram(**opts)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return fake, server
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local fake Telegram Bot API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 502")
+    ap.add_argument("--flood-every", type=int, default=0, help="answer every Nth call with 429")
+    ap.add_argument("--fetch-latency", type=float, default=0.0, help="extra seconds for sendPhoto with a URL (origin fetch)")
+    args = ap.parse_args()
+    fake, server = serve(args.host, args.port, latency=args.latency, error_rate=args.error_rate, flood_every=args.flood_every,
+                         fetch_latency=args.fetch_latency)
+    print(f"fake Bot API on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
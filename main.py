@@ -5,17 +5,38 @@
 # - أشكال عرض أزرار: vertical/horizontal/grid
 # - أسعار بالدولار داخل النص (مثال: "خدمة (1$)") وتتحول تلقائياً لليرة السورية إذا وضع الأدمن سعر الصرف
 # - ملفات JSON: config.json, services.json, buttons.json, users.json, orders.json
+# - أو قاعدة SQLite (STORAGE_BACKEND = "sqlite" في config.json) مع ترحيل تلقائي من ملفات JSON
 # - تشغيل بالـ polling
 #
 # تثبيت الحزم المطلوبة:
 # pip install pyTelegramBotAPI APScheduler
+# (اختياري) تشغيل غير متزامن: pip install aiohttp ثم python main_async.py
 
 import os
 import json
 import logging
 import uuid
 import re
-from datetime import datetime
+import sqlite3
+import threading
+import time
+import queue
+import bisect
+import hmac
+import ssl
+import atexit
+import urllib.request
+import gzip
+import hashlib
+import itertools
+import sys
+import random
+import requests
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import MutableMapping
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta
 from threading import Lock
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -25,24 +46,204 @@ from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 # ---------------- log ----------------
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+BOOT_STARTED = time.perf_counter()
+
+# ---------------- metrics ----------------
+# Prometheus-style counters/histograms. Every hot-path hook checks
+# METRICS.enabled first, so with METRICS_ENABLED=false they cost one attribute read.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation
+        want = q * self.count
+        seen = 0
+        for bound, c in zip(self.bounds, self.counts):
+            seen += c
+            if seen >= want:
+                return bound
+        return float("inf")
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self._lock = Lock()
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}    # (name, labels) -> number
+        self.gauges = {}      # name -> callable returning a number
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram()
+            h.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items) + "}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda kv: kv[0])
+            snap = [(k, list(h.counts), h.sum, h.count, h.bounds) for k, h in histograms]
+        for (name, labels), value in counters:
+            lines.append(f"bot_{name}{self._labels(labels)} {value}")
+        for (name, labels), counts, total, count, bounds in snap:
+            acc = 0
+            for bound, c in zip(bounds, counts):
+                acc += c
+                lines.append(f"bot_{name}_bucket{self._labels(labels, [('le', bound)])} {acc}")
+            lines.append(f"bot_{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"bot_{name}_sum{self._labels(labels)} {total:.6f}")
+            lines.append(f"bot_{name}_count{self._labels(labels)} {count}")
+        for name, fn in sorted(self.gauges.items()):
+            try:
+                lines.append(f"bot_{name} {fn()}")
+            except Exception as e:
+                logger.debug("gauge %s failed: %s", name, e)
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        parts = []
+        with self._lock:
+            for (name, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                lbl = ",".join(str(v) for _, v in labels)
+                parts.append(f"{name}[{lbl}] n={h.count} avg={h.sum / h.count * 1000:.1f}ms p99<={h.quantile(0.99) * 1000:g}ms")
+            for (name, labels), value in sorted(self.counters.items()):
+                lbl = ",".join(str(v) for _, v in labels)
+                parts.append(f"{name}[{lbl}]={value}")
+        return "; ".join(parts)
+
+METRICS = Metrics()
+
+class TimedLock:
+    """Lock that records how long callers waited for it (when metrics are on)."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = Lock()
+
+    def __enter__(self):
+        if METRICS.enabled:
+            t0 = time.perf_counter()
+            self._lock.acquire()
+            METRICS.observe("lock_wait_seconds", time.perf_counter() - t0, lock=self.name)
+        else:
+            self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
 
 # ---------------- files & defaults ----------------
-LOCK = Lock()
+LOCK = TimedLock("LOCK")
 
 CONFIG_FILE = "config.json"
 SERVICES_FILE = "services.json"   # optional list of services structured
 BUTTONS_FILE = "buttons.json"
 USERS_FILE = "users.json"
 ORDERS_FILE = "orders.json"
+ADMINS_FILE = "admins.json"
+BROADCASTS_FILE = "broadcasts.json"  # broadcast jobs + progress checkpoints
+STATS_FILE = "stats.json"            # running order/user aggregates
+MEDIA_FILE = "media_cache.json"      # image URL -> Telegram file_id
+RATES_FILE = "rates.json"            # currency rate table + history of changes
+SESSIONS_FILE = "sessions.json"      # admin multi-step flows in progress
+AWAITING_FILE = "awaiting.json"      # users asked for order info (request_info buttons)
+DIGESTS_FILE = "digests.json"        # admin digest id -> order ids (json backend)
+LEADER_LOCK_FILE = "leader.lock"     # main_workers.py: held by the process running shared jobs
+
+# multi-process mode (main_workers.py sets these for each worker process)
+WORKER_ID = os.environ.get("BOT_WORKER_ID")  # "0".."N-1"; None = the usual single process
+WORKER_COUNT = int(os.environ.get("BOT_WORKER_COUNT", "1") or 1)
+
+def worker_path(path):
+    # files every process writes on its own (stats, broadcasts) get one copy per worker
+    if WORKER_ID is None:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.w{WORKER_ID}{ext}"
 
 DEFAULT_CONFIG = {
     "BOT_TOKEN": "PUT_YOUR_BOT_TOKEN_HERE",
     "ADMIN_IDS": [],             # ضع ID الأدمن هنا
     "BOT_STATUS": "on",
     "ALLOW_LINKS": False,
-    "EXCHANGE_RATE": None,       # سعر الصرف: مثال 15000
-    "CURRENCY_DEFAULT": "AUTO",  # "USD","SYP","AUTO"
-    "BUTTON_LAYOUT": {"type": "vertical", "grid_columns": 2}
+    "EXCHANGE_RATE": None,       # سعر الصرف الأولي لـ SYP (بعدها تُدار الأسعار من rates.json ولوحة الأدمن)
+    "CURRENCY_DEFAULT": "AUTO",  # "USD" أو رمز عملة من جدول الأسعار أو "AUTO"
+    "CURRENCY_AUTO": "SYP",      # العملة التي يراها مستخدمو AUTO (إن كان لها سعر)
+    "BUTTON_LAYOUT": {"type": "vertical", "grid_columns": 2},
+    "STORAGE_BACKEND": "json",   # "json" أو "sqlite"
+    "SQLITE_PATH": "bot.db",
+    "WORKERS": 8,                 # عدد خيوط معالجة التحديثات
+    "MAX_PENDING_UPDATES": 1000,
+    "BROADCAST_RATE": 25,         # رسائل/ثانية للبث والإشعارات معاً (حد تيليجرام العام ~30)
+    "API_URL": "",                # فارغ = https://api.telegram.org (أو خادم محلي مثل fake_api.py)
+    "MODE": "polling",            # "polling" أو "webhook"
+    "WEBHOOK_URL": "",            # الرابط العام الذي يرسل له تيليجرام (https://example.com/telegram)
+    "WEBHOOK_HOST": "0.0.0.0",
+    "WEBHOOK_PORT": 8443,
+    "WEBHOOK_PATH": "/telegram",
+    "WEBHOOK_SECRET": "",         # يُقارن مع X-Telegram-Bot-Api-Secret-Token
+    "WEBHOOK_CERT": "",           # اختياري: TLS مباشر بدون reverse proxy
+    "WEBHOOK_KEY": "",
+    "METRICS_ENABLED": False,     # /metrics بصيغة Prometheus + ملخص دوري في السجل
+    "METRICS_HOST": "127.0.0.1",
+    "METRICS_PORT": 9108,
+    "METRICS_LOG_MINUTES": 5,
+    "USER_FLUSH_SECONDS": 1.0,    # تجميع تغييرات المستخدمين وكتابتها دفعة واحدة
+    "USER_FLUSH_BATCH": 500,
+    "USER_CACHE_SIZE": 50000,     # ملفات المستخدمين المحفوظة في الذاكرة (الباقي يُقرأ عند الحاجة)
+    "ORDERS_PAGE_SIZE": 10,
+    "ARCHIVE_AFTER_DAYS": 30,     # الطلبات المقبولة/المرفوضة الأقدم من هذا تُنقل للأرشيف (0 = تعطيل)
+    "ARCHIVE_DIR": "archive",
+    "FLOOD_ENABLED": True,        # حد لسرعة التحديثات لكل محادثة (الأدمن مستثنى)
+    "FLOOD_LIMITS": {"message": [1, 5], "command": [0.5, 3], "callback": [3, 10]},  # [تحديث/ثانية, رصيد الدفعة]
+    "FLOOD_GLOBAL_RATE": 0,       # حد عام لكل المستخدمين معاً (تحديث/ثانية، 0 = بدون)
+    "FLOOD_MAX_CHATS": 10000,     # عدد المحادثات المتتبعة (الأقدم استخداماً يُحذف)
+    "HTTP_POOL_SIZE": 100,        # اتصالات keep-alive المشتركة مع Bot API
+    "API_TIMEOUT": 15,            # مهلة الطلب بالثواني (الافتراضية لكل الدوال)
+    "API_TIMEOUTS": {},           # مهلة لدالة محددة، مثل {"sendPhoto": 30}
+    "API_RETRIES": 2,             # إعادة المحاولة عند أخطاء الشبكة و5xx و429
+    "API_BACKOFF": 0.5,           # ثواني الانتظار الأولى، تتضاعف مع كل محاولة
+    "API_MAX_RETRY_AFTER": 10,    # 429 بانتظار أطول من هذا يُعاد للمستدعي بدل الانتظار
+    "API_BREAKER_THRESHOLD": 5,   # أخطاء متتالية تفتح القاطع (رفض فوري بدون اتصال)
+    "API_BREAKER_COOLDOWN": 30,   # ثواني قبل تجربة الاتصال مجدداً
+    "ADMIN_NOTIFY_MODE": "instant",  # "instant" رسالة لكل طلب، أو "digest" ملخص دوري بأزرار قبول/رفض
+    "ADMIN_DIGEST_SECONDS": 60,   # مدة تجميع الطلبات في وضع digest
+    "ADMIN_NOTIFY_WORKERS": 4,    # إرسال متوازٍ لإشعارات الأدمن
+    "SESSION_TTL_MINUTES": 30,    # خطوات الأدمن المتروكة تُلغى بعد هذه المدة
+    "AWAITING_TTL_HOURS": 24,     # انتظار معلومات الطلب من المستخدم يُلغى بعد هذه المدة
+    "SESSION_MAX_ENTRIES": 10000, # حد الجلسات في الذاكرة (الأقدم استخداماً يُحذف)
+    "SESSION_WHEEL_SECONDS": 5    # دقة انتهاء الجلسات (فحص دوري)
 }
 
 # default buttons structure (main_menu is list)
@@ -63,71 +264,2236 @@ DEFAULT_BUTTONS = {
     ]
 }
 
-DEFAULT_SERVICES = []  # optional, not strictly required
-DEFAULT_USERS = {}
-DEFAULT_ORDERS = []
-DEFAULT_ADMINS = {"admins": []}
+DEFAULT_SERVICES = []  # optional, not strictly required
+DEFAULT_USERS = {}
+DEFAULT_ORDERS = []
+DEFAULT_ADMINS = {"admins": []}
+
+# ---------------- file helpers ----------------
+# snapshot + journal: every change to USERS/ORDERS is appended as one JSON line
+# to "<file>.journal"; load_json replays it on top of the snapshot and a
+# scheduler job folds it back into the snapshot (compaction).
+JOURNAL_SUFFIX = ".journal"
+_JOURNAL_HANDLES = {}  # path -> open append handle
+
+def _write_temp(path, payload, tmp=None):
+    # the fsync'd content of path under another name; os.replace makes it live
+    t0 = time.perf_counter() if METRICS.enabled else 0
+    tmp = tmp or f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    if METRICS.enabled:
+        METRICS.observe("save_json_seconds", time.perf_counter() - t0, file=os.path.basename(path))
+        METRICS.inc("bytes_written_total", len(payload.encode("utf-8")), file=os.path.basename(path))
+    return tmp
+
+def _atomic_write_text(path, payload):
+    # temp file + rename so a crash mid-write never truncates the real file
+    os.replace(_write_temp(path, payload), path)
+
+def _json_default(obj):
+    # compact records (UserRecord / OrderRecord) serialize as plain dicts
+    if isinstance(obj, _Record):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+def _dump(data):
+    return json.dumps(data, ensure_ascii=False, indent=2, default=_json_default)
+
+def _close_journal(path):
+    fh = _JOURNAL_HANDLES.pop(path, None)
+    if fh:
+        fh.close()
+
+def ensure_file(path, default):
+    if not os.path.exists(path):
+        _atomic_write_text(path, _dump(default))
+
+def replay_journal(path, data):
+    """Apply "<path>.journal" records to data in place, return count applied."""
+    jpath = path + JOURNAL_SUFFIX
+    if not os.path.exists(jpath):
+        return 0
+    index = None  # order_id -> order, built on first list op
+    applied = 0
+    with open(jpath, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # torn last line from a crash mid-append
+                logger.warning("Skipping corrupt journal record in %s", jpath)
+                continue
+            op = rec.get("op")
+            if op == "set" and isinstance(data, dict):
+                data[rec["key"]] = rec["value"]
+            elif op == "del" and isinstance(data, dict):
+                data.pop(rec["key"], None)
+            elif op == "remove" and isinstance(data, list):
+                # archived orders leave the hot list in one batch
+                keys = set(rec.get("keys") or ())
+                data[:] = [o for o in data if o.get("order_id") not in keys]
+                index = None
+            elif op in ("append", "update") and isinstance(data, list):
+                if index is None:
+                    index = {o.get("order_id"): o for o in data if isinstance(o, dict)}
+                if op == "append":
+                    val = rec["value"]
+                    # records written during a compaction may already be in the snapshot
+                    if val.get("order_id") in index:
+                        continue
+                    data.append(val)
+                    index[val.get("order_id")] = val
+                else:
+                    o = index.get(rec["key"])
+                    if o is None:
+                        continue
+                    o.update(rec["value"])
+            else:
+                continue
+            applied += 1
+    return applied
+
+def load_json(path, default=None):
+    with LOCK:
+        if not os.path.exists(path):
+            if default is not None:
+                ensure_file(path, default)
+                data = json.loads(json.dumps(default))
+                replay_journal(path, data)
+                return data
+            return {} if default is None else default
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except Exception as e:
+                logger.exception("Failed to load %s: %s", path, e)
+                return default if default is not None else {}
+        n = replay_journal(path, data)
+        if n:
+            logger.info("Replayed %d journal records for %s", n, path)
+        return data
+
+def save_json(path, data):
+    # full snapshot: supersedes anything still in the journal
+    with LOCK:
+        _atomic_write_text(path, _dump(data))
+        _close_journal(path)
+        if os.path.exists(path + JOURNAL_SUFFIX):
+            os.remove(path + JOURNAL_SUFFIX)
+
+def journal_append(path, op, **fields):
+    # one line per change, fsync'd so an acknowledged change survives a crash
+    journal_append_many(path, [dict(fields, op=op)])
+
+def journal_append_many(path, records):
+    # a batch of records with a single write + fsync
+    if not records:
+        return
+    line = "".join(json.dumps(rec, ensure_ascii=False, separators=(",", ":"), default=_json_default) + "\n" for rec in records)
+    t0 = time.perf_counter() if METRICS.enabled else 0
+    with LOCK:
+        fh = _JOURNAL_HANDLES.get(path)
+        if fh is None:
+            fh = _JOURNAL_HANDLES[path] = open(path + JOURNAL_SUFFIX, "a", encoding="utf-8")
+        fh.write(line)
+        fh.flush()
+        os.fsync(fh.fileno())
+    if METRICS.enabled:
+        name = os.path.basename(path) + JOURNAL_SUFFIX
+        METRICS.observe("save_json_seconds", time.perf_counter() - t0, file=name)
+        METRICS.inc("bytes_written_total", len(line.encode("utf-8")), file=name)
+
+def compact_journal(path, data, dump=_dump):
+    """Fold the journal into a fresh snapshot; LOCK is held only for the rename."""
+    jpath = path + JOURNAL_SUFFIX
+    with LOCK:
+        offset = os.path.getsize(jpath) if os.path.exists(jpath) else 0
+    if not offset:
+        return False
+    try:
+        payload = dump(data)
+    except RuntimeError:
+        # data changed size while serializing; next run will pick it up
+        return False
+    # writing + fsync of the whole snapshot runs while orders keep being journaled
+    tmp = _write_temp(path, payload, f"{path}.compact.tmp")
+    with LOCK:
+        _close_journal(path)
+        os.replace(tmp, path)
+        # keep records appended after we measured; replay is idempotent for them
+        with open(jpath, "rb") as f:
+            f.seek(offset)
+            tail = f.read()
+        if tail:
+            _atomic_write_text(jpath, tail.decode("utf-8"))
+        else:
+            os.remove(jpath)
+    logger.info("Compacted journal for %s (%d bytes)", path, offset)
+    return True
+
+# ensure files exist
+ensure_file(CONFIG_FILE, DEFAULT_CONFIG)
+ensure_file(BUTTONS_FILE, DEFAULT_BUTTONS)
+ensure_file(SERVICES_FILE, DEFAULT_SERVICES)
+ensure_file(USERS_FILE, DEFAULT_USERS)
+ensure_file(ORDERS_FILE, DEFAULT_ORDERS)
+
+# ---------------- compact records ----------------
+# users and orders stay dict-like for the handlers (get / [] / setdefault /
+# update) but live in __slots__ objects: no per-record dict, ISO timestamps
+# packed into integer microseconds, repeated strings (status, button ids,
+# currency) interned. Keys outside FIELDS go to a small overflow dict, and
+# dict(record) gives back the exact JSON shape that was loaded.
+_UNSET = object()
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+def _pack_time(value):
+    # lossless only: naive datetime.isoformat() output; anything else stays a string
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    if dt.tzinfo is not None or value[10:11] != "T" or len(value) != (26 if dt.microsecond else 19):
+        return value
+    return ((dt.toordinal() - _EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second) * 1000000 + dt.microsecond
+
+def _unpack_time(packed):
+    return (_EPOCH + timedelta(microseconds=packed)).isoformat()
+
+class _Record(MutableMapping):
+    __slots__ = ("_extra",)
+    FIELDS = ()
+    _FIELDSET = frozenset()
+    TIMES = frozenset()
+    INTERN = frozenset()
+
+    def __init__(self, data=None, **fields):
+        for name in self.FIELDS:
+            object.__setattr__(self, name, _UNSET)
+        self._extra = None
+        if data:
+            self._load(data)
+        if fields:
+            self._load(fields)
+
+    def _load(self, data):
+        # __setitem__ inlined: this runs once per record at startup
+        fieldset, times, intern = self._FIELDSET, self.TIMES, self.INTERN
+        for k, v in data.items():
+            if k in fieldset:
+                if type(v) is str:
+                    if k in times:
+                        v = _pack_time(v)
+                    elif k in intern:
+                        v = sys.intern(v)
+                object.__setattr__(self, k, v)
+            else:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[k] = v
+
+    def __getitem__(self, key):
+        if key in self._FIELDSET:
+            v = getattr(self, key)
+            if v is _UNSET:
+                raise KeyError(key)
+            return _unpack_time(v) if type(v) is int and key in self.TIMES else v
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def get(self, key, default=None):
+        if key in self._FIELDSET:
+            v = getattr(self, key)
+            if v is _UNSET:
+                return default
+            return _unpack_time(v) if type(v) is int and key in self.TIMES else v
+        return default if self._extra is None else self._extra.get(key, default)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELDSET:
+            if type(value) is str:
+                if key in self.TIMES:
+                    value = _pack_time(value)
+                elif key in self.INTERN:
+                    value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELDSET:
+            if getattr(self, key) is _UNSET:
+                raise KeyError(key)
+            setattr(self, key, _UNSET)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in self.FIELDS:
+            if getattr(self, name) is not _UNSET:
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        out = {}
+        for name in self.FIELDS:
+            v = getattr(self, name)
+            if v is not _UNSET:
+                out[name] = _unpack_time(v) if type(v) is int and name in self.TIMES else v
+        if self._extra:
+            out.update(self._extra)
+        return out
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+class UserRecord(_Record):
+    FIELDS = ("id", "name", "first_seen", "awaiting", "currency_pref", "blocked")
+    __slots__ = FIELDS
+    _FIELDSET = frozenset(FIELDS)
+    TIMES = frozenset({"first_seen"})
+    INTERN = frozenset({"currency_pref"})
+
+class OrderRecord(_Record):
+    FIELDS = ("order_id", "user_id", "user_name", "button_id", "button_text", "info", "status", "created_at",
+              "price_usd", "currency", "price", "rate", "handled_at")
+    __slots__ = FIELDS
+    _FIELDSET = frozenset(FIELDS)
+    TIMES = frozenset({"created_at", "handled_at"})
+    INTERN = frozenset({"button_id", "button_text", "status", "currency"})
+
+def compact_users(users):
+    return {uid: u if isinstance(u, UserRecord) else UserRecord(u) for uid, u in users.items()} if isinstance(users, dict) else users
+
+def compact_orders(orders):
+    return [o if isinstance(o, OrderRecord) else OrderRecord(o) for o in orders] if isinstance(orders, list) else orders
+
+# ---------------- order repository ----------------
+class OrderRepo:
+    """Orders list plus dict indexes by order_id and status (O(1) lookups).
+
+    For paging, every order gets a sequence number when it is first added
+    and ``lists`` keeps, per filter (all, status, button, button+status,
+    user), the sequence numbers and orders of that filter sorted by it. A
+    status change moves the order between status lists at its own place, and
+    page cursors are sequence numbers, so a page costs O(log n + page size)
+    and stays put when other orders change status or are archived.
+    """
+
+    def __init__(self, orders):
+        self.orders = orders
+        self.by_id = {}
+        self.by_status = {}  # status -> {order_id: order}
+        self.lists = {}      # filter key -> ([seq, ...], [order, ...]) sorted by seq
+        self.seq = {}        # order_id -> sequence number (insertion order)
+        self._next_seq = 1
+        for o in orders:
+            self._index(o)
+
+    @staticmethod
+    def _keys(o):
+        status, button = o.get("status"), o.get("button_id")
+        return (("all",), ("status", status), ("button", button), ("button", button, status), ("user", o.get("user_id")))
+
+    @staticmethod
+    def _status_keys(o):
+        status = o.get("status")
+        return (("status", status), ("button", o.get("button_id"), status))
+
+    def _insert(self, key, seq, o):
+        seqs, orders = self.lists.setdefault(key, ([], []))
+        if not seqs or seqs[-1] < seq:
+            # new orders: a plain append
+            seqs.append(seq)
+            orders.append(o)
+            return
+        i = bisect.bisect_left(seqs, seq)
+        seqs.insert(i, seq)
+        orders.insert(i, o)
+
+    def _discard(self, key, seq):
+        entry = self.lists.get(key)
+        if entry is None:
+            return
+        seqs, orders = entry
+        i = bisect.bisect_left(seqs, seq)
+        if i < len(seqs) and seqs[i] == seq:
+            del seqs[i]
+            del orders[i]
+
+    def _index(self, o):
+        oid = o.get("order_id")
+        seq = self.seq.get(oid)
+        if seq is None:
+            seq = self.seq[oid] = self._next_seq
+            self._next_seq += 1
+        self.by_id[oid] = o
+        self.by_status.setdefault(o.get("status"), {})[oid] = o
+        for key in self._keys(o):
+            self._insert(key, seq, o)
+
+    def add(self, o):
+        self.orders.append(o)
+        self._index(o)
+
+    def get(self, order_id):
+        return self.by_id.get(order_id)
+
+    def update(self, o, fields):
+        old = o.get("status")
+        old_keys = self._status_keys(o)
+        o.update(fields)
+        new = o.get("status")
+        if new != old:
+            oid = o.get("order_id")
+            seq = self.seq[oid]
+            self.by_status.get(old, {}).pop(oid, None)
+            self.by_status.setdefault(new, {})[oid] = o
+            for key in old_keys:
+                self._discard(key, seq)
+            for key in self._status_keys(o):
+                self._insert(key, seq, o)
+
+    def remove(self, order_ids):
+        drop = set(order_ids)
+        # one slice assignment: orders appended meanwhile stay after the cut
+        n = len(self.orders)
+        self.orders[:n] = [o for o in self.orders[:n] if o.get("order_id") not in drop]
+        gone = set()
+        for oid in drop:
+            o = self.by_id.pop(oid, None)
+            if o is None:
+                continue
+            self.by_status.get(o.get("status"), {}).pop(oid, None)
+            gone.add(self.seq.pop(oid))
+        # archiving is a batch job: one pass beats a list delete per order
+        lists = {}
+        for key, (seqs, orders) in self.lists.items():
+            keep = [i for i, s in enumerate(seqs) if s not in gone]
+            if keep:
+                lists[key] = ([seqs[i] for i in keep], [orders[i] for i in keep])
+        self.lists = lists
+
+    def page(self, status=None, button_id=None, user_id=None, before=None, after=None, limit=10):
+        """Newest-first page; ``before``/``after`` are cursors (sequence numbers) from a previous page."""
+        extra = None
+        if user_id is not None:
+            key = ("user", user_id)
+            extra = lambda o: (status is None or o.get("status") == status) and (button_id is None or o.get("button_id") == button_id)
+        elif button_id is not None:
+            key = ("button", button_id, status) if status else ("button", button_id)
+        else:
+            key = ("status", status) if status else ("all",)
+        seqs, orders = self.lists.get(key, ([], []))
+
+        found = []
+        if after is not None:
+            i = bisect.bisect_right(seqs, after)
+            while i < len(seqs) and len(found) <= limit:
+                if extra is None or extra(orders[i]):
+                    found.append(i)
+                i += 1
+            has_newer, has_older = len(found) > limit, True
+            found = found[:limit][::-1]
+        else:
+            i = (len(seqs) if before is None else bisect.bisect_left(seqs, before)) - 1
+            while i >= 0 and len(found) <= limit:
+                if extra is None or extra(orders[i]):
+                    found.append(i)
+                i -= 1
+            has_older, has_newer = len(found) > limit, before is not None
+            found = found[:limit]
+        return {"orders": [orders[i] for i in found],
+                "older": seqs[found[-1]] if found and has_older else None,
+                "newer": seqs[found[0]] if found and has_newer else None}
+
+# ---------------- lazy user profiles ----------------
+# USERS is not a dict of every profile: it is an LRU of at most USER_CACHE_SIZE
+# profiles in front of the store, filled on first access. Profiles with
+# changes the write-behind hasn't written yet are pinned (never evicted).
+class UserCache(MutableMapping):
+    def __init__(self, loader, capacity=50000):
+        self.loader = loader  # load_user / has_user / user_ids / count_users
+        self.capacity = max(int(capacity), 1)
+        self._lru = OrderedDict()
+        self._pinned = set()
+        self._deleted = set()  # deletions not written yet
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, uid):
+        with self._lock:
+            u = self._lru.get(uid)
+            if u is not None:
+                self._lru.move_to_end(uid)
+                self.hits += 1
+                return u
+            if uid in self._deleted:
+                raise KeyError(uid)
+            self.misses += 1
+        u = self.loader.load_user(uid)
+        if u is None:
+            raise KeyError(uid)
+        with self._lock:
+            # another thread may have loaded (or set) it meanwhile: keep that one
+            u = self._lru.setdefault(uid, u)
+            self._evict()
+        return u
+
+    def __setitem__(self, uid, user):
+        with self._lock:
+            self._lru[uid] = user
+            self._lru.move_to_end(uid)
+            self._deleted.discard(uid)
+            self._pinned.add(uid)  # until save_user / the write-behind writes it
+            self._evict()
+
+    def __delitem__(self, uid):
+        if uid not in self:
+            raise KeyError(uid)
+        with self._lock:
+            self._lru.pop(uid, None)
+            self._deleted.add(uid)
+            self._pinned.add(uid)
+
+    def __contains__(self, uid):
+        with self._lock:
+            if uid in self._lru:
+                return True
+            if uid in self._deleted:
+                return False
+        return self.loader.has_user(uid)
+
+    def __iter__(self):
+        with self._lock:
+            extra = [uid for uid in self._pinned if uid in self._lru]
+            deleted = set(self._deleted)
+        seen = set()
+        for uid in itertools.chain(self.loader.user_ids(), extra):
+            if uid not in seen and uid not in deleted:
+                seen.add(uid)
+                yield uid
+
+    def __len__(self):
+        with self._lock:
+            pinned = list(self._pinned)
+            deleted = set(self._deleted)
+        # profiles created (or deleted) but not written yet
+        n = self.loader.count_users()
+        for uid in pinned:
+            stored = self.loader.has_user(uid)
+            if uid in deleted:
+                n -= stored
+            elif not stored:
+                n += 1
+        return n
+
+    def _evict(self):
+        for _ in range(len(self._lru)):
+            if len(self._lru) <= self.capacity:
+                return
+            uid, u = self._lru.popitem(last=False)
+            if uid in self._pinned:
+                self._lru[uid] = u
+
+    def pin(self, uid):
+        with self._lock:
+            self._pinned.add(uid)
+
+    def unpin(self, uids):
+        with self._lock:
+            for uid in uids:
+                self._pinned.discard(uid)
+                self._deleted.discard(uid)
+            self._evict()
+
+    def invalidate(self, uids):
+        # another process changed these profiles: re-read them on next access
+        with self._lock:
+            for uid in uids:
+                if uid not in self._pinned:
+                    self._lru.pop(uid, None)
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._lru), "pinned": len(self._pinned), "capacity": self.capacity,
+                    "hits": self.hits, "misses": self.misses}
+
+class _JournalOverlay(dict):
+    # replay_journal target: a "del" record has to hide the snapshot entry, so it stays as None
+    def pop(self, key, default=None):
+        self[key] = None
+        return default
+
+class JsonUserIndex:
+    """users.json read in place: startup only scans the mmap for the byte span
+    of each top-level profile (the file is always written with indent=2, so
+    those are the only lines starting with two spaces and a quote) and a
+    profile is parsed when first asked for. Journal records since the last
+    snapshot are kept in ``changed`` on top of it until compaction."""
+
+    KEY_RE = re.compile(rb'^  "((?:[^"\\\n]|\\.)*)": ', re.M)
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = {}  # uid -> (seq, UserRecord or None if deleted)
+        self._seq = 0
+        self._lock = Lock()
+        self._open()
+        overlay = _JournalOverlay()
+        n = replay_journal(path, overlay)
+        if n:
+            logger.info("Replayed %d journal records for %s", n, path)
+        for uid, value in overlay.items():
+            self._change(uid, UserRecord(value) if isinstance(value, dict) else value)
+
+    def _open(self):
+        import mmap
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        head, tail = bytes(mm[:2]), bytes(mm[-2:]).rstrip()
+        if size and head.strip() != b"{}" and (head != b"{\n" or not tail.endswith(b"}")):
+            # not the layout _dump writes (hand edited / minified): rewrite it once
+            logger.info("Rewriting %s in indexed layout", self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            _atomic_write_text(self.path, _dump(data if isinstance(data, dict) else {}))
+            return self._open()
+        spans = {}
+        prev, prev_start = None, 0
+        for m in self.KEY_RE.finditer(mm):
+            if prev is not None:
+                spans[prev] = (prev_start << 32) | (m.start() - 2 - prev_start)  # drop ",\n"
+            raw = m.group(1)
+            prev = raw.decode("utf-8") if b"\\" not in raw else json.loads(b'"' + raw + b'"')
+            prev_start = m.end()
+        if prev is not None:
+            end = mm.rfind(b"}")
+            spans[prev] = (prev_start << 32) | (mm.rfind(b"\n", 0, end) - prev_start)
+        with self._lock:
+            self._mm, self.spans = mm, spans
+
+    @staticmethod
+    def _slice(mm, span):
+        start = span >> 32
+        return mm[start:start + (span & 0xFFFFFFFF)]
+
+    def _change(self, uid, user):
+        with self._lock:
+            self._seq += 1
+            self.changed[uid] = (self._seq, user)
+
+    def load_user(self, uid):
+        with self._lock:
+            hit = self.changed.get(uid)
+            if hit is not None:
+                return hit[1]
+            span = self.spans.get(uid)
+            raw = self._slice(self._mm, span) if span is not None else None
+        return UserRecord(json.loads(raw)) if raw is not None else None
+
+    def has_user(self, uid):
+        with self._lock:
+            hit = self.changed.get(uid)
+            return hit[1] is not None if hit is not None else uid in self.spans
+
+    def user_ids(self):
+        with self._lock:
+            spans, changed = self.spans, dict(self.changed)
+        for uid in spans:
+            hit = changed.get(uid)
+            if hit is None or hit[1] is not None:
+                yield uid
+        for uid, (_, u) in changed.items():
+            if u is not None and uid not in spans:
+                yield uid
+
+    def count_users(self):
+        with self._lock:
+            n = len(self.spans)
+            for uid, (_, u) in self.changed.items():
+                if u is None and uid in self.spans:
+                    n -= 1
+                elif u is not None and uid not in self.spans:
+                    n += 1
+        return n
+
+    def save(self, items):
+        for uid, u in items:
+            self._change(uid, u)
+        journal_append_many(self.path, [{"op": "set", "key": uid, "value": u} if u is not None else {"op": "del", "key": uid}
+                                        for uid, u in items])
+
+    def _snapshot(self, _data=None):
+        # unchanged profiles are copied byte for byte, changed ones re-dumped at the same indent
+        with self._lock:
+            mm, spans, changed = self._mm, self.spans, dict(self.changed)
+        parts = []
+        for uid in itertools.chain(spans, (uid for uid in changed if uid not in spans)):
+            hit = changed.get(uid)
+            if hit is None:
+                value = self._slice(mm, spans[uid]).decode("utf-8")
+            elif hit[1] is None:
+                continue
+            else:
+                value = json.dumps(hit[1], ensure_ascii=False, indent=2, default=_json_default).replace("\n", "\n  ")
+            parts.append(f"  {json.dumps(uid, ensure_ascii=False)}: {value}")
+        return "{\n" + ",\n".join(parts) + "\n}" if parts else "{}"
+
+    def compact(self):
+        with self._lock:
+            seq = self._seq
+        if not compact_journal(self.path, None, dump=self._snapshot):
+            return False
+        self._open()
+        with self._lock:
+            # changes made after the snapshot was taken stay in memory (and in the journal tail)
+            self.changed = {uid: hit for uid, hit in self.changed.items() if hit[0] > seq}
+        return True
+
+# ---------------- storage backends ----------------
+# handlers never touch orders directly: they go through STORE so the json and
+# sqlite backends can answer lookups their own way.
+DIGESTS_KEEP = 100  # recent admin digests whose "approve all / reject all" still work
+class JsonStore:
+    name = "json"
+
+    def __init__(self, cache_size=50000):
+        self.index = JsonUserIndex(USERS_FILE)
+        self.users = UserCache(self.index, cache_size)
+        # orders.json is parsed (and indexed) on first use, not at startup
+        self._repo = None
+        self._load_lock = Lock()
+        self._lock = Lock()  # status check + update of update_orders(expect=...)
+        self.admins = load_json(ADMINS_FILE, DEFAULT_ADMINS) if os.path.exists(ADMINS_FILE) else DEFAULT_ADMINS
+        self.buttons = load_json(BUTTONS_FILE, DEFAULT_BUTTONS)
+        self.digests = load_json(DIGESTS_FILE, {}) if os.path.exists(DIGESTS_FILE) else {}
+
+    @property
+    def repo(self):
+        if self._repo is None:
+            with self._load_lock:
+                if self._repo is None:
+                    t0 = time.perf_counter()
+                    self._repo = OrderRepo(compact_orders(load_json(ORDERS_FILE, DEFAULT_ORDERS)))
+                    logger.info("Loaded %d orders in %.2fs", len(self._repo.orders), time.perf_counter() - t0)
+        return self._repo
+
+    @property
+    def orders(self):
+        return self.repo.orders
+
+    def save_user(self, uid_str, user):
+        self.save_users([(uid_str, user)])
+
+    def save_users(self, items):
+        self.index.save(items)
+
+    def add_order(self, order):
+        # under _load_lock: a first load running now either already has the
+        # repo published (add to it) or will read this journal record
+        with self._load_lock:
+            if self._repo is not None:
+                with self._lock:
+                    self._repo.add(order)
+            journal_append(ORDERS_FILE, "append", value=order)
+
+    def get_order(self, order_id):
+        return self.repo.get(order_id)
+
+    def update_order(self, order, fields, expect=None):
+        return bool(self.update_orders([order], fields, expect))
+
+    def update_orders(self, orders, fields, expect=None):
+        # bulk approve/reject: one journal write for the whole batch
+        repo = self.repo  # loaded before taking _lock (add_order takes _load_lock, then _lock)
+        with self._lock:
+            done = [o for o in orders if expect is None or o.get("status") in expect]
+            for o in done:
+                repo.update(o, fields)
+        journal_append_many(ORDERS_FILE, [{"op": "update", "key": o.get("order_id"), "value": fields} for o in done])
+        return done
+
+    def count_orders(self, status, button_id=None):
+        orders = self.repo.by_status.get(status, {})
+        if button_id is None:
+            return len(orders)
+        return sum(1 for o in orders.values() if o.get("button_id") == button_id)
+
+    def orders_page(self, status=None, button_id=None, user_id=None, before=None, after=None, limit=10):
+        return self.repo.page(status, button_id, user_id, before, after, limit)
+
+    def iter_orders(self):
+        return iter(list(self.orders))
+
+    def archivable_orders(self, cutoff):
+        # scheduler thread: snapshot under _lock, handlers move orders between status buckets
+        repo = self.repo
+        with self._lock:
+            return [o for s in ("approved", "rejected") for o in repo.by_status.get(s, {}).values()
+                    if (o.get("handled_at") or "") < cutoff]
+
+    def remove_orders(self, order_ids):
+        repo = self.repo
+        with self._lock:
+            repo.remove(order_ids)
+        journal_append(ORDERS_FILE, "remove", keys=list(order_ids))
+
+    def save_admins(self):
+        save_json(ADMINS_FILE, self.admins)
+
+    def save_buttons(self):
+        save_json(BUTTONS_FILE, self.buttons)
+
+    def save_digest(self, digest_id, order_ids):
+        with self._lock:
+            self.digests[digest_id] = list(order_ids)
+            for old in list(self.digests)[:-DIGESTS_KEEP]:
+                del self.digests[old]
+            snap = dict(self.digests)
+        save_json(DIGESTS_FILE, snap)
+
+    def digest_orders(self, digest_id):
+        return self.digests.get(digest_id)
+
+    def compact(self):
+        self.index.compact()
+        repo = self._repo
+        if repo is not None:
+            compact_journal(ORDERS_FILE, repo.orders)
+        elif os.path.exists(ORDERS_FILE + JOURNAL_SUFFIX):
+            # orders never loaded in this process: fold the journal from disk
+            # (plain dicts, no indexes) so it can't grow without bound
+            compact_journal(ORDERS_FILE, load_json(ORDERS_FILE, DEFAULT_ORDERS))
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS admins (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, origin INTEGER, kind TEXT, key TEXT);
+CREATE TABLE IF NOT EXISTS digests (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, order_ids TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    button_id TEXT,
+    button_text TEXT,
+    status TEXT,
+    created_at TEXT,
+    handled_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
+CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_button ON orders(button_id, status);
+"""
+
+class SqliteStore:
+    name = "sqlite"
+
+    def __init__(self, path, shared=False, cache_size=50000):
+        self.path = path
+        # shared: other processes use the same file (main_workers.py). Every
+        # write of cached data (users, admins, buttons) is then also logged to
+        # the changes table in the same transaction, so they can reload it.
+        self.shared = shared
+        self._local = threading.local()
+        with self._db() as db:
+            db.executescript(SQLITE_SCHEMA)
+        if self._meta("migrated_from_json") is None:
+            self.migrate_from_json()
+        db = self._db()
+        # user profiles are read on every update: the most recent ones stay cached
+        self.users = UserCache(self, cache_size)
+        self.admins = {"admins": [json.loads(data) for (data,) in db.execute("SELECT data FROM admins ORDER BY rowid")]}
+        buttons = self._meta("buttons")
+        self.buttons = json.loads(buttons) if buttons else json.loads(json.dumps(DEFAULT_BUTTONS))
+
+    def _db(self):
+        # one connection per thread; WAL lets readers run while a writer commits
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: every commit (a placed or handled order) is fsync'd, the same
+            # guarantee the json backend gives with its fsync'd journal. NORMAL
+            # could lose the last commits on power loss.
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, key):
+        row = self._db().execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, db, key, value):
+        db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES(?, ?)", (key, value))
+
+    @staticmethod
+    def _order_row(order):
+        return (order.get("order_id"), order.get("user_id"), order.get("button_id"), order.get("button_text"),
+                order.get("status"), order.get("created_at"), order.get("handled_at"),
+                json.dumps(order, ensure_ascii=False, default=_json_default))
+
+    def migrate_from_json(self):
+        # one-shot import of the existing *.json files (journal included)
+        users = load_json(USERS_FILE, DEFAULT_USERS) if os.path.exists(USERS_FILE) else {}
+        orders = load_json(ORDERS_FILE, DEFAULT_ORDERS) if os.path.exists(ORDERS_FILE) else []
+        admins = load_json(ADMINS_FILE, DEFAULT_ADMINS) if os.path.exists(ADMINS_FILE) else DEFAULT_ADMINS
+        buttons = load_json(BUTTONS_FILE, DEFAULT_BUTTONS)
+        if not isinstance(users, dict):
+            users = {}
+        with self._db() as db:
+            db.executemany("INSERT OR REPLACE INTO users(id, data) VALUES(?, ?)",
+                           [(uid, json.dumps(u, ensure_ascii=False, default=_json_default)) for uid, u in users.items()])
+            db.executemany("INSERT OR REPLACE INTO orders VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                           [self._order_row(o) for o in orders if isinstance(o, dict)])
+            db.executemany("INSERT OR REPLACE INTO admins(id, data) VALUES(?, ?)",
+                           [(a.get("id"), json.dumps(a, ensure_ascii=False)) for a in admins.get("admins", [])])
+            self._set_meta(db, "buttons", json.dumps(buttons, ensure_ascii=False))
+            self._set_meta(db, "migrated_from_json", datetime.now().isoformat())
+        logger.info("Migrated %d users and %d orders from JSON into %s", len(users), len(orders), self.path)
+
+    def save_user(self, uid_str, user):
+        self.save_users([(uid_str, user)])
+
+    def load_user(self, uid):
+        row = self._db().execute("SELECT data FROM users WHERE id=?", (uid,)).fetchone()
+        return UserRecord(json.loads(row[0])) if row else None
+
+    def has_user(self, uid):
+        return self._db().execute("SELECT 1 FROM users WHERE id=?", (uid,)).fetchone() is not None
+
+    def user_ids(self):
+        return [uid for (uid,) in self._db().execute("SELECT id FROM users")]
+
+    def count_users(self):
+        return self._db().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def save_users(self, items):
+        with self._db() as db:
+            db.executemany("INSERT OR REPLACE INTO users(id, data) VALUES(?, ?)",
+                           [(uid, json.dumps(u, ensure_ascii=False, default=_json_default)) for uid, u in items if u is not None])
+            db.executemany("DELETE FROM users WHERE id=?", [(uid,) for uid, u in items if u is None])
+            self._log(db, "user", [uid for uid, _ in items])
+
+    # ---- change log (shared mode) ----
+    def _log(self, db, kind, keys=(None,)):
+        if self.shared:
+            pid = os.getpid()
+            db.executemany("INSERT INTO changes(origin, kind, key) VALUES(?, ?, ?)", [(pid, kind, k) for k in keys])
+
+    def log_change(self, kind):
+        # for state kept outside the database (config.json, rates.json)
+        with self._db() as db:
+            self._log(db, kind)
+
+    def last_change(self):
+        return self._db().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def changes_since(self, seq):
+        # [(seq, kind, key)] written by other processes
+        return self._db().execute("SELECT seq, kind, key FROM changes WHERE seq>? AND origin<>? ORDER BY seq",
+                                  (seq, os.getpid())).fetchall()
+
+    def prune_changes(self, keep=100000):
+        with self._db() as db:
+            db.execute("DELETE FROM changes WHERE seq < (SELECT MAX(seq) FROM changes) - ?", (keep,))
+
+    def reload_users(self, uids):
+        self.users.invalidate(uids)
+
+    def reload_admins(self):
+        # in place: ADMINS is the same dict
+        self.admins["admins"] = [json.loads(data) for (data,) in self._db().execute("SELECT data FROM admins ORDER BY rowid")]
+
+    def reload_buttons(self):
+        buttons = self._meta("buttons")
+        if buttons:
+            self.buttons.clear()
+            self.buttons.update(json.loads(buttons))
+
+    def add_order(self, order):
+        with self._db() as db:
+            db.execute("INSERT INTO orders VALUES(?, ?, ?, ?, ?, ?, ?, ?)", self._order_row(order))
+
+    def get_order(self, order_id):
+        row = self._db().execute("SELECT data FROM orders WHERE order_id=?", (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_order(self, order, fields, expect=None):
+        return bool(self.update_orders([order], fields, expect))
+
+    def update_orders(self, orders, fields, expect=None):
+        """Applies ``fields``; with ``expect`` only to orders whose stored status is
+        still one of those (checked in the same transaction). Returns the updated orders."""
+        done = []
+        with self._db() as db:
+            for o in orders:
+                new = dict(o, **fields)
+                row = (new.get("status"), new.get("handled_at"), json.dumps(new, ensure_ascii=False, default=_json_default), o.get("order_id"))
+                if expect is None:
+                    db.execute("UPDATE orders SET status=?, handled_at=?, data=? WHERE order_id=?", row)
+                elif not db.execute(f"UPDATE orders SET status=?, handled_at=?, data=? WHERE order_id=? AND status IN ({','.join('?' * len(expect))})",
+                                    row + tuple(expect)).rowcount:
+                    continue
+                done.append(o)
+        for o in done:
+            o.update(fields)
+        return done
+
+    def count_orders(self, status, button_id=None):
+        if button_id is None:
+            return self._db().execute("SELECT COUNT(*) FROM orders WHERE status=?", (status,)).fetchone()[0]
+        return self._db().execute("SELECT COUNT(*) FROM orders WHERE button_id=? AND status=?",
+                                  (button_id, status)).fetchone()[0]
+
+    def orders_page(self, status=None, button_id=None, user_id=None, before=None, after=None, limit=10):
+        # keyset pagination on rowid: each page is one index range scan
+        conds, args = [], []
+        for col, val in (("status", status), ("button_id", button_id), ("user_id", user_id)):
+            if val is not None:
+                conds.append(f"{col}=?")
+                args.append(val)
+        if after is not None:
+            conds.append("rowid>?")
+            args.append(after)
+            order = "ASC"
+        else:
+            if before is not None:
+                conds.append("rowid<?")
+                args.append(before)
+            order = "DESC"
+        where = ("WHERE " + " AND ".join(conds)) if conds else ""
+        rows = self._db().execute(f"SELECT rowid, data FROM orders {where} ORDER BY rowid {order} LIMIT ?",
+                                  args + [limit + 1]).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if after is not None:
+            rows.reverse()
+            has_newer, has_older = more, True
+        else:
+            has_older, has_newer = more, before is not None
+        return {"orders": [json.loads(data) for _, data in rows],
+                "older": rows[-1][0] if rows and has_older else None,
+                "newer": rows[0][0] if rows and has_newer else None}
+
+    def iter_orders(self):
+        for (data,) in self._db().execute("SELECT data FROM orders ORDER BY rowid"):
+            yield json.loads(data)
+
+    def archivable_orders(self, cutoff):
+        rows = self._db().execute("SELECT data FROM orders WHERE status IN ('approved', 'rejected') AND handled_at < ?", (cutoff,))
+        return [json.loads(data) for (data,) in rows]
+
+    def remove_orders(self, order_ids):
+        with self._db() as db:
+            db.executemany("DELETE FROM orders WHERE order_id=?", [(oid,) for oid in order_ids])
+
+    def save_admins(self):
+        with self._db() as db:
+            db.execute("DELETE FROM admins")
+            db.executemany("INSERT OR REPLACE INTO admins(id, data) VALUES(?, ?)",
+                           [(a.get("id"), json.dumps(a, ensure_ascii=False)) for a in self.admins.get("admins", [])])
+            self._log(db, "admins")
+
+    def save_buttons(self):
+        with self._db() as db:
+            self._set_meta(db, "buttons", json.dumps(self.buttons, ensure_ascii=False))
+            self._log(db, "buttons")
+
+    # ---- admin digests: any worker may get the "approve all" callback ----
+    def save_digest(self, digest_id, order_ids):
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO digests(id, order_ids) VALUES(?, ?)", (digest_id, json.dumps(list(order_ids))))
+            db.execute("DELETE FROM digests WHERE seq <= (SELECT MAX(seq) FROM digests) - ?", (DIGESTS_KEEP,))
+
+    def digest_orders(self, digest_id):
+        row = self._db().execute("SELECT order_ids FROM digests WHERE id=?", (digest_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def compact(self):
+        self._db().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+def open_store(config):
+    backend = config.get("STORAGE_BACKEND", "json")
+    cache_size = int(config.get("USER_CACHE_SIZE", 50000) or 50000)
+    if backend == "sqlite":
+        return SqliteStore(config.get("SQLITE_PATH", "bot.db"), shared=WORKER_ID is not None, cache_size=cache_size)
+    if backend != "json":
+        logger.warning("Unknown STORAGE_BACKEND %r, falling back to json", backend)
+    return JsonStore(cache_size)
+
+# load data
+CONFIG = load_json(CONFIG_FILE, DEFAULT_CONFIG)
+SERVICES = load_json(SERVICES_FILE, DEFAULT_SERVICES)
+METRICS.enabled = bool(CONFIG.get("METRICS_ENABLED", False))
+STORE = open_store(CONFIG)
+BUTTONS = STORE.buttons
+USERS = STORE.users
+ADMINS = STORE.admins
+logger.info("Storage backend: %s", STORE.name)
+
+def publish_change(kind):
+    # tell the other worker processes to reload state kept in files ("config", "rates")
+    if getattr(STORE, "shared", False):
+        STORE.log_change(kind)
+
+BOT_TOKEN = CONFIG.get("BOT_TOKEN")
+if not BOT_TOKEN or BOT_TOKEN == "PUT_YOUR_BOT_TOKEN_HERE":
+    logger.error("ضع BOT_TOKEN في config.json ثم أعد التشغيل.")
+    raise SystemExit("BOT_TOKEN missing in config.json")
+
+# runtime vars
+ADMIN_IDS = set(CONFIG.get("ADMIN_IDS", []))
+BUTTON_LAYOUT = CONFIG.get("BUTTON_LAYOUT", {"type":"vertical","grid_columns":2})
+
+# initialize bot and scheduler
+# optional local Bot API server (e.g. fake_api.py for testing)
+API_URL = (CONFIG.get("API_URL") or "https://api.telegram.org").rstrip("/")
+if CONFIG.get("API_URL"):
+    telebot.apihelper.API_URL = API_URL + "/bot{0}/{1}"
+
+# ---------------- Telegram API client ----------------
+# every TeleBot request goes through ApiClient.request: one shared keep-alive
+# pool, a timeout per method, retries with exponential backoff (429 waits
+# retry_after), and a circuit breaker that fails calls fast while the API is
+# down instead of tying up every worker on timeouts. main_async.py applies the
+# same policy to its aiohttp calls.
+API_METHOD_TIMEOUTS = {"answerCallbackQuery": 5, "sendMessage": 10, "editMessageText": 10, "sendPhoto": 20}
+# a read timeout may mean the call went through: only these are safe to repeat
+IDEMPOTENT_METHODS = {"getMe", "answerCallbackQuery", "editMessageText"}
+
+class ApiUnavailable(Exception):
+    """Raised without a request while the circuit breaker is open."""
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = Lock()
+        self.failures = 0       # consecutive
+        self.opened_at = None   # monotonic time the circuit opened; None = closed
+        self.opened = 0         # times it opened
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.remaining() == 0 else "open"
+
+    def remaining(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self):
+        # open: refuse; after the cooldown let exactly one probe through
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or self.remaining() > 0:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Telegram API reachable again, closing circuit")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+                if not self._probing:
+                    self.opened += 1
+                    logger.warning("Telegram API failing (%s errors in a row), opening circuit for %ss",
+                                   self.failures, self.cooldown)
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+class ApiClient:
+    def __init__(self, make_request, timeout=15, timeouts=None, retries=2, backoff=0.5, max_retry_after=10, breaker=None):
+        self._make_request = make_request
+        self.timeouts = dict(API_METHOD_TIMEOUTS, **(timeouts or {}))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = Lock()
+        self.outcomes = {}  # (method, outcome) -> attempts
+
+    def timeout_for(self, method_name):
+        return self.timeouts.get(method_name, self.timeout)
+
+    def record(self, method_name, outcome, seconds=None):
+        key = (method_name, outcome)
+        with self._lock:
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+        if METRICS.enabled:
+            if seconds is not None and method_name != "getUpdates":
+                METRICS.observe("api_seconds", seconds, method=method_name)
+            METRICS.inc("api_calls_total", method=method_name, outcome=outcome)
+
+    def classify(self, method_name, exc, attempt):
+        """Outcome label of a failed attempt and seconds to wait before retrying (None = give up)."""
+        if isinstance(exc, telebot.apihelper.ApiTelegramException):
+            code = exc.error_code or 0
+            if code == 429:
+                self.breaker.success()
+                retry_after = (exc.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                SEND_LIMITER.pause(retry_after)
+                return "429", retry_after if retry_after <= self.max_retry_after else None
+            if code >= 500:
+                self.breaker.failure()
+                return str(code), self._delay(attempt)
+            # 4xx: the API answered, the request itself is wrong
+            self.breaker.success()
+            return str(code), None
+        if isinstance(exc, (requests.exceptions.ReadTimeout, TimeoutError)):
+            self.breaker.failure()
+            return "timeout", self._delay(attempt) if method_name in IDEMPOTENT_METHODS else None
+        if isinstance(exc, (requests.exceptions.ConnectionError, ConnectionError)):
+            self.breaker.failure()
+            return "network", self._delay(attempt)
+        return "error", None
+
+    def _delay(self, attempt):
+        # exponential backoff with jitter so workers don't retry in lockstep
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def request(self, token, method_name, method="get", params=None, files=None):
+        # getUpdates has its own retry loop in TeleBot's polling and must keep
+        # polling to notice recovery: never retried or refused here
+        polling = method_name == "getUpdates"
+        attempts = 1 if polling or files else self.retries + 1
+        for attempt in range(attempts):
+            if not polling and not self.breaker.allow():
+                self.record(method_name, "circuit_open")
+                raise ApiUnavailable(f"Telegram API unavailable, retrying in {self.breaker.remaining():.0f}s")
+            call_params = dict(params) if params else {}
+            if not polling:
+                call_params.setdefault("timeout", self.timeout_for(method_name))
+            t0 = time.perf_counter()
+            try:
+                result = self._make_request(token, method_name, method, call_params or None, files)
+            except Exception as e:
+                outcome, wait = self.classify(method_name, e, attempt)
+                self.record(method_name, outcome, time.perf_counter() - t0)
+                if wait is None or attempt == attempts - 1:
+                    raise
+                logger.debug("%s failed (%s), retry %s in %.2fs", method_name, outcome, attempt + 1, wait)
+                time.sleep(wait)
+                continue
+            self.breaker.success()
+            self.record(method_name, "ok", time.perf_counter() - t0)
+            return result
+
+    def stats(self):
+        with self._lock:
+            calls = {f"{m}:{o}": n for (m, o), n in sorted(self.outcomes.items())}
+        return {"calls": calls, "circuit": self.breaker.state, "circuit_opened": self.breaker.opened}
+
+def _pooled_session(size):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# one session shared by all threads (TeleBot otherwise keeps one per thread)
+telebot.apihelper.session = _pooled_session(int(CONFIG.get("HTTP_POOL_SIZE", 100) or 100))
+telebot.apihelper.SESSION_TIME_TO_LIVE = None
+API = ApiClient(telebot.apihelper._make_request,
+                timeout=float(CONFIG.get("API_TIMEOUT", 15) or 15),
+                timeouts=CONFIG.get("API_TIMEOUTS") or {},
+                retries=int(CONFIG.get("API_RETRIES", 2) or 0),
+                backoff=float(CONFIG.get("API_BACKOFF", 0.5) or 0.5),
+                max_retry_after=float(CONFIG.get("API_MAX_RETRY_AFTER", 10) or 0),
+                breaker=CircuitBreaker(int(CONFIG.get("API_BREAKER_THRESHOLD", 5) or 5),
+                                       float(CONFIG.get("API_BREAKER_COOLDOWN", 30) or 30)))
+telebot.apihelper._make_request = API.request
+
+# threaded=False: updates are run by ChatDispatcher below, not by TeleBot's pool
+bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML", threaded=False)
+scheduler = BackgroundScheduler()
+scheduler.start()
+
+# ---------------- update dispatcher ----------------
+# bounded worker pool; updates of the same chat run one at a time and in order
+# so a chat's AWAITING / admin_sessions entries never race.
+def update_chat_id(update):
+    for obj in (update.message, update.edited_message, update.callback_query):
+        if obj is None:
+            continue
+        msg = getattr(obj, "message", obj)
+        chat = getattr(msg, "chat", None)
+        if chat is not None:
+            return chat.id
+        return obj.from_user.id
+    return None
+
+class ChatDispatcher:
+    def __init__(self, handle, workers=8, max_pending=1000):
+        self._handle = handle
+        self._lock = Lock()
+        self._chats = {}                 # chat id -> deque of waiting updates (present while chat is busy)
+        self._ready = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending)  # backpressure on the polling thread
+        self._threads = []
+        self.pending = 0
+        self.workers = workers
+        self.latency = {}                # handler name -> [count, total_seconds, max_seconds]
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"dispatch-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=None):
+        for _ in self._threads:
+            self._ready.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, update, block=True):
+        if not self._slots.acquire(blocking=block):
+            return False
+        key = update_chat_id(update)
+        with self._lock:
+            self.pending += 1
+            if key is not None:
+                waiting = self._chats.get(key)
+                if waiting is not None:
+                    waiting.append(update)
+                    return True
+                self._chats[key] = deque()
+        self._ready.put((key, update))
+        return True
+
+    def _work(self):
+        while True:
+            item = self._ready.get()
+            if item is None:
+                return
+            key, update = item
+            try:
+                self._handle(update)
+            except Exception as e:
+                logger.exception("update %s failed: %s", update.update_id, e)
+            finally:
+                nxt = None
+                with self._lock:
+                    self.pending -= 1
+                    if key is not None:
+                        waiting = self._chats[key]
+                        if waiting:
+                            nxt = waiting.popleft()
+                        else:
+                            del self._chats[key]
+                self._slots.release()
+                if nxt is not None:
+                    self._ready.put((key, nxt))
+
+    def timed(self, name, func):
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                st = self.latency.get(name)
+                if st is None:
+                    st = self.latency.setdefault(name, [0, 0.0, 0.0])
+                st[0] += 1
+                st[1] += dt
+                if dt > st[2]:
+                    st[2] = dt
+        wrapper.__name__ = getattr(func, "__name__", name)
+        return wrapper
+
+    def stats(self):
+        return {
+            "queue_depth": self.pending,
+            "busy_chats": len(self._chats),
+            "handlers": {n: {"count": c, "avg_ms": round(tot / c * 1000, 2) if c else 0.0, "max_ms": round(mx * 1000, 2)}
+                         for n, (c, tot, mx) in list(self.latency.items())},
+        }
+
+# ---------------- hot-path instrumentation ----------------
+CALLBACK_KINDS = ("BTN|", "NAV|", "ADMIN|", "ORDER|", "OQ|", "ADMIN_EDIT|", "CONTACT|")
+COMMAND_KINDS = ("/start", "/help", "/admin", "/panel")
+
+def update_kind(update):
+    # bounded label set: callback prefix, known command, or plain message
+    if update.callback_query is not None:
+        prefix = (update.callback_query.data or "").split("|", 1)[0] + "|"
+        return prefix if prefix in CALLBACK_KINDS else "callback"
+    msg = update.message or update.edited_message
+    if msg is not None and msg.text and msg.text.startswith("/"):
+        cmd = msg.text.split()[0].split("@")[0]
+        return cmd if cmd in COMMAND_KINDS else "message"
+    return "message"
+
+# ---------------- anti-flood ----------------
+# token bucket per (chat, class) in a bounded LRU: an idle chat refills, a
+# hammering one gets one cheap notice per burst and then its updates are
+# dropped before any handler, regex or store work runs. Admins are exempt.
+FLOOD_NOTICE = "⏳ طلبات كثيرة، انتظر قليلاً ثم حاول مجدداً."
+
+def flood_class(update):
+    if update.callback_query is not None:
+        return "callback"
+    msg = update.message or update.edited_message
+    if msg is not None and msg.text and msg.text.startswith("/"):
+        return "command"
+    return "message"
+
+class FloodGuard:
+    def __init__(self, limits, global_rate=0, max_chats=10000):
+        self.limits = {k: (float(r), float(b)) for k, (r, b) in limits.items()}
+        self.max_chats = max_chats
+        self._lock = Lock()
+        self._buckets = OrderedDict()  # (chat id, class) -> [tokens, last refill, notified]
+        self._global = [float(global_rate), float(global_rate), time.monotonic()] if global_rate else None
+        self.allowed = 0
+        self.throttled = {}  # class -> updates throttled (notified or dropped)
+        self.notified = 0
+
+    def check(self, chat_id, cls):
+        """Returns "ok", "notify" (first hit of a burst) or "drop"."""
+        limit = self.limits.get(cls)
+        if limit is None or chat_id is None:
+            return "ok"
+        rate, burst = limit
+        now = time.monotonic()
+        key = (chat_id, cls)
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [burst, now, False]
+                if len(self._buckets) > self.max_chats:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(burst, b[0] + (now - b[1]) * rate)
+                b[1] = now
+            g = self._global
+            if g is not None:
+                g[1] = min(g[0], g[1] + (now - g[2]) * g[0])
+                g[2] = now
+            if b[0] >= 1 and (g is None or g[1] >= 1):
+                b[0] -= 1
+                b[2] = False
+                if g is not None:
+                    g[1] -= 1
+                self.allowed += 1
+                return "ok"
+            if b[2]:
+                return "drop"
+            b[2] = True
+            return "notify"
+
+    def count(self, cls, verdict):
+        # throttled updates that were actually stopped (i.e. not from an admin)
+        with self._lock:
+            self.throttled[cls] = self.throttled.get(cls, 0) + 1
+            if verdict == "notify":
+                self.notified += 1
+
+    def stats(self):
+        with self._lock:
+            return {"allowed": self.allowed, "throttled": dict(self.throttled), "notified": self.notified,
+                    "tracked": len(self._buckets)}
+
+FLOOD = FloodGuard(CONFIG.get("FLOOD_LIMITS") or DEFAULT_CONFIG["FLOOD_LIMITS"],
+                   global_rate=float(CONFIG.get("FLOOD_GLOBAL_RATE", 0) or 0),
+                   max_chats=int(CONFIG.get("FLOOD_MAX_CHATS", 10000) or 10000))
+
+def flood_blocked(update, uid):
+    if not CONFIG.get("FLOOD_ENABLED", True):
+        return False
+    cls = flood_class(update)
+    verdict = FLOOD.check(uid, cls)
+    if verdict == "ok" or is_admin_user(uid):
+        return False
+    FLOOD.count(cls, verdict)
+    if METRICS.enabled:
+        METRICS.inc("updates_throttled_total", kind=cls, action=verdict)
+    if verdict == "notify":
+        try:
+            if update.callback_query is not None:
+                bot.answer_callback_query(update.callback_query.id, FLOOD_NOTICE)
+            else:
+                bot.send_message(uid, FLOOD_NOTICE)
+        except Exception as e:
+            logger.debug("flood notice to %s failed: %s", uid, e)
+    return True
+
+def handle_update(update):
+    uid = update_chat_id(update)
+    if uid is not None:
+        STATS.touch(uid)
+        if flood_blocked(update, uid):
+            return
+    if not METRICS.enabled:
+        telebot.TeleBot.process_new_updates(bot, [update])
+        return
+    t0 = time.perf_counter()
+    try:
+        telebot.TeleBot.process_new_updates(bot, [update])
+    finally:
+        METRICS.observe("handler_seconds", time.perf_counter() - t0, kind=update_kind(update))
+
+DISPATCHER = ChatDispatcher(handle_update,
+                            workers=int(CONFIG.get("WORKERS", 8) or 8),
+                            max_pending=int(CONFIG.get("MAX_PENDING_UPDATES", 1000) or 1000))
+
+def dispatch_updates(updates):
+    # called by the polling loop: advance the offset here, run handlers on the pool
+    for u in updates:
+        if u.update_id > bot.last_update_id:
+            bot.last_update_id = u.update_id
+        DISPATCHER.submit(u)
+
+def install_dispatcher():
+    for h in bot.message_handlers + bot.callback_query_handlers:
+        f = h["function"]
+        h["function"] = DISPATCHER.timed(f.__name__, f)
+    bot.process_new_updates = dispatch_updates
+    DISPATCHER.start()
+
+def log_dispatcher_stats():
+    logger.info("dispatcher: %s", json.dumps(dict(DISPATCHER.stats(), flood=FLOOD.stats(), api=API.stats(), users=USERS.stats(),
+                                                   sessions=admin_sessions.stats(), awaiting=AWAITING.stats())))
+
+scheduler.add_job(log_dispatcher_stats, "interval", minutes=5, id="dispatcher_stats")
+
+METRICS.gauge("dispatcher_queue_depth", lambda: DISPATCHER.pending)
+METRICS.gauge("orders_pending", lambda: STORE.count_orders("pending"))
+METRICS.gauge("orders_needs_more", lambda: STORE.count_orders("needs_more"))
+METRICS.gauge("users_total", lambda: len(USERS))
+METRICS.gauge("users_cached", lambda: USERS.stats()["cached"])
+METRICS.gauge("resident_memory_mb", lambda: round(rss_mb(), 1))
+METRICS.gauge("api_circuit_open", lambda: int(API.breaker.state != "closed"))
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port=None):
+    server = ThreadingHTTPServer((CONFIG.get("METRICS_HOST", "127.0.0.1"), port or int(CONFIG.get("METRICS_PORT", 9108))), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Metrics on http://%s:%s/metrics", *server.server_address[:2])
+    return server
+
+def log_metrics_summary():
+    logger.info("metrics: %s", METRICS.summary() or "no samples")
+
+if METRICS.enabled:
+    scheduler.add_job(log_metrics_summary, "interval", minutes=int(CONFIG.get("METRICS_LOG_MINUTES", 5) or 5), id="metrics_summary")
+
+def compact_store():
+    try:
+        STORE.compact()
+    except Exception as e:
+        logger.exception("Storage compaction failed: %s", e)
+
+scheduler.add_job(compact_store, "interval", minutes=int(CONFIG.get("JOURNAL_COMPACT_MINUTES", 10) or 10), id="compact_store")
+
+# ---------------- order archive ----------------
+# handled orders older than ARCHIVE_AFTER_DAYS move out of the hot store into
+# ARCHIVE_DIR/orders-YYYY-MM.jsonl.gz (partitioned by handled month, one gzip
+# member per archive run). Each partition has a small .idx.json side file with
+# its order ids and user ids so lookups only decompress matching partitions.
+# The archive is written and fsync'd before the orders leave the store; a
+# crash in between archives them twice, and lookups return the first copy.
+class OrderArchive:
+    INDEX_CACHE = 8  # partitions whose index stays in memory
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._indexes = {}  # partition -> (mtime, order_ids, user_ids)
+
+    def _file(self, part, ext):
+        return os.path.join(self.path, f"orders-{part}.{ext}")
+
+    def partitions(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted((n[7:-9] for n in os.listdir(self.path) if n.startswith("orders-") and n.endswith(".jsonl.gz")), reverse=True)
+
+    def write(self, orders):
+        groups = {}
+        for o in orders:
+            groups.setdefault((o.get("handled_at") or o.get("created_at") or "unknown")[:7], []).append(o)
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            for part, items in groups.items():
+                with open(self._file(part, "jsonl.gz"), "ab") as fh:
+                    fh.write(gzip.compress("".join(json.dumps(o, ensure_ascii=False, separators=(",", ":"), default=_json_default) + "\n"
+                                                   for o in items).encode("utf-8")))
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                _, order_ids, user_ids = self._index(part)
+                order_ids = order_ids | {o.get("order_id") for o in items}
+                user_ids = user_ids | {o.get("user_id") for o in items}
+                _atomic_write_text(self._file(part, "idx.json"), _dump({"order_ids": sorted(order_ids), "user_ids": sorted(user_ids)}))
+                self._indexes.pop(part, None)
+
+    def _index(self, part):
+        path = self._file(part, "idx.json")
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None, frozenset(), frozenset()
+        cached = self._indexes.get(part)
+        if cached and cached[0] == mtime:
+            return cached
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        entry = (mtime, frozenset(raw.get("order_ids", ())), frozenset(raw.get("user_ids", ())))
+        if len(self._indexes) >= self.INDEX_CACHE:
+            self._indexes.pop(next(iter(self._indexes)))
+        self._indexes[part] = entry
+        return entry
+
+    def _scan(self, part):
+        with gzip.open(self._file(part, "jsonl.gz"), "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def find(self, order_id):
+        for part in self.partitions():
+            if order_id in self._index(part)[1]:
+                for o in self._scan(part):
+                    if o.get("order_id") == order_id:
+                        return o
+        return None
+
+    def for_user(self, user_id, limit=20):
+        """Newest-first archived orders of one user."""
+        found, seen = [], set()
+        for part in self.partitions():
+            if user_id not in self._index(part)[2]:
+                continue
+            rows = [o for o in self._scan(part) if o.get("user_id") == user_id]
+            for o in sorted(rows, key=lambda o: o.get("handled_at") or "", reverse=True):
+                if o.get("order_id") not in seen:
+                    seen.add(o.get("order_id"))
+                    found.append(o)
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    def iter_orders(self):
+        seen = set()
+        for part in sorted(self.partitions()):
+            for o in self._scan(part):
+                if o.get("order_id") not in seen:
+                    seen.add(o.get("order_id"))
+                    yield o
+
+ARCHIVE = OrderArchive(CONFIG.get("ARCHIVE_DIR", "archive") or "archive")
+
+def archive_orders():
+    days = int(CONFIG.get("ARCHIVE_AFTER_DAYS", 30) or 0)
+    if days <= 0:
+        return 0
+    try:
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+        orders = STORE.archivable_orders(cutoff)
+        if orders:
+            ARCHIVE.write(orders)
+            STORE.remove_orders([o.get("order_id") for o in orders])
+            logger.info("Archived %d handled orders older than %d days", len(orders), days)
+        return len(orders)
+    except Exception as e:
+        logger.exception("Order archiving failed: %s", e)
+        return 0
+
+scheduler.add_job(archive_orders, "interval", hours=6, id="archive_orders")
+
+# ---------------- write-behind for user profiles ----------------
+# navigation, currency toggles and /start only mark the user dirty; a
+# background thread writes all dirty users as one batch every
+# USER_FLUSH_SECONDS (or sooner once USER_FLUSH_BATCH are waiting). A crash
+# loses at most that window of profile changes; orders are never deferred.
+class UserWriteBehind:
+    def __init__(self, store, interval=1.0, max_dirty=500):
+        self.store = store
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self._dirty = set()
+        self._lock = Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="user-flush", daemon=True)
+        self._thread.start()
+
+    def mark(self, uid_str):
+        with self._lock:
+            self._dirty.add(uid_str)
+            self.store.users.pin(uid_str)  # the cache must not drop it before it is written
+            full = len(self._dirty) >= self.max_dirty
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return set(self._dirty)
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+        try:
+            self.store.save_users([(uid, USERS.get(uid)) for uid in dirty])
+        except Exception:
+            with self._lock:
+                self._dirty |= dirty  # retry on the next round
+            raise
+        self._written(dirty)
+        return len(dirty)
+
+    def _written(self, uids):
+        # marked again while being written: stays pinned for the next round
+        with self._lock:
+            self.store.users.unpin(uids - self._dirty)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("user flush failed: %s", e)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+WRITE_BEHIND = UserWriteBehind(STORE, float(CONFIG.get("USER_FLUSH_SECONDS", 1.0) or 1.0),
+                               int(CONFIG.get("USER_FLUSH_BATCH", 500) or 500))
+atexit.register(WRITE_BEHIND.stop)
+
+# ---------------- running statistics ----------------
+# counts are updated when an order is created or changes status, so the
+# stats panel never scans ORDERS. Hourly buckets (kept STATS_RETENTION_DAYS)
+# back the 24h/7d/30d windows; all-time totals are kept separately.
+# Snapshotted to STATS_FILE every few minutes and at shutdown; rebuilt from
+# the orders once if the file is missing.
+APPROVAL_BUCKETS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 2 * 86400, 7 * 86400)
+STATS_RETENTION_DAYS = 31
+HANDLED_STATUSES = ("approved", "rejected")  # what the windows count as handled
+
+def _seconds_between(start, end):
+    try:
+        return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+class StatsAggregator:
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self.data = None
+
+    def load(self, store, archive=None, rebuild=True):
+        data = load_json(self.path, None) if os.path.exists(self.path) else None
+        if not data and not rebuild:
+            data = self._empty()
+        elif not data:
+            data = self._empty()
+            self.data = data
+            for o in itertools.chain(archive.iter_orders() if archive else (), store.iter_orders()):
+                self.order_created(o, status="pending")
+                if o.get("status") != "pending":
+                    self.order_updated(o, "pending")
+            logger.info("Stats rebuilt from %d orders", data["total"])
+        self.data = data
+
+    @staticmethod
+    def _empty():
+        return {"total": 0, "buttons": {}, "status": {}, "approval": [0] * (len(APPROVAL_BUCKETS) + 1),
+                "hours": {}, "active": {}}
+
+    def _hour(self, key):
+        hours = self.data["hours"]
+        b = hours.get(key)
+        if b is None:
+            b = hours[key] = {"created": {}, "status": {}, "approval": [0] * (len(APPROVAL_BUCKETS) + 1)}
+            self._prune()
+        return b
+
+    def _prune(self):
+        cutoff = (datetime.now() - timedelta(days=STATS_RETENTION_DAYS)).isoformat()
+        for key in [k for k in self.data["hours"] if k < cutoff[:13]]:
+            del self.data["hours"][key]
+        for key in [k for k in self.data["active"] if k < cutoff[:10]]:
+            del self.data["active"][key]
+
+    def touch(self, uid):
+        day = datetime.now().isoformat()[:10]
+        with self._lock:
+            active = self.data["active"].get(day)
+            if active is None:
+                active = self.data["active"][day] = set()
+                self._prune()
+            elif isinstance(active, list):  # loaded from disk
+                active = self.data["active"][day] = set(active)
+            active.add(uid)
+
+    def order_created(self, order, status=None):
+        text = order.get("button_text") or "unknown"
+        status = status or order.get("status") or "pending"
+        with self._lock:
+            d = self.data
+            d["total"] += 1
+            d["buttons"][text] = d["buttons"].get(text, 0) + 1
+            d["status"][status] = d["status"].get(status, 0) + 1
+            b = self._hour((order.get("created_at") or datetime.now().isoformat())[:13])
+            b["created"][text] = b["created"].get(text, 0) + 1
+
+    def order_updated(self, order, old_status):
+        new = order.get("status")
+        if new == old_status:
+            return
+        with self._lock:
+            st = self.data["status"]
+            # may go below 0 in one worker's file (order created by another); clamped when read
+            st[old_status] = st.get(old_status, 0) - 1
+            st[new] = st.get(new, 0) + 1
+            # only approve/reject is handling, counted in the hour it happened
+            # (askmore moves no order out of the queue; a rebuild replays old orders)
+            handled_at = order.get("handled_at")
+            if new not in HANDLED_STATUSES or not handled_at:
+                return
+            b = self._hour(handled_at[:13])
+            b["status"][new] = b["status"].get(new, 0) + 1
+            if new == "approved":
+                secs = _seconds_between(order.get("created_at"), order.get("handled_at"))
+                if secs is not None:
+                    i = bisect.bisect_left(APPROVAL_BUCKETS, secs)
+                    self.data["approval"][i] += 1
+                    b["approval"][i] += 1
+
+    def totals(self):
+        with self._lock:
+            d = self.data
+            return {"total": d["total"], "buttons": dict(d["buttons"]), "status": {k: max(n, 0) for k, n in d["status"].items()},
+                    "approval": self._histogram(d["approval"]),
+                    "dau": len(d["active"].get(datetime.now().isoformat()[:10], ()))}
+
+    def window(self, hours):
+        # merges at most hours buckets: bounded by the window, not by ORDERS
+        now = datetime.now()
+        created, status = {}, {}
+        approval = [0] * (len(APPROVAL_BUCKETS) + 1)
+        with self._lock:
+            for h in range(hours):
+                b = self.data["hours"].get((now - timedelta(hours=h)).isoformat()[:13])
+                if not b:
+                    continue
+                for k, n in b["created"].items():
+                    created[k] = created.get(k, 0) + n
+                for k, n in b["status"].items():
+                    status[k] = status.get(k, 0) + n
+                approval = [x + y for x, y in zip(approval, b["approval"])]
+            days = max(hours // 24, 1)
+            dau = [len(self.data["active"].get((now - timedelta(days=i)).isoformat()[:10], ())) for i in range(days)]
+        return {"created": created, "status": status, "approval": self._histogram(approval),
+                "dau_avg": sum(dau) / len(dau), "dau_max": max(dau)}
+
+    @staticmethod
+    def _histogram(counts):
+        h = Histogram(APPROVAL_BUCKETS)
+        h.counts = list(counts)
+        h.count = sum(counts)
+        return h
+
+    def save(self):
+        if self.data is None:
+            return
+        with self._lock:
+            d = self.data
+            snap = {"total": d["total"], "buttons": dict(d["buttons"]), "status": dict(d["status"]),
+                    "approval": list(d["approval"]),
+                    "hours": {k: {"created": dict(b["created"]), "status": dict(b["status"]), "approval": list(b["approval"])}
+                              for k, b in d["hours"].items()},
+                    "active": {day: sorted(uids) for day, uids in d["active"].items()}}
+        save_json(self.path, snap)
+
+    @classmethod
+    def merged(cls, paths):
+        # read-only sum of several workers' snapshots (main_workers.py)
+        agg = cls(None)
+        d = agg.data = cls._empty()
+        for path in paths:
+            part = load_json(path, None)
+            if not part:
+                continue
+            d["total"] += part.get("total", 0)
+            for key in ("buttons", "status"):
+                for k, n in part.get(key, {}).items():
+                    d[key][k] = d[key].get(k, 0) + n
+            d["approval"] = [x + y for x, y in zip(d["approval"], part.get("approval", []))]
+            for hour, b in part.get("hours", {}).items():
+                mine = agg._hour(hour)
+                for key in ("created", "status"):
+                    for k, n in b.get(key, {}).items():
+                        mine[key][k] = mine[key].get(k, 0) + n
+                mine["approval"] = [x + y for x, y in zip(mine["approval"], b.get("approval", []))]
+            for day, uids in part.get("active", {}).items():
+                d["active"].setdefault(day, set()).update(uids)
+        return agg
+
+# each worker of main_workers.py counts its own updates into stats.w<N>.json;
+# worker 0 starts from the single-process stats.json (or rebuilds), the others empty
+STATS = StatsAggregator(worker_path(STATS_FILE))
+if WORKER_ID == "0" and not os.path.exists(STATS.path) and os.path.exists(STATS_FILE):
+    STATS.path = STATS_FILE
+    STATS.load(STORE, ARCHIVE)
+    STATS.path = worker_path(STATS_FILE)
+else:
+    STATS.load(STORE, ARCHIVE, rebuild=WORKER_ID in (None, "0"))
+atexit.register(STATS.save)
+
+def stats_view():
+    if WORKER_ID is None:
+        return STATS
+    STATS.save()
+    base, ext = os.path.splitext(STATS_FILE)
+    parts = [os.path.join(os.path.dirname(base) or ".", f) for f in os.listdir(os.path.dirname(base) or ".")
+             if re.fullmatch(re.escape(os.path.basename(base)) + r"\.w\d+" + re.escape(ext), f)]
+    return StatsAggregator.merged(sorted(parts))
+
+def save_stats():
+    try:
+        STATS.save()
+    except Exception as e:
+        logger.exception("Saving stats failed: %s", e)
+
+# workers save more often: the stats panel merges the other workers' files
+scheduler.add_job(save_stats, "interval", seconds=300 if WORKER_ID is None else 30, id="save_stats")
+
+def save_user(uid_str):
+    WRITE_BEHIND.mark(uid_str)
+
+def save_buttons():
+    STORE.save_buttons()
+    rebuild_button_index()
+    # replaced or deleted button images leave no entries behind
+    MEDIA.prune({b.get("image") for b in BUTTON_INDEX.values()})
+
+def save_config():
+    save_json(CONFIG_FILE, CONFIG)
+    publish_change("config")
+    invalidate_menus()
+
+def reload_config():
+    # in place: modules and closures hold on to CONFIG
+    fresh = load_json(CONFIG_FILE, DEFAULT_CONFIG)
+    CONFIG.clear()
+    CONFIG.update(fresh)
+    invalidate_menus()
+
+# ---------------- sessions ----------------
+# short-lived conversation state (admin multi-step flows, users asked for order
+# info) lives outside the user profiles: each store keeps its own snapshot +
+# journal file, entries expire after a TTL and the least recently used are
+# dropped past max_entries. Expiry runs on a timing wheel: one slot per
+# ``tick`` seconds, a scheduler job visits the slots that came due, so a tick
+# costs O(entries expiring now) rather than a scan of every session.
+class SessionStore(MutableMapping):
+    COMPACT_AFTER = 1000  # journal records before the tick job folds them into the snapshot
+
+    def __init__(self, path, ttl, max_entries=10000, tick=5, slots=720, key_type=str):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.tick = tick
+        self.key_type = key_type
+        self._data = OrderedDict()  # key -> [value, expires]; LRU order
+        self._wheel = [set() for _ in range(slots)]
+        self._cursor = int(time.time() // tick)
+        self._lock = threading.RLock()
+        self._journaled = 0
+        self.expired = 0
+        self.evicted = 0
+        now = time.time()
+        saved = load_json(path, {})
+        for key, entry in sorted(saved.items(), key=lambda kv: kv[1].get("exp", 0)):
+            if entry.get("exp", 0) > now:
+                k = key_type(key)
+                self._data[k] = [entry.get("v"), entry["exp"]]
+                self._schedule(k, entry["exp"])
+
+    def _schedule(self, key, expires):
+        self._wheel[int(expires // self.tick) % len(self._wheel)].add(key)
+
+    def _persist(self, records):
+        # fsync'd before returning: clearing AWAITING right after an order is
+        # durable, so a restart never re-opens a request that became an order
+        journal_append_many(self.path, records)
+        self._journaled += len(records)
+
+    def _record(self, key):
+        value, expires = self._data[key]
+        return {"op": "set", "key": str(key), "value": {"v": value, "exp": expires}}
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._data[key]
+            if entry[1] <= time.time():
+                # due but the wheel hasn't reached its slot yet
+                self._drop([key])
+                raise KeyError(key)
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            expires = time.time() + self.ttl
+            self._data[key] = [value, expires]
+            self._data.move_to_end(key)
+            self._schedule(key, expires)
+            records = [self._record(key)]
+            while len(self._data) > self.max_entries:
+                old, _ = self._data.popitem(last=False)
+                records.append({"op": "del", "key": str(old)})
+                self.evicted += 1
+            self._persist(records)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+            self._persist([{"op": "del", "key": str(key)}])
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def touch(self, key):
+        """Write back a value changed in place and restart its TTL."""
+        with self._lock:
+            if key in self._data:
+                self[key] = self._data[key][0]
+
+    def _drop(self, keys):
+        for key in keys:
+            self._data.pop(key, None)
+        self.expired += len(keys)
+        self._persist([{"op": "del", "key": str(key)} for key in keys])
+
+    def advance(self, now=None):
+        """Expire the entries whose slots came due since the last call."""
+        now = time.time() if now is None else now
+        target = int(now // self.tick)
+        due = []
+        with self._lock:
+            # after a long pause every slot is visited once
+            for t in range(max(self._cursor + 1, target - len(self._wheel) + 1), target + 1):
+                slot = self._wheel[t % len(self._wheel)]
+                for key in list(slot):
+                    entry = self._data.get(key)
+                    if entry is None or int(entry[1] // self.tick) % len(self._wheel) != t % len(self._wheel):
+                        slot.discard(key)  # gone, or touched into another slot
+                    elif entry[1] <= now:
+                        slot.discard(key)
+                        due.append(key)
+                    # else: due in a later turn of the wheel
+            self._cursor = target
+            if due:
+                self._drop(due)
+            if self._journaled >= self.COMPACT_AFTER:
+                self.compact()
+        return len(due)
+
+    def compact(self):
+        # under the store lock: nothing can be journaled between the snapshot and the fold
+        with self._lock:
+            compact_journal(self.path, {str(k): {"v": v, "exp": exp} for k, (v, exp) in self._data.items()})
+            self._journaled = 0
+
+    def stats(self):
+        return {"active": len(self._data), "expired": self.expired, "evicted": self.evicted}
+
+def _session_store(path, ttl, key_type=str):
+    return SessionStore(worker_path(path), ttl, int(CONFIG.get("SESSION_MAX_ENTRIES", 10000) or 10000),
+                        float(CONFIG.get("SESSION_WHEEL_SECONDS", 5) or 5), key_type=key_type)
+
+# admin sessions for multi-step flows: admin_id -> {action:, temp:...}
+admin_sessions = _session_store(SESSIONS_FILE, float(CONFIG.get("SESSION_TTL_MINUTES", 30) or 30) * 60, key_type=int)
+# users who pressed a request_info button: uid_str -> {button_id, button_text, prompt}
+AWAITING = _session_store(AWAITING_FILE, float(CONFIG.get("AWAITING_TTL_HOURS", 24) or 24) * 3600)
+
+def expire_sessions():
+    try:
+        for store in (admin_sessions, AWAITING):
+            store.advance()
+    except Exception as e:
+        logger.exception("Session expiry failed: %s", e)
+
+scheduler.add_job(expire_sessions, "interval", seconds=float(CONFIG.get("SESSION_WHEEL_SECONDS", 5) or 5), id="expire_sessions")
+
+# regex for price like 1$ or 2.5$
+PRICE_PATTERN = re.compile(r"(-?\d+(?:\.\d+)?)\s*\$")
+
+# ---------------- pricing: rate table per currency ----------------
+# prices in button texts are in USD; RATES_FILE holds how many units of each
+# currency buy 1$, plus a history of every change. Each change bumps
+# ``version``: converters and rendered texts are cached per version, so a rate
+# change costs one re-render per text instead of a config rewrite.
+# EXCHANGE_RATE in config.json only seeds SYP the first time.
+RATE_HISTORY_LIMIT = 500
+DEFAULT_CURRENCY_SYMBOLS = {"SYP": "ل.س", "TRY": "₺", "EUR": "€", "SAR": "ر.س", "AED": "د.إ", "IQD": "د.ع", "EGP": "ج.م"}
 
-# ---------------- file helpers ----------------
-def ensure_file(path, default):
-    if not os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(default, f, ensure_ascii=False, indent=2)
+class CurrencyConverter:
+    __slots__ = ("code", "rate", "symbol", "version")
 
-def load_json(path, default=None):
-    with LOCK:
-        if not os.path.exists(path):
-            if default is not None:
-                ensure_file(path, default)
-                return json.loads(json.dumps(default))
-            return {} if default is None else default
-        with open(path, "r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except Exception as e:
-                logger.exception("Failed to load %s: %s", path, e)
-                return default if default is not None else {}
+    def __init__(self, code, rate, symbol, version):
+        self.code, self.rate, self.symbol, self.version = code, rate, symbol, version
 
-def save_json(path, data):
-    with LOCK:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def amount(self, usd):
+        return usd * self.rate
 
-# ensure files exist
-ensure_file(CONFIG_FILE, DEFAULT_CONFIG)
-ensure_file(BUTTONS_FILE, DEFAULT_BUTTONS)
-ensure_file(SERVICES_FILE, DEFAULT_SERVICES)
-ensure_file(USERS_FILE, DEFAULT_USERS)
-ensure_file(ORDERS_FILE, DEFAULT_ORDERS)
+    def format(self, usd):
+        return f"{format_number(usd * self.rate)} {self.symbol}"
 
-# load data
-CONFIG = load_json(CONFIG_FILE, DEFAULT_CONFIG)
-BUTTONS = load_json(BUTTONS_FILE, DEFAULT_BUTTONS)
-SERVICES = load_json(SERVICES_FILE, DEFAULT_SERVICES)
-USERS = load_json(USERS_FILE, DEFAULT_USERS)
-ORDERS = load_json(ORDERS_FILE, DEFAULT_ORDERS)
-ADMINS = load_json("admins.json", DEFAULT_ADMINS) if os.path.exists("admins.json") else DEFAULT_ADMINS
+class Pricing:
+    def __init__(self, path, config):
+        self.path = path
+        self._lock = Lock()
+        self._converters = {}
+        data = load_json(path, None) if os.path.exists(path) else None
+        if not data:
+            data = {"version": 1, "rates": {}, "history": []}
+            if config.get("EXCHANGE_RATE"):
+                data["rates"]["SYP"] = {"rate": float(config["EXCHANGE_RATE"]), "symbol": "ل.س"}
+                data["history"].append({"currency": "SYP", "rate": float(config["EXCHANGE_RATE"]),
+                                        "at": datetime.now().isoformat(), "by": None})
+            save_json(path, data)
+        self._apply(data)
 
-BOT_TOKEN = CONFIG.get("BOT_TOKEN")
-if not BOT_TOKEN or BOT_TOKEN == "PUT_YOUR_BOT_TOKEN_HERE":
-    logger.error("ضع BOT_TOKEN في config.json ثم أعد التشغيل.")
-    raise SystemExit("BOT_TOKEN missing in config.json")
+    def _apply(self, data):
+        with self._lock:
+            self.version = data.get("version", 1)
+            self.rates = data.get("rates", {})      # code -> {"rate": float, "symbol": str}
+            self.history = data.get("history", [])  # [{"currency", "rate", "at", "by"}], oldest first
+            self._converters = {}
 
-# runtime vars
-ADMIN_IDS = set(CONFIG.get("ADMIN_IDS", []))
-EXCHANGE_RATE = CONFIG.get("EXCHANGE_RATE")
-BUTTON_LAYOUT = CONFIG.get("BUTTON_LAYOUT", {"type":"vertical","grid_columns":2})
+    def reload(self):
+        # another worker process changed a rate
+        self._apply(load_json(self.path, {}))
+        invalidate_menus()
 
-# initialize bot and scheduler
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML")
-scheduler = BackgroundScheduler()
-scheduler.start()
+    def currencies(self):
+        return sorted(self.rates)
 
-# admin sessions for multi-step flows
-admin_sessions = {}  # admin_id -> {action:, temp:...}
+    def rate(self, code):
+        r = self.rates.get(code)
+        return r.get("rate") if r else None
 
-# regex for price like 1$ or 2.5$
-PRICE_PATTERN = re.compile(r"(-?\d+(?:\.\d+)?)\s*\$")
+    def converter(self, code):
+        conv = self._converters.get(code)
+        if conv is None or conv.version != self.version:
+            r = self.rates.get(code)
+            if not r or not r.get("rate"):
+                return None
+            conv = self._converters[code] = CurrencyConverter(code, float(r["rate"]), r.get("symbol") or code, self.version)
+        return conv
+
+    def set_rate(self, code, rate, by=None, symbol=None, save=True):
+        code = code.upper()
+        with self._lock:
+            entry = self.rates.setdefault(code, {})
+            entry["rate"] = float(rate)
+            entry["symbol"] = symbol or entry.get("symbol") or DEFAULT_CURRENCY_SYMBOLS.get(code, code)
+            self.history.append({"currency": code, "rate": float(rate), "at": datetime.now().isoformat(), "by": by})
+            del self.history[:-RATE_HISTORY_LIMIT]
+            self.version += 1
+            self._converters = {}
+        if save:
+            self.save()
+        invalidate_menus()
+
+    def remove(self, code, by=None):
+        with self._lock:
+            if self.rates.pop(code, None) is None:
+                return False
+            self.history.append({"currency": code, "rate": None, "at": datetime.now().isoformat(), "by": by})
+            self.version += 1
+            self._converters = {}
+        self.save()
+        invalidate_menus()
+        return True
+
+    def last_change(self, code):
+        return next((h for h in reversed(self.history) if h.get("currency") == code), None)
+
+    def save(self):
+        with self._lock:
+            snap = {"version": self.version, "rates": {c: dict(r) for c, r in self.rates.items()}, "history": list(self.history)}
+        save_json(self.path, snap)
+        publish_change("rates")
+
+    def quote(self, usd, code):
+        # what an order costs in the user's currency right now (stored on the order)
+        conv = self.converter(code) if code != "USD" else None
+        if conv is None:
+            return {"price_usd": usd, "currency": "USD", "price": usd}
+        return {"price_usd": usd, "currency": code, "price": round(conv.amount(usd), 2), "rate": conv.rate}
+
+PRICING = Pricing(RATES_FILE, CONFIG)
 
 # ---------------- utility functions ----------------
 def format_number(n):
@@ -138,18 +2504,69 @@ def format_number(n):
     except Exception:
         return str(n)
 
-def convert_text_prices(text, target_currency, rate):
-    def repl(m):
-        val = float(m.group(1))
+class PriceTemplate:
+    """Text parsed once into literal parts and USD price values.
+
+    The USD rendering is built at parse time; other currencies are rendered
+    once per converter (i.e. per rate version) and reused until it changes.
+    """
+    __slots__ = ("text", "parts", "values", "usd", "_rendered")
+
+    def __init__(self, text):
+        self.text = text
+        self.parts, self.values, slots = [], [], []
+        last = 0
+        for m in PRICE_PATTERN.finditer(text):
+            self.parts.append(text[last:m.start()])
+            last = m.end()
+            val = float(m.group(1))
+            self.values.append(val)
+            slots.append(f"{int(val)}$" if val.is_integer() else f"{val}$")
+        self.parts.append(text[last:])
+        self.usd = self._join(slots) if slots else text
+        self._rendered = {}  # currency -> (converter, text)
+
+    def _join(self, slots):
+        out = [None] * (len(self.parts) + len(slots))
+        out[::2] = self.parts
+        out[1::2] = slots
+        return "".join(out)
+
+    def render(self, target_currency):
+        if not self.values:
+            return self.text
         if target_currency == "USD":
-            return f"{int(val)}$" if val.is_integer() else f"{val}$"
-        if target_currency == "SYP":
-            if rate is None:
-                return f"{int(val)}$" if val.is_integer() else f"{val}$"
-            converted = val * float(rate)
-            return f"{format_number(converted)} ل.س"
-        return m.group(0)
-    return PRICE_PATTERN.sub(repl, text)
+            return self.usd
+        conv = PRICING.converter(target_currency)
+        if conv is None:
+            # unknown currency or no rate set: show the USD prices
+            return self.usd
+        hit = self._rendered.get(target_currency)
+        if hit is not None and hit[0] is conv:
+            return hit[1]
+        out = self._join([conv.format(v) for v in self.values])
+        self._rendered[target_currency] = (conv, out)
+        return out
+
+PRICE_TEMPLATES = {}  # text -> PriceTemplate, rebuilt with the button index
+
+def price_template(text):
+    t = PRICE_TEMPLATES.get(text)
+    if t is None:
+        t = PRICE_TEMPLATES[text] = PriceTemplate(text)
+    return t
+
+def convert_text_prices(text, target_currency):
+    return price_template(text).render(target_currency)
+
+def button_price(btn):
+    # first price in the button label is the price of the service (USD)
+    values = price_template(btn.get("text", "")).values if btn else ()
+    return values[0] if values else None
+
+def auto_currency():
+    code = CONFIG.get("CURRENCY_AUTO", "SYP")
+    return code if PRICING.rate(code) else "USD"
 
 def user_currency(uid_str):
     u = USERS.get(uid_str, {})
@@ -157,8 +2574,8 @@ def user_currency(uid_str):
     if not pref:
         pref = CONFIG.get("CURRENCY_DEFAULT", "AUTO")
     if pref == "AUTO":
-        return "SYP" if CONFIG.get("EXCHANGE_RATE") else "USD"
-    return pref
+        return auto_currency()
+    return pref if pref == "USD" or PRICING.rate(pref) else "USD"
 
 def is_admin_user(user_id):
     if user_id in set(CONFIG.get("ADMIN_IDS", [])):
@@ -168,11 +2585,14 @@ def is_admin_user(user_id):
             return True
     return False
 
+def admin_ids():
+    return set(CONFIG.get("ADMIN_IDS", [])) | {a.get("id") for a in ADMINS.get("admins", []) if a.get("id")}
+
 def find_button_by_id(bid, btn_list=None):
     if btn_list is None:
-        btn_list = BUTTONS.get("main_menu", [])
+        return BUTTON_INDEX.get(bid)
     for b in btn_list:
-        if b.get("id") == bid or b.get("text") == bid:
+        if b.get("id") == bid:
             return b
         if b.get("type") == "submenu":
             found = find_button_by_id(bid, b.get("submenu", []))
@@ -180,16 +2600,11 @@ def find_button_by_id(bid, btn_list=None):
                 return found
     return None
 
-def build_keyboard_from_buttons(btn_list, uid_str=None):
-    layout = CONFIG.get("BUTTON_LAYOUT", {"type":"vertical","grid_columns":2})
-    ltype = layout.get("type", "vertical")
-    cols = int(layout.get("grid_columns", 2) or 2)
-    kb = InlineKeyboardMarkup()
-    pref = user_currency(uid_str) if uid_str else CONFIG.get("CURRENCY_DEFAULT","AUTO")
-    rate = CONFIG.get("EXCHANGE_RATE")
+def _render_keyboard(btn_list, pref, ltype, cols):
+    kb = FrozenKeyboard()
     displayed = []
     for b in btn_list:
-        displayed_text = convert_text_prices(b.get("text",""), pref, rate)
+        displayed_text = render_prices(b.get("text",""), pref)
         displayed.append((b.get("id"), displayed_text))
     if ltype == "vertical":
         for bid, text in displayed:
@@ -215,22 +2630,462 @@ def build_keyboard_from_buttons(btn_list, uid_str=None):
     kb.add(InlineKeyboardButton("🏠 الرئيسية", callback_data="NAV|home"))
     return kb
 
+def _layout():
+    layout = CONFIG.get("BUTTON_LAYOUT", {"type":"vertical","grid_columns":2})
+    return layout.get("type", "vertical"), int(layout.get("grid_columns", 2) or 2)
+
+def _display_currency(uid_str):
+    return user_currency(uid_str) if uid_str else CONFIG.get("CURRENCY_DEFAULT","AUTO")
+
+# ---------------- compiled menu index & keyboard cache ----------------
+# built once from BUTTONS and rebuilt by save_buttons(); NAV|home and submenu
+# navigation are served from KEYBOARD_CACHE/TEXT_CACHE without any regex work.
+MAIN_MENU_ID = "main_menu"
+BUTTON_INDEX = {}     # button id -> button dict (same object as in BUTTONS)
+BUTTON_PARENT = {}    # button id -> parent submenu id (None for main menu)
+KEYBOARD_CACHE = {}   # (menu id, currency, rate version, layout type, cols) -> keyboard
+TEXT_CACHE = {}       # (text, currency, rate version) -> text with converted prices
+
+class FrozenKeyboard(InlineKeyboardMarkup):
+    # cached keyboards are shared between sends: serialize them only once
+    _json = None
+
+    def to_json(self):
+        if self._json is None:
+            self._json = super().to_json()
+        return self._json
+
+def rebuild_button_index():
+    global BUTTON_INDEX, BUTTON_PARENT, PRICE_TEMPLATES
+    index, parents = {}, {}
+    def walk(btn_list, parent):
+        for b in btn_list:
+            bid = b.get("id")
+            if bid is not None and bid not in index:
+                index[bid] = b
+                parents[bid] = parent
+            if b.get("type") == "submenu":
+                walk(b.get("submenu", []), bid)
+    walk(BUTTONS.get("main_menu", []), None)
+    BUTTON_INDEX, BUTTON_PARENT = index, parents
+    # parse every price-bearing field once; edited/removed texts drop out
+    PRICE_TEMPLATES = {t: PriceTemplate(t) for b in index.values()
+                       for t in (b.get(f) for f in ("text", "description", "content", "info_request")) if isinstance(t, str)}
+    invalidate_menus()
+
+def invalidate_menus():
+    # rate, layout or button edits: drop every rendered keyboard/text
+    global KEYBOARD_CACHE, TEXT_CACHE
+    KEYBOARD_CACHE, TEXT_CACHE = {}, {}
+
+def render_prices(text, pref):
+    key = (text, pref, PRICING.version)
+    out = TEXT_CACHE.get(key)
+    if out is None:
+        out = TEXT_CACHE[key] = convert_text_prices(text, pref)
+    return out
+
+def menu_buttons(menu_id):
+    if menu_id == MAIN_MENU_ID:
+        return BUTTONS.get("main_menu", [])
+    btn = BUTTON_INDEX.get(menu_id)
+    return btn.get("submenu", []) if btn else []
+
+def build_menu_kb(menu_id, uid_str=None):
+    pref = _display_currency(uid_str)
+    ltype, cols = _layout()
+    key = (menu_id, pref, PRICING.version, ltype, cols)
+    kb = KEYBOARD_CACHE.get(key)
+    if kb is None:
+        kb = KEYBOARD_CACHE[key] = _render_keyboard(menu_buttons(menu_id), pref, ltype, cols)
+    return kb
+
 def build_main_menu(uid_str=None):
-    return build_keyboard_from_buttons(BUTTONS.get("main_menu", []), uid_str)
+    return build_menu_kb(MAIN_MENU_ID, uid_str)
+
+rebuild_button_index()
+
+# ---------------- media cache (Telegram file_id per image URL) ----------------
+# the first successful send_photo of a URL records the file_id Telegram
+# returns; later sends pass that file_id so Telegram doesn't re-fetch the
+# origin. Entries also carry the sha256 of the content once it's known
+# (fingerprinted in the background when an admin sets the URL), so a new URL
+# with identical content reuses the existing file_id.
+MEDIA_FETCH_LIMIT = 10 * 1024 * 1024
+
+def _is_url(ref):
+    return isinstance(ref, str) and ref.startswith(("http://", "https://"))
+
+def is_bad_file_id(e):
+    # the only error that says the cached file_id itself is unusable; 403
+    # (blocked), 429 and 5xx are about the chat or the API, not the file
+    desc = (getattr(e, "description", None) or "").lower()
+    return getattr(e, "error_code", None) == 400 and ("wrong file identifier" in desc or "file_id" in desc)
+
+class MediaCache:
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self.entries = load_json(path, None) if os.path.exists(path) else {}  # url -> {file_id, sha256}
+
+    def _save(self):
+        with self._lock:
+            snap = {url: dict(e) for url, e in self.entries.items()}
+        save_json(self.path, snap)
+
+    def resolve(self, ref):
+        if not _is_url(ref):
+            return ref  # already a file_id
+        entry = self.entries.get(ref)
+        return (entry.get("file_id") or ref) if entry else ref
 
-def build_submenu_kb(submenu, uid_str=None):
-    return build_keyboard_from_buttons(submenu, uid_str)
+    def remember(self, url, file_id):
+        if not _is_url(url) or not file_id:
+            return
+        with self._lock:
+            entry = self.entries.setdefault(url, {})
+            if entry.get("file_id") == file_id:
+                return
+            entry["file_id"] = file_id
+        self._save()
+
+    def forget(self, url):
+        with self._lock:
+            if self.entries.pop(url, None) is None:
+                return
+        self._save()
 
-def notify_admins(text):
-    admin_ids = set(CONFIG.get("ADMIN_IDS", [])) | set([a.get("id") for a in ADMINS.get("admins", [])])
-    sent = 0
-    for aid in admin_ids:
+    def prune(self, urls):
+        # keep only the URLs some button still uses
+        with self._lock:
+            stale = [url for url in self.entries if url not in urls]
+            for url in stale:
+                del self.entries[url]
+        if stale:
+            self._save()
+        return len(stale)
+
+    def forget_file_id(self, file_id):
+        # Telegram rejected a cached file_id: fall back to the URL next time
+        with self._lock:
+            stale = [url for url, e in self.entries.items() if e.get("file_id") == file_id]
+            for url in stale:
+                self.entries[url].pop("file_id", None)
+        if stale:
+            self._save()
+        return stale
+
+    def fingerprint(self, url):
         try:
-            bot.send_message(aid, text)
-            sent += 1
-        except Exception:
-            pass
-    return sent
+            with urllib.request.urlopen(url, timeout=15) as resp:
+                digest = hashlib.sha256(resp.read(MEDIA_FETCH_LIMIT)).hexdigest()
+        except Exception as e:
+            logger.info("media fingerprint failed for %s: %s", url, e)
+            return None
+        with self._lock:
+            entry = self.entries.setdefault(url, {})
+            entry["sha256"] = digest
+            if not entry.get("file_id"):
+                twin = next((e for u, e in self.entries.items() if u != url and e.get("sha256") == digest and e.get("file_id")), None)
+                if twin:
+                    entry["file_id"] = twin["file_id"]
+        self._save()
+        return digest
+
+    def image_changed(self, url):
+        # admin (re)set a button image: the origin content may have changed,
+        # so drop what we had for this URL and fingerprint it again
+        self.forget(url)
+        if _is_url(url):
+            threading.Thread(target=self.fingerprint, args=(url,), name="media-fingerprint", daemon=True).start()
+
+# one copy per worker of main_workers.py (a shared file would lose the file_ids
+# of all but the last writer); a new copy starts from the single-process cache
+MEDIA = MediaCache(worker_path(MEDIA_FILE))
+if MEDIA.path != MEDIA_FILE and not os.path.exists(MEDIA.path) and os.path.exists(MEDIA_FILE):
+    MEDIA.entries = load_json(MEDIA_FILE, {})
+
+def send_cached_photo(chat_id, image, **kwargs):
+    ref = MEDIA.resolve(image)
+    try:
+        msg = bot.send_photo(chat_id, ref, **kwargs)
+    except telebot.apihelper.ApiTelegramException as e:
+        if ref == image or not is_bad_file_id(e):
+            raise
+        MEDIA.forget_file_id(ref)
+        msg = bot.send_photo(chat_id, image, **kwargs)
+    photo = getattr(msg, "photo", None)
+    if photo:
+        MEDIA.remember(image, photo[-1].file_id)
+    return msg
+
+# ---------------- rate-limited sending ----------------
+# broadcasts and queued notifications share one pacer so together they stay
+# under Telegram's global limit; a 429 pauses every sender for retry_after.
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / max(float(rate), 0.1)
+        self._next = time.monotonic()
+        self._lock = Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            at = max(self._next, now)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+# Telegram's limit is per bot: worker processes split it
+SEND_LIMITER = RateLimiter((CONFIG.get("BROADCAST_RATE", 25) or 25) / WORKER_COUNT)
+
+def send_limited(chat_id, text, photo=None, **kwargs):
+    """Send through SEND_LIMITER (with ``photo``: text is the caption);
+    returns "sent", "blocked" (403) or "failed"."""
+    while True:
+        SEND_LIMITER.wait()
+        try:
+            if photo:
+                bot.send_photo(chat_id, photo, caption=text, **kwargs)
+            else:
+                bot.send_message(chat_id, text, **kwargs)
+            return "sent"
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429:
+                retry = (e.result_json or {}).get("parameters", {}).get("retry_after", 5)
+                logger.warning("send throttled by Telegram, pausing %ss", retry)
+                SEND_LIMITER.pause(retry)
+                continue
+            if e.error_code == 403:
+                return "blocked"
+            logger.debug("send to %s failed: %s", chat_id, e)
+            return "failed"
+        except ApiUnavailable:
+            # API down: hold the queue until the breaker lets a probe through
+            time.sleep(max(API.breaker.remaining(), 1.0))
+        except Exception as e:
+            logger.debug("send to %s failed: %s", chat_id, e)
+            return "failed"
+
+class Outbox:
+    """Background queue for one-off user notifications (order results etc.)."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+
+    def send(self, chat_id, text, **kwargs):
+        self._queue.put((chat_id, text, kwargs))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="outbox", daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _loop(self):
+        while True:
+            chat_id, text, kwargs = self._queue.get()
+            if send_limited(chat_id, text, **kwargs) != "sent":
+                logger.info("notification to %s not delivered", chat_id)
+
+OUTBOX = Outbox()
+
+# ---------------- admin notifications ----------------
+# handlers only queue admin notifications; a small pool sends them to all
+# admins in parallel. In digest mode (ADMIN_NOTIFY_MODE="digest") new orders
+# are collected for ADMIN_DIGEST_SECONDS and each admin gets one summary with
+# approve/reject buttons per order and for the whole batch.
+DIGEST_MAX_LISTED = 20  # orders with their own buttons in one digest (Telegram allows 100 buttons)
+
+class AdminNotifier:
+    def __init__(self, workers=4, mode="instant", window=60):
+        self.mode = mode
+        self.window = window
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="admin-notify")
+        self._lock = Lock()
+        self._pending = []          # orders waiting for the next digest
+        self._timer = None
+
+    def notify(self, text, photo=None, **kwargs):
+        # returns at once; one send per admin runs on the pool
+        targets = admin_ids()
+        for aid in targets:
+            self._pool.submit(self._send, aid, text, photo, kwargs)
+        return len(targets)
+
+    @staticmethod
+    def _send(aid, text, photo, kwargs):
+        try:
+            if send_limited(aid, text, photo=photo, **kwargs) != "sent":
+                logger.warning("notify admin %s failed", aid)
+        except Exception as e:
+            logger.warning("notify admin %s failed: %s", aid, e)
+
+    def order_created(self, order, text):
+        if self.mode != "digest":
+            kb = InlineKeyboardMarkup()
+            kb.row(InlineKeyboardButton("✅ موافقة", callback_data=f"ORDER|{order['order_id']}|approve"),
+                   InlineKeyboardButton("❌ رفض", callback_data=f"ORDER|{order['order_id']}|reject"))
+            self.notify(text, reply_markup=kb)
+            return
+        with self._lock:
+            self._pending.append(order)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            orders, self._pending = self._pending, []
+            self._timer = None
+        if not orders:
+            return
+        digest_id = uuid.uuid4().hex[:8]
+        # in the store, not in memory: the admin's callback may reach another
+        # worker process (main_workers.py routes by chat) or come after a restart
+        STORE.save_digest(digest_id, [o["order_id"] for o in orders])
+        lines = [f"📥 {len(orders)} طلبات جديدة:"]
+        kb = InlineKeyboardMarkup()
+        for n, o in enumerate(orders[:DIGEST_MAX_LISTED], 1):
+            price = f" — {order_price_text(o)}" if o.get("price") is not None else ""
+            lines.append(f"{n}. {o.get('user_name')} ({o.get('user_id')}): {o.get('button_text')}{price}")
+            kb.row(InlineKeyboardButton(f"✅ {n}", callback_data=f"ORDER|{o['order_id']}|approve"),
+                   InlineKeyboardButton(f"❌ {n}", callback_data=f"ORDER|{o['order_id']}|reject"),
+                   InlineKeyboardButton(f"🔎 {n}", callback_data=f"ORDER|{o['order_id']}|view"))
+        if len(orders) > DIGEST_MAX_LISTED:
+            lines.append(f"… و {len(orders) - DIGEST_MAX_LISTED} طلبات أخرى")
+        kb.row(InlineKeyboardButton("✅ قبول الكل", callback_data=f"DIGEST|{digest_id}|approve"),
+               InlineKeyboardButton("❌ رفض الكل", callback_data=f"DIGEST|{digest_id}|reject"))
+        self.notify("\n".join(lines), reply_markup=kb)
+
+    @staticmethod
+    def digest_orders(digest_id):
+        return STORE.digest_orders(digest_id)
+
+ADMIN_NOTIFIER = AdminNotifier(workers=int(CONFIG.get("ADMIN_NOTIFY_WORKERS", 4) or 4),
+                               mode=CONFIG.get("ADMIN_NOTIFY_MODE", "instant"),
+                               window=float(CONFIG.get("ADMIN_DIGEST_SECONDS", 60) or 60))
+
+def notify_admins(text, **kwargs):
+    return ADMIN_NOTIFIER.notify(text, **kwargs)
+
+# ---------------- broadcast engine ----------------
+# one background thread sends jobs through SEND_LIMITER (BROADCAST_RATE msg/s),
+# marks users who blocked the bot, and checkpoints its cursor to
+# BROADCASTS_FILE so a restart resumes where it stopped.
+class Broadcaster:
+    CHECKPOINT_EVERY = 5.0   # seconds between checkpoints / admin progress edits
+    KEEP_FINISHED = 20       # done/failed jobs kept in BROADCASTS_FILE, newest first
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = load_json(path, {}) if os.path.exists(path) else {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+        self._prune()
+
+    def _prune(self):
+        # every checkpoint rewrites the file: don't let finished jobs pile up in it
+        with self._lock:
+            finished = [jid for jid, j in self.jobs.items() if j.get("status") not in ("queued", "running")]
+            for jid in finished[:-self.KEEP_FINISHED] if self.KEEP_FINISHED else finished:
+                del self.jobs[jid]
+
+    def _checkpoint(self):
+        with self._lock:
+            save_json(self.path, self.jobs)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="broadcast", daemon=True)
+            self._thread.start()
+
+    def submit(self, text, admin_id, kind="broadcast", currency=None):
+        # currency: only users whose effective currency is this code
+        job_id = uuid.uuid4().hex[:8]
+        job = {"id": job_id, "kind": kind, "text": text, "admin_id": admin_id, "status": "queued", "currency": currency,
+               "cursor": None, "sent": 0, "failed": 0, "blocked": 0, "total": len(USERS),
+               "created_at": datetime.now().isoformat(), "progress_msg": None}
+        with self._lock:
+            self.jobs[job_id] = job
+        self._checkpoint()
+        self._queue.put(job_id)
+        self._ensure_thread()
+        return job_id
+
+    def resume(self):
+        pending = [j["id"] for j in self.jobs.values() if j.get("status") in ("queued", "running")]
+        for job_id in pending:
+            self._queue.put(job_id)
+        if pending:
+            logger.info("Resuming %d broadcast job(s)", len(pending))
+            self._ensure_thread()
+
+    def _loop(self):
+        while True:
+            job_id = self._queue.get()
+            job = self.jobs.get(job_id)
+            if not job or job.get("status") not in ("queued", "running"):
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                logger.exception("broadcast %s crashed: %s", job_id, e)
+                job["status"] = "failed"
+                self._prune()
+                self._checkpoint()
+
+    def _report(self, job, final=False):
+        text = (f"📢 البث {job['id']}: {'انتهى' if final else 'جارٍ'}\n"
+                f"✅ {job['sent']}  ⛔ {job['blocked']}  ❌ {job['failed']}  / 👥 {job['total']}")
+        try:
+            if job.get("progress_msg"):
+                bot.edit_message_text(text, chat_id=job["admin_id"], message_id=job["progress_msg"])
+            else:
+                sent = bot.send_message(job["admin_id"], text)
+                job["progress_msg"] = getattr(sent, "message_id", None)
+        except Exception as e:
+            logger.debug("broadcast %s progress update failed: %s", job["id"], e)
+
+    def _run(self, job):
+        job["status"] = "running"
+        self._report(job)
+        # users are visited in sorted id order; cursor = last id handled
+        targets = sorted(USERS.keys())
+        start = bisect.bisect_right(targets, job["cursor"]) if job.get("cursor") is not None else 0
+        job["total"] = len(targets)
+        last_cp = time.monotonic()
+        for uid in targets[start:]:
+            user = USERS.get(uid)
+            if user is None or user.get("blocked") or (job.get("currency") and user_currency(uid) != job["currency"]):
+                job["cursor"] = uid
+                continue
+            result = send_limited(int(uid), job["text"])
+            job[result] += 1
+            if result == "blocked":
+                user["blocked"] = True
+                save_user(uid)
+            job["cursor"] = uid
+            if time.monotonic() - last_cp >= self.CHECKPOINT_EVERY:
+                last_cp = time.monotonic()
+                self._checkpoint()
+                self._report(job)
+        job["status"] = "done"
+        job["finished_at"] = datetime.now().isoformat()
+        self._prune()
+        self._checkpoint()
+        self._report(job, final=True)
+
+BROADCASTER = Broadcaster(worker_path(BROADCASTS_FILE))
 
 # ---------------- Start / Help ----------------
 WELCOME_HTML = "<b>🎮 أهلاً بك</b>\nاختر الخدمة من القائمة."
@@ -239,28 +3094,45 @@ WELCOME_HTML = "<b>🎮 أهلاً بك</b>\nاختر الخدمة من القا
 def cmd_start(m):
     uid = str(m.chat.id)
     if uid not in USERS:
-        USERS[uid] = {"id": m.chat.id, "name": m.from_user.full_name or m.from_user.first_name,
-                      "first_seen": datetime.now().isoformat(), "awaiting": None, "currency_pref": "AUTO"}
-        save_json(USERS_FILE, USERS)
+        USERS[uid] = UserRecord(id=m.chat.id, name=m.from_user.full_name or m.from_user.first_name,
+                                first_seen=datetime.now().isoformat(), currency_pref="AUTO")
+        save_user(uid)
+    elif USERS[uid].get("blocked"):
+        # user came back after blocking the bot: include them in broadcasts again
+        USERS[uid]["blocked"] = False
+        save_user(uid)
     if CONFIG.get("BOT_STATUS","on") == "off" and not is_admin_user(m.chat.id):
         bot.send_message(m.chat.id, "🚫 البوت متوقف حالياً.")
         return
     kb = build_main_menu(uid)
     bot.send_message(m.chat.id, WELCOME_HTML, reply_markup=kb)
 
+def user_awaiting(uid, user):
+    awaiting = AWAITING.get(uid)
+    if awaiting is None and user and user.get("awaiting"):
+        # set before awaiting.json existed: move it out of the profile
+        awaiting = AWAITING[uid] = user["awaiting"]
+        user["awaiting"] = None
+        save_user(uid)
+    return awaiting
+
 # ---------------- catch all (block free text unless awaiting) ----------------
 @bot.message_handler(func=lambda m: True, content_types=['text','photo'])
 def catch_all(m):
     uid = str(m.chat.id)
     # admin session flows
     if is_admin_user(m.chat.id):
-        if admin_sessions.get(m.chat.id):
-            handle_admin_session_input(m, admin_sessions[m.chat.id])
+        session = admin_sessions.get(m.chat.id)
+        if session:
+            handle_admin_session_input(m, session)
+            # steps change the session in place: persist it and restart its TTL
+            if admin_sessions.get(m.chat.id) is session:
+                admin_sessions.touch(m.chat.id)
             return
     # if user awaiting info
     user = USERS.get(uid)
-    if user and user.get("awaiting"):
-        awaiting = user["awaiting"]
+    awaiting = user_awaiting(uid, user)
+    if awaiting:
         if not CONFIG.get("ALLOW_LINKS", False) and m.content_type == 'text':
             txt = m.text or ""
             if txt.startswith("http://") or txt.startswith("https://"):
@@ -271,33 +3143,38 @@ def catch_all(m):
             info = {"type":"photo","file_id":file_id}
         else:
             info = {"type":"text","text": m.text}
-        order = {
+        order = OrderRecord({
             "order_id": str(uuid.uuid4()),
             "user_id": m.chat.id,
-            "user_name": user.get("name"),
+            "user_name": (user or {}).get("name"),
             "button_id": awaiting.get("button_id"),
             "button_text": awaiting.get("button_text"),
             "info": info,
             "status": "pending",
             "created_at": datetime.now().isoformat()
-        }
-        ORDERS.append(order)
-        save_json(ORDERS_FILE, ORDERS)
-        USERS[uid]["awaiting"] = None
-        save_json(USERS_FILE, USERS)
+        })
+        price = button_price(find_button_by_id(awaiting.get("button_id")))
+        if price is not None:
+            # frozen at creation: later rate changes don't rewrite the order
+            order.update(PRICING.quote(price, user_currency(uid)))
+        STORE.add_order(order)
+        STATS.order_created(order)
+        # journaled right after the order so a restart never re-opens the request
+        AWAITING.pop(uid, None)
         bot.send_message(m.chat.id, "✅ طلبك قيد المراجعة سيتم إعلامك بالنتيجة قريبًا.")
-        pretty = f"📥 طلب جديد\n👤 {order['user_name']} (ID:{order['user_id']})\n📦 {order['button_text']}\nOrderID: {order['order_id']}\n"
+        pretty = f"📥 طلب جديد\n👤 {order['user_name']} (ID:{order['user_id']})\n📦 {order['button_text']}\n"
+        if order.get("price") is not None:
+            pretty += f"💰 {order_price_text(order)}\n"
+        pretty += f"OrderID: {order['order_id']}\n"
         if info["type"] == "text":
             pretty += f"📝 {info['text']}"
         else:
             pretty += f"🖼 صورة (file_id:{info['file_id']})"
-        notify_admins(pretty)
+        ADMIN_NOTIFIER.order_created(order, pretty)
         return
     # otherwise block free messages
-    if not (user and user.get("awaiting")):
-        if not is_admin_user(m.chat.id):
-            bot.send_message(m.chat.id, "⚠️ الرجاء استخدام الأزرار فقط.", reply_markup=build_main_menu(uid))
-            return
+    if not is_admin_user(m.chat.id):
+        bot.send_message(m.chat.id, "⚠️ الرجاء استخدام الأزرار فقط.", reply_markup=build_main_menu(uid))
 
 # ---------------- callback handling ----------------
 @bot.callback_query_handler(func=lambda c: True)
@@ -317,10 +3194,11 @@ def callback_handler(call):
     if data == "NAV|toggle_currency":
         u = USERS.get(uid_str, {})
         pref = u.get("currency_pref","AUTO")
-        # cycle AUTO -> USD -> SYP -> AUTO
-        new = "USD" if pref == "AUTO" else ("SYP" if pref == "USD" else "AUTO")
-        USERS.setdefault(uid_str, {})["currency_pref"] = new
-        save_json(USERS_FILE, USERS)
+        # cycle AUTO -> USD -> each currency in the rate table -> AUTO
+        cycle = ["AUTO", "USD"] + PRICING.currencies()
+        new = cycle[(cycle.index(pref) + 1) % len(cycle)] if pref in cycle else "AUTO"
+        USERS.setdefault(uid_str, UserRecord(id=uid))["currency_pref"] = new
+        save_user(uid_str)
         bot.answer_callback_query(call.id, f"تم تغيير العرض إلى: {new}")
         try:
             bot.edit_message_text(WELCOME_HTML, chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=build_main_menu(uid_str))
@@ -358,9 +3236,34 @@ def callback_handler(call):
             bot.answer_callback_query(call.id)
             return
 
+    # paginated order queue
+    if data.startswith("OQ|"):
+        if not is_admin_user(uid):
+            bot.answer_callback_query(call.id, "⛔ للأدمن فقط")
+            return
+        handle_order_queue(call, data.split("|")[1:])
+        bot.answer_callback_query(call.id)
+        return
+
     # order admin operations
+    if data.startswith("DIGEST|"):
+        # DIGEST|<digest id>|approve/reject: every still-open order of one digest
+        parts = data.split("|")
+        if not is_admin_user(uid):
+            bot.answer_callback_query(call.id, "⛔ للأدمن فقط")
+            return
+        ids = ADMIN_NOTIFIER.digest_orders(parts[1]) if len(parts) == 3 else None
+        if ids is None or parts[2] not in BULK_STATUS:
+            bot.answer_callback_query(call.id, "انتهت صلاحية الملخص، استخدم قائمة الطلبات.")
+            return
+        bulk_order_action(uid, ids, parts[2])
+        bot.answer_callback_query(call.id)
+        return
     if data.startswith("ORDER|"):
         parts = data.split("|")
+        if not is_admin_user(uid):
+            bot.answer_callback_query(call.id, "⛔ للأدمن فقط")
+            return
         if len(parts) >= 3:
             order_id = parts[1]
             action = parts[2]
@@ -377,39 +3280,37 @@ def callback_handler(call):
             return
         btype = btn.get("type")
         pref = user_currency(uid_str)
-        rate = CONFIG.get("EXCHANGE_RATE")
         if btype == "submenu":
-            submenu = btn.get("submenu", [])
             # if main button has image/description, send it first (image above text)
             main_image = btn.get("image","")
             desc = btn.get("description","")
-            header = convert_text_prices(btn.get("text",""), pref, rate)
+            header = render_prices(btn.get("text",""), pref)
             try:
                 if main_image:
                     # try send photo with caption header + desc
                     caption = header
                     if desc:
-                        caption += "\n\n" + convert_text_prices(desc, pref, rate)
-                    bot.edit_message_text(caption, chat_id=call.message.chat.id, message_id=call.message.message_id, parse_mode="HTML", reply_markup=build_submenu_kb(submenu, uid_str))
+                        caption += "\n\n" + render_prices(desc, pref)
+                    bot.edit_message_text(caption, chat_id=call.message.chat.id, message_id=call.message.message_id, parse_mode="HTML", reply_markup=build_menu_kb(btn.get("id"), uid_str))
                 else:
-                    bot.edit_message_text(f"<b>{header}</b>\n{convert_text_prices(desc, pref, rate)}", chat_id=call.message.chat.id, message_id=call.message.message_id, parse_mode="HTML", reply_markup=build_submenu_kb(submenu, uid_str))
+                    bot.edit_message_text(f"<b>{header}</b>\n{render_prices(desc, pref)}", chat_id=call.message.chat.id, message_id=call.message.message_id, parse_mode="HTML", reply_markup=build_menu_kb(btn.get("id"), uid_str))
             except Exception:
                 # fallback send as new message
                 if main_image:
                     try:
-                        bot.send_photo(call.message.chat.id, main_image, caption=header + ("\n\n"+convert_text_prices(desc,pref,rate) if desc else ""), parse_mode="HTML", reply_markup=build_submenu_kb(submenu, uid_str))
+                        send_cached_photo(call.message.chat.id, main_image, caption=header + ("\n\n"+render_prices(desc,pref) if desc else ""), parse_mode="HTML", reply_markup=build_menu_kb(btn.get("id"), uid_str))
                     except Exception:
-                        bot.send_message(call.message.chat.id, header + ("\n\n"+desc if desc else ""), parse_mode="HTML", reply_markup=build_submenu_kb(submenu, uid_str))
+                        bot.send_message(call.message.chat.id, header + ("\n\n"+desc if desc else ""), parse_mode="HTML", reply_markup=build_menu_kb(btn.get("id"), uid_str))
                 else:
-                    bot.send_message(call.message.chat.id, f"<b>{header}</b>\n{convert_text_prices(desc,pref,rate)}", parse_mode="HTML", reply_markup=build_submenu_kb(submenu, uid_str))
+                    bot.send_message(call.message.chat.id, f"<b>{header}</b>\n{render_prices(desc,pref)}", parse_mode="HTML", reply_markup=build_menu_kb(btn.get("id"), uid_str))
             bot.answer_callback_query(call.id)
             return
         if btype == "content":
-            text = convert_text_prices(btn.get("content",""), pref, rate)
+            text = render_prices(btn.get("content",""), pref)
             image = btn.get("image","")
             if image:
                 try:
-                    bot.send_photo(call.message.chat.id, image, caption=text, parse_mode="HTML", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 الرئيسية", callback_data="NAV|home")]]))
+                    send_cached_photo(call.message.chat.id, image, caption=text, parse_mode="HTML", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 الرئيسية", callback_data="NAV|home")]]))
                 except Exception:
                     bot.send_message(call.message.chat.id, text, parse_mode="HTML", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 الرئيسية", callback_data="NAV|home")]]))
             else:
@@ -417,11 +3318,12 @@ def callback_handler(call):
             bot.answer_callback_query(call.id)
             return
         if btype == "request_info":
-            USERS.setdefault(uid_str, {"id": uid, "name": call.from_user.full_name, "first_seen": datetime.now().isoformat(), "awaiting": None, "currency_pref":"AUTO"})
-            USERS[uid_str]["awaiting"] = {"button_id": btn.get("id"), "button_text": btn.get("text"), "prompt": btn.get("info_request", "أرسل المعلومات المطلوبة")}
-            save_json(USERS_FILE, USERS)
-            prompt = USERS[uid_str]["awaiting"]["prompt"]
-            prompt = convert_text_prices(prompt, user_currency(uid_str), CONFIG.get("EXCHANGE_RATE"))
+            if uid_str not in USERS:
+                USERS[uid_str] = UserRecord(id=uid, name=call.from_user.full_name, first_seen=datetime.now().isoformat(), currency_pref="AUTO")
+                save_user(uid_str)
+            AWAITING[uid_str] = {"button_id": btn.get("id"), "button_text": btn.get("text"), "prompt": btn.get("info_request", "أرسل المعلومات المطلوبة")}
+            prompt = AWAITING[uid_str]["prompt"]
+            prompt = render_prices(prompt, user_currency(uid_str))
             bot.send_message(call.message.chat.id, prompt, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 الرئيسية", callback_data="NAV|home")]]))
             bot.answer_callback_query(call.id)
             return
@@ -438,59 +3340,230 @@ def callback_handler(call):
 # ---------------- user->admin message ----------------
 def user_send_message_to_admin(m):
     if m.content_type == 'photo':
-        file_id = m.photo[-1].file_id
-        for aid in set(CONFIG.get("ADMIN_IDS", [])) | set([a.get("id") for a in ADMINS.get("admins", [])]):
-            try:
-                bot.send_photo(aid, file_id, caption=f"📩 رسالة من {m.from_user.full_name} (ID:{m.from_user.id})")
-            except Exception:
-                pass
-        bot.send_message(m.chat.id, "✅ تم إرسال الرسالة.")
+        notify_admins(f"📩 رسالة من {m.from_user.full_name} (ID:{m.from_user.id})", photo=m.photo[-1].file_id)
     else:
-        for aid in set(CONFIG.get("ADMIN_IDS", [])) | set([a.get("id") for a in ADMINS.get("admins", [])]):
-            try:
-                bot.send_message(aid, f"📩 رسالة من {m.from_user.full_name} (ID:{m.from_user.id}):\n\n{m.text}")
-            except Exception:
-                pass
-        bot.send_message(m.chat.id, "✅ تم إرسال الرسالة.")
+        notify_admins(f"📩 رسالة من {m.from_user.full_name} (ID:{m.from_user.id}):\n\n{m.text}")
+    bot.send_message(m.chat.id, "✅ تم إرسال الرسالة.")
+
+# ---------------- admin order queue (paginated) ----------------
+ORDER_STATUSES = [("pending", "🟡", "قيد الانتظار"), ("needs_more", "✏️", "بحاجة لمعلومات"),
+                  ("approved", "✅", "مقبول"), ("rejected", "❌", "مرفوض")]
+STATUS_ICONS = {s: icon for s, icon, _ in ORDER_STATUSES}
+STATUS_LABELS = {s: label for s, _, label in ORDER_STATUSES}
+order_views = {}  # admin id -> current queue filters
+
+def pending_badge():
+    n = STORE.count_orders("pending")
+    return f" (🟡 {n})" if n else ""
+
+def _order_view(aid):
+    return order_views.setdefault(aid, {"status": "pending", "button_id": None, "user_id": None,
+                                        "select": False, "selected": set(), "cursor": (None, None)})
+
+def show_order_queue(aid, call=None, before=None, after=None):
+    view = _order_view(aid)
+    view["cursor"] = (before, after)
+    page = STORE.orders_page(view["status"], view["button_id"], view["user_id"], before, after,
+                             int(CONFIG.get("ORDERS_PAGE_SIZE", 10) or 10))
+    kb = InlineKeyboardMarkup()
+    for o in page["orders"]:
+        oid = o.get("order_id")
+        if view["select"]:
+            mark = "☑️" if oid in view["selected"] else "⬜"
+            kb.add(InlineKeyboardButton(f"{mark} {o.get('button_text')} - {o.get('user_name')}", callback_data=f"OQ|pick|{oid}"))
+        else:
+            kb.add(InlineKeyboardButton(f"{STATUS_ICONS.get(o.get('status'), '•')} {o.get('button_text')} - {o.get('user_name')}",
+                                        callback_data=f"ORDER|{oid}|view"))
+    nav = []
+    if page["newer"] is not None:
+        nav.append(InlineKeyboardButton("⬅️ أحدث", callback_data=f"OQ|newer|{page['newer']}"))
+    if page["older"] is not None:
+        nav.append(InlineKeyboardButton("أقدم ➡️", callback_data=f"OQ|older|{page['older']}"))
+    if nav:
+        kb.row(*nav)
+    kb.row(*[InlineKeyboardButton(("• " if view["status"] == s else "") + icon, callback_data=f"OQ|status|{s}") for s, icon, _ in ORDER_STATUSES],
+           InlineKeyboardButton(("• " if view["status"] is None else "") + "الكل", callback_data="OQ|status|all"))
+    kb.row(InlineKeyboardButton("🔘 حسب الزر", callback_data="OQ|buttons"),
+           InlineKeyboardButton("👤 حسب المستخدم", callback_data="OQ|user"),
+           InlineKeyboardButton("♻️ مسح التصفية", callback_data="OQ|clear"))
+    if view["user_id"] is not None:
+        kb.row(InlineKeyboardButton("📁 طلبات مؤرشفة لهذا المستخدم", callback_data="OQ|archive"))
+    bulk = [InlineKeyboardButton("✖️ إلغاء التحديد" if view["select"] else "☑️ تحديد", callback_data="OQ|select")]
+    if view["selected"]:
+        n = len(view["selected"])
+        bulk += [InlineKeyboardButton(f"✅ المحدد ({n})", callback_data="OQ|bulk|approve|sel"),
+                 InlineKeyboardButton(f"❌ المحدد ({n})", callback_data="OQ|bulk|reject|sel")]
+    kb.row(*bulk)
+    if view["button_id"] and view["status"] == "pending" and page["orders"]:
+        kb.row(InlineKeyboardButton("✅ كل طلبات الزر", callback_data="OQ|bulk|approve|button"),
+               InlineKeyboardButton("❌ كل طلبات الزر", callback_data="OQ|bulk|reject|button"))
+    btn = BUTTON_INDEX.get(view["button_id"]) if view["button_id"] else None
+    text = (f"📦 الطلبات{pending_badge()}\n"
+            f"الحالة: {STATUS_LABELS.get(view['status'], 'الكل')}\n"
+            f"الزر: {btn.get('text') if btn else (view['button_id'] or 'الكل')}\n"
+            f"المستخدم: {view['user_id'] or 'الكل'}")
+    if not page["orders"]:
+        text += "\n\nلا توجد طلبات بهذه التصفية."
+    if call is not None:
+        try:
+            bot.edit_message_text(text, chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=kb)
+            return
+        except Exception:
+            pass
+    bot.send_message(aid, text, reply_markup=kb)
+
+def handle_order_queue(call, parts):
+    aid = call.from_user.id
+    view = _order_view(aid)
+    cmd = parts[0] if parts else ""
+    arg = parts[1] if len(parts) > 1 else ""
+    if cmd == "older" and arg.isdigit():
+        show_order_queue(aid, call, before=int(arg))
+    elif cmd == "newer" and arg.isdigit():
+        show_order_queue(aid, call, after=int(arg))
+    elif cmd == "status":
+        view["status"] = arg if arg in STATUS_LABELS else None
+        show_order_queue(aid, call)
+    elif cmd == "buttons":
+        kb = InlineKeyboardMarkup()
+        for bid, b in BUTTON_INDEX.items():
+            data = f"OQ|button|{bid}"
+            # callback_data is limited to 64 bytes by Telegram
+            if b.get("type") == "request_info" and len(data.encode("utf-8")) <= 64:
+                kb.add(InlineKeyboardButton(b.get("text") or bid, callback_data=data))
+        bot.send_message(aid, "اختر الزر لعرض طلباته:", reply_markup=kb)
+    elif cmd == "button":
+        view["button_id"] = arg or None
+        show_order_queue(aid)
+    elif cmd == "user":
+        bot.send_message(aid, "أرسل ID المستخدم لعرض طلباته:")
+        admin_sessions[aid] = {"action": "order_filter_user"}
+    elif cmd == "clear":
+        view["button_id"] = view["user_id"] = None
+        show_order_queue(aid, call)
+    elif cmd == "archive" and view["user_id"] is not None:
+        orders = ARCHIVE.for_user(view["user_id"])
+        kb = InlineKeyboardMarkup()
+        for o in orders:
+            kb.add(InlineKeyboardButton(f"📁 {STATUS_ICONS.get(o.get('status'), '•')} {o.get('button_text')} {(o.get('handled_at') or '')[:10]}",
+                                        callback_data=f"ORDER|{o.get('order_id')}|view"))
+        bot.send_message(aid, f"📁 أرشيف المستخدم {view['user_id']}: {len(orders)} طلب" if orders else "لا توجد طلبات مؤرشفة لهذا المستخدم.",
+                         reply_markup=kb)
+    elif cmd == "select":
+        view["select"] = not view["select"]
+        view["selected"].clear()
+        show_order_queue(aid, call, *view["cursor"])
+    elif cmd == "pick" and arg:
+        view["selected"].symmetric_difference_update({arg})
+        show_order_queue(aid, call, *view["cursor"])
+    elif cmd == "bulk" and arg in BULK_STATUS:
+        scope = parts[2] if len(parts) > 2 else ""
+        if scope == "sel":
+            ids = list(view["selected"])
+            view["selected"].clear()
+            view["select"] = False
+            bulk_order_action(aid, ids, arg)
+            show_order_queue(aid, call)
+        elif scope == "button" and view["button_id"]:
+            # whole-button actions can touch hundreds of orders: confirm first
+            n = STORE.count_orders("pending", view["button_id"])
+            kb = InlineKeyboardMarkup()
+            kb.row(InlineKeyboardButton("نعم، نفّذ", callback_data=f"OQ|bulkgo|{arg}"),
+                   InlineKeyboardButton("إلغاء", callback_data="OQ|status|pending"))
+            verb = "قبول" if arg == "approve" else "رفض"
+            bot.send_message(aid, f"تأكيد {verb} {n} طلب قيد الانتظار لهذا الزر؟", reply_markup=kb)
+    elif cmd == "bulkgo" and arg in BULK_STATUS and view["button_id"]:
+        bid = view["button_id"]
+        n = STORE.count_orders("pending", bid)
+        ids = [o.get("order_id") for o in STORE.orders_page("pending", bid, None, None, None, max(n, 1))["orders"]]
+        bulk_order_action(aid, ids, arg)
+        show_order_queue(aid, call)
 
 # ---------------- admin orders actions ----------------
+BULK_STATUS = {"approve": "approved", "reject": "rejected"}
+OPEN_STATUSES = ("pending", "needs_more")
+
+def _order_summary(order):
+    info = order.get("info")
+    info_text = info.get("text") if isinstance(info, dict) and info.get("type")=="text" else ("صورة" if isinstance(info, dict) and info.get("type")=="photo" else str(info))
+    return (f"👤 {order.get('user_name')} ({order.get('user_id')})\n📌 {order.get('button_text')}\n📝 {info_text}\n"
+            + (f"💰 {order_price_text(order)}\n" if order.get("price") is not None else "")
+            + f"الحالة: {order.get('status')}")
+
+def order_price_text(order):
+    cur = order.get("currency") or "USD"
+    usd = order.get("price_usd")
+    usd_text = f"{format_number(usd)}$" if usd is not None else ""
+    if cur == "USD":
+        return usd_text
+    symbol = (PRICING.rates.get(cur) or {}).get("symbol") or DEFAULT_CURRENCY_SYMBOLS.get(cur, cur)
+    return f"{format_number(order.get('price'))} {symbol} ({usd_text} @ {format_number(order.get('rate') or 0)})"
+
+def order_result_text(order_id, status):
+    if status == "approved":
+        return f"✅ تمت الموافقة على طلبك (OrderID:{order_id}). سيتم إتمامه قريبًا."
+    return f"❌ تم رفض طلبك (OrderID:{order_id}). تواصل مع الأدمن."
+
+def bulk_order_action(aid, order_ids, action):
+    # one store write for the batch; user notifications go through the outbox
+    status = BULK_STATUS[action]
+    orders = [o for o in (STORE.get_order(oid) for oid in order_ids)
+              if o and o.get("status") in OPEN_STATUSES]
+    old = {o.get("order_id"): o.get("status") for o in orders}
+    # expect: an order another admin handled meanwhile is left alone
+    orders = STORE.update_orders(orders, {"status": status, "handled_at": datetime.now().isoformat()}, expect=OPEN_STATUSES)
+    if not orders:
+        bot.send_message(aid, "لا توجد طلبات قابلة للمعالجة.")
+        return
+    for o in orders:
+        STATS.order_updated(o, old[o.get("order_id")])
+    for o in orders:
+        OUTBOX.send(o["user_id"], order_result_text(o["order_id"], status))
+    skipped = len(order_ids) - len(orders)
+    bot.send_message(aid, f"{STATUS_ICONS[status]} تمت معالجة {len(orders)} طلب" + (f" (تم تخطي {skipped})" if skipped else "") + ".")
+
 def admin_order_action(call, order_id, action):
-    order = next((o for o in ORDERS if o.get("order_id")==order_id), None)
+    if not is_admin_user(call.from_user.id):
+        return
+    order = STORE.get_order(order_id)
     if not order:
-        bot.send_message(call.message.chat.id, "❌ لم أجد الطلب.")
+        archived = ARCHIVE.find(order_id) if action == "view" else None
+        if archived:
+            bot.send_message(call.message.chat.id, f"📁 {order_id} (مؤرشف)\n" + _order_summary(archived))
+        else:
+            bot.send_message(call.message.chat.id, "❌ لم أجد الطلب.")
         return
     if action == "view":
         kb = InlineKeyboardMarkup()
         kb.add(InlineKeyboardButton("✅ موافقة", callback_data=f"ORDER|{order_id}|approve"))
         kb.add(InlineKeyboardButton("❌ رفض", callback_data=f"ORDER|{order_id}|reject"))
         kb.add(InlineKeyboardButton("✏️ طلب تعديل", callback_data=f"ORDER|{order_id}|askmore"))
-        info = order.get("info")
-        info_text = info.get("text") if isinstance(info, dict) and info.get("type")=="text" else ("صورة" if isinstance(info, dict) and info.get("type")=="photo" else str(info))
-        bot.send_message(call.message.chat.id, f"📦 {order_id}\n👤 {order.get('user_name')} ({order.get('user_id')})\n📌 {order.get('button_text')}\n📝 {info_text}\nالحالة: {order.get('status')}", reply_markup=kb)
+        bot.send_message(call.message.chat.id, f"📦 {order_id}\n" + _order_summary(order), reply_markup=kb)
+        return
+    old = order.get("status")
+    if action in BULK_STATUS:
+        fields = {"status": BULK_STATUS[action], "handled_at": datetime.now().isoformat()}
+    elif action == "askmore":
+        fields = {"status": "needs_more"}
+    else:
+        return
+    if not STORE.update_order(order, fields, expect=OPEN_STATUSES):
+        # several admins get the same buttons: the first answer wins
+        cur = (STORE.get_order(order_id) or order).get("status")
+        bot.send_message(call.message.chat.id, f"{STATUS_ICONS.get(cur, '')} الطلب معالج مسبقاً ({STATUS_LABELS.get(cur, cur)}).")
         return
     if action == "approve":
-        order["status"] = "approved"
-        order["handled_at"] = datetime.now().isoformat()
-        save_json(ORDERS_FILE, ORDERS)
-        try:
-            bot.send_message(order["user_id"], f"✅ تمت الموافقة على طلبك (OrderID:{order_id}). سيتم إتمامه قريبًا.")
-        except Exception:
-            pass
+        STATS.order_updated(order, old)
+        OUTBOX.send(order["user_id"], order_result_text(order_id, "approved"))
         bot.send_message(call.message.chat.id, "تمت الموافقة.")
         return
     if action == "reject":
-        order["status"] = "rejected"
-        order["handled_at"] = datetime.now().isoformat()
-        save_json(ORDERS_FILE, ORDERS)
-        try:
-            bot.send_message(order["user_id"], f"❌ تم رفض طلبك (OrderID:{order_id}). تواصل مع الأدمن.")
-        except Exception:
-            pass
+        STATS.order_updated(order, old)
+        OUTBOX.send(order["user_id"], order_result_text(order_id, "rejected"))
         bot.send_message(call.message.chat.id, "تم الرفض.")
         return
     if action == "askmore":
-        order["status"] = "needs_more"
-        save_json(ORDERS_FILE, ORDERS)
+        STATS.order_updated(order, old)
         bot.send_message(call.message.chat.id, "✏️ أرسل نص السؤال/الطلب الإضافي للمستخدم:")
         admin_sessions[call.from_user.id] = {"action":"askmore_input","order_id":order_id}
         return
@@ -503,7 +3576,7 @@ def handle_admin_session_input(message, session):
         # askmore_input: admin wrote extra question -> send to user
         if act == "askmore_input":
             order_id = session.get("order_id")
-            order = next((o for o in ORDERS if o.get("order_id")==order_id), None)
+            order = STORE.get_order(order_id)
             if not order:
                 bot.send_message(aid, "لم أجد الطلب.")
                 admin_sessions.pop(aid, None)
@@ -513,6 +3586,18 @@ def handle_admin_session_input(message, session):
             admin_sessions.pop(aid, None)
             return
 
+        # order queue: filter by user id
+        if act == "order_filter_user":
+            try:
+                _order_view(aid)["user_id"] = int(message.text.strip())
+            except (ValueError, AttributeError):
+                bot.send_message(aid, "ID غير صالح.")
+                admin_sessions.pop(aid, None)
+                return
+            admin_sessions.pop(aid, None)
+            show_order_queue(aid)
+            return
+
         # adding a main button - multi step
         if act == "add_button_step1":
             session["temp"] = {"text": message.text.strip()}
@@ -544,7 +3629,7 @@ def handle_admin_session_input(message, session):
                 tmp = session.get("temp")
                 newb = {"id": tmp["id"], "text": tmp["text"], "type": "contact_admin", "image":"", "description":""}
                 BUTTONS.setdefault("main_menu", []).append(newb)
-                save_json(BUTTONS_FILE, BUTTONS)
+                save_buttons()
                 bot.send_message(aid, "✅ تم إضافة زر تواصل مع الأدمن.")
                 admin_sessions.pop(aid, None)
                 return
@@ -557,7 +3642,7 @@ def handle_admin_session_input(message, session):
             if txt.lower() == "done":
                 tmp = session.get("temp")
                 BUTTONS.setdefault("main_menu", []).append(tmp)
-                save_json(BUTTONS_FILE, BUTTONS)
+                save_buttons()
                 bot.send_message(aid, "✅ تم إضافة الزر مع العناصر الفرعية.")
                 admin_sessions.pop(aid, None)
                 return
@@ -595,7 +3680,7 @@ def handle_admin_session_input(message, session):
             tmp = session.get("temp")
             newb = {"id": tmp["id"], "text": tmp["text"], "type": "request_info", "info_request": prompt, "image":"", "description":""}
             BUTTONS.setdefault("main_menu", []).append(newb)
-            save_json(BUTTONS_FILE, BUTTONS)
+            save_buttons()
             bot.send_message(aid, "✅ تم إضافة زر request_info.")
             admin_sessions.pop(aid, None)
             return
@@ -613,7 +3698,7 @@ def handle_admin_session_input(message, session):
                 img = ""
             newb = {"id": tmp["id"], "text": tmp["text"], "type": "content", "content": tmp.get("content",""), "image": img, "description": ""}
             BUTTONS.setdefault("main_menu", []).append(newb)
-            save_json(BUTTONS_FILE, BUTTONS)
+            save_buttons()
             bot.send_message(aid, "✅ تم إضافة زر المحتوى.")
             admin_sessions.pop(aid, None)
             return
@@ -628,7 +3713,7 @@ def handle_admin_session_input(message, session):
                     removed = True
                     break
             if removed:
-                save_json(BUTTONS_FILE, BUTTONS)
+                save_buttons()
                 bot.send_message(aid, f"✅ تم حذف {bid}")
             else:
                 bot.send_message(aid, "لم أجد هذا المعرف.")
@@ -637,21 +3722,34 @@ def handle_admin_session_input(message, session):
 
         # set exchange rate
         if act == "set_rate_step1":
+            # "<rate>" for the chosen currency, or "<CODE> <rate> [symbol]" for any/new one
+            parts = (message.text or "").split()
+            code = session.get("currency")
+            if parts and not code:
+                code = parts.pop(0).upper()
             try:
-                rate = float(message.text.strip())
-            except:
-                bot.send_message(aid, "قيمة غير صحيحة. أرسل رقم مثل: 15000")
+                rate = float(parts[0])
+                if rate <= 0 or not code or not code.isalpha() or code == "USD":
+                    raise ValueError
+            except (ValueError, IndexError):
+                bot.send_message(aid, "قيمة غير صحيحة. أرسل مثل: 15000  أو  TRY 34 ₺")
                 admin_sessions.pop(aid, None)
                 return
-            CONFIG["EXCHANGE_RATE"] = rate
-            save_json(CONFIG_FILE, CONFIG)
-            bot.send_message(aid, f"✅ تم حفظ سعر الصرف: {rate} ل.س لكل $1")
-            # notify users about update (optional)
-            for uid in list(USERS.keys()):
-                try:
-                    bot.send_message(int(uid), f"🔁 تم تحديث سعر الصرف إلى {rate} ل.س لكل $1")
-                except Exception:
-                    pass
+            PRICING.set_rate(code, rate, by=aid, symbol=parts[1] if len(parts) > 1 else None)
+            kb = InlineKeyboardMarkup()
+            kb.add(InlineKeyboardButton("📢 إعلام مستخدمي هذه العملة", callback_data=f"ADMIN|rate_notify|{code}"))
+            bot.send_message(aid, f"✅ تم حفظ سعر الصرف: {format_number(rate)} {PRICING.rates[code]['symbol']} لكل $1", reply_markup=kb)
+            admin_sessions.pop(aid, None)
+            return
+
+        # broadcast: queue the text for every user
+        if act == "broadcast_step1":
+            text = message.text or message.caption or ""
+            if not text.strip():
+                bot.send_message(aid, "أرسل نص البث (نص فقط).")
+                return
+            job_id = BROADCASTER.submit(text, aid)
+            bot.send_message(aid, f"📢 تمت جدولة البث ({job_id}) لـ {len(USERS)} مستخدم. سيصلك التقدم هنا.")
             admin_sessions.pop(aid, None)
             return
 
@@ -661,12 +3759,12 @@ def handle_admin_session_input(message, session):
                 cols = int(message.text.strip())
                 if cols < 1:
                     raise ValueError()
-            except:
+            except (ValueError, AttributeError):
                 bot.send_message(aid, "أدخل رقمًا صحيحًا للأعمدة.")
                 admin_sessions.pop(aid, None)
                 return
             CONFIG.setdefault("BUTTON_LAYOUT", {})["grid_columns"] = cols
-            save_json(CONFIG_FILE, CONFIG)
+            save_config()
             bot.send_message(aid, f"✅ تم تحديث أعمدة الشبكة إلى: {cols}")
             admin_sessions.pop(aid, None)
             return
@@ -675,12 +3773,12 @@ def handle_admin_session_input(message, session):
         if act == "add_admin_step1":
             try:
                 new_id = int(message.text.strip())
-            except:
+            except (ValueError, AttributeError):
                 bot.send_message(aid, "ID غير صالح.")
                 admin_sessions.pop(aid, None)
                 return
             ADMINS.setdefault("admins", []).append({"id": new_id, "name": message.from_user.full_name, "perms": ["all"]})
-            save_json("admins.json", ADMINS)
+            STORE.save_admins()
             bot.send_message(aid, f"✅ تم إضافة الأدمن {new_id}")
             admin_sessions.pop(aid, None)
             return
@@ -695,7 +3793,7 @@ def handle_admin_session_input(message, session):
                 return
             # save description (text under image)
             main_btn["description"] = message.text
-            save_json(BUTTONS_FILE, BUTTONS)
+            save_buttons()
             bot.send_message(aid, f"✅ تم إضافة/تعديل الوصف للنقطة الرئيسية ({main_btn.get('id')}).")
             admin_sessions.pop(aid, None)
             return
@@ -709,8 +3807,9 @@ def handle_admin_session_input(message, session):
                 admin_sessions.pop(aid, None)
                 return
             url = message.text.strip()
+            MEDIA.image_changed(url)
             main_btn["image"] = url
-            save_json(BUTTONS_FILE, BUTTONS)
+            save_buttons()
             bot.send_message(aid, f"✅ تم إضافة/تحديث صورة الزر الرئيسي ({main_btn.get('id')}).")
             admin_sessions.pop(aid, None)
             return
@@ -728,7 +3827,7 @@ def handle_admin_session_input(message, session):
                 return
             file_id = message.photo[-1].file_id
             main_btn["image"] = file_id  # store file_id
-            save_json(BUTTONS_FILE, BUTTONS)
+            save_buttons()
             bot.send_message(aid, f"✅ تم رفع الصورة وحفظها كصورة للزر ({main_btn.get('id')}).")
             admin_sessions.pop(aid, None)
             return
@@ -756,7 +3855,7 @@ def handle_admin_session_input(message, session):
                 return
             prompt = message.text
             main_btn["info_request"] = prompt
-            save_json(BUTTONS_FILE, BUTTONS)
+            save_buttons()
             bot.send_message(aid, f"✅ تم تحويل الزر الرئيسي إلى طلب معلومات مع النص المحدد.")
             admin_sessions.pop(aid, None)
             return
@@ -774,7 +3873,7 @@ def cmd_admin(m):
         return
     kb = InlineKeyboardMarkup()
     kb.add(InlineKeyboardButton("🧭 إدارة الأزرار", callback_data="ADMIN|manage_buttons"))
-    kb.add(InlineKeyboardButton("📦 الطلبات", callback_data="ADMIN|manage_orders"))
+    kb.add(InlineKeyboardButton("📦 الطلبات" + pending_badge(), callback_data="ADMIN|manage_orders"))
     kb.add(InlineKeyboardButton("📢 بث", callback_data="ADMIN|broadcast"))
     kb.add(InlineKeyboardButton("💱 تعيين سعر الصرف", callback_data="ADMIN|set_rate"))
     kb.add(InlineKeyboardButton("🔲 شكل الأزرار", callback_data="ADMIN|set_layout"))
@@ -783,6 +3882,25 @@ def cmd_admin(m):
     kb.add(InlineKeyboardButton("⏯ تشغيل/إيقاف البوت", callback_data="ADMIN|toggle"))
     bot.send_message(m.chat.id, "لوحة الأدمن — اختر:", reply_markup=kb)
 
+STATS_WINDOWS = {"24h": ("24 ساعة", 24), "7d": ("7 أيام", 7 * 24), "30d": ("30 يوم", 30 * 24)}
+
+def _status_line(counts):
+    return " ".join(f"{STATUS_ICONS.get(s, s)} {counts.get(s, 0)}" for s, _, _ in ORDER_STATUSES)
+
+def _duration(seconds):
+    if seconds == float("inf"):
+        return "> أسبوع"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}د"
+    if seconds < 86400:
+        return f"{seconds / 3600:.0f}س"
+    return f"{seconds / 86400:.0f}ي"
+
+def _latency_line(h):
+    if not h.count:
+        return "لا توجد بيانات"
+    return " ".join(f"p{int(q * 100)}≤{_duration(h.quantile(q))}" for q in (0.5, 0.9, 0.99))
+
 def handle_admin_action(call, action):
     aid = call.from_user.id
     if action == "manage_buttons":
@@ -795,21 +3913,53 @@ def handle_admin_action(call, action):
         bot.send_message(aid, "إدارة الأزرار:", reply_markup=kb)
         return
     if action == "manage_orders":
-        if not ORDERS:
-            bot.send_message(aid, "لا توجد طلبات حالياً.")
-            return
-        kb = InlineKeyboardMarkup()
-        for o in ORDERS[-40:][::-1]:
-            kb.add(InlineKeyboardButton(f"{o.get('button_text')} - {o.get('user_name')}", callback_data=f"ORDER|{o.get('order_id')}|view"))
-        bot.send_message(aid, "قائمة الطلبات:", reply_markup=kb)
+        show_order_queue(aid)
         return
     if action == "broadcast":
         bot.send_message(aid, "✏️ أرسل نص البث (HTML مسموح):")
         admin_sessions[aid] = {"action":"broadcast_step1"}
         return
     if action == "set_rate":
-        bot.send_message(aid, "أرسل سعر الصرف الآن (مثال: 15000):")
-        admin_sessions[aid] = {"action":"set_rate_step1"}
+        kb = InlineKeyboardMarkup()
+        lines = ["💱 أسعار الصرف (لكل $1):"]
+        for code in PRICING.currencies():
+            r = PRICING.rates[code]
+            last = PRICING.last_change(code)
+            lines.append(f"• {code}: {format_number(r['rate'])} {r.get('symbol', '')}" + (f" — {last['at'][:16].replace('T', ' ')}" if last else ""))
+            kb.row(InlineKeyboardButton(f"✏️ {code}", callback_data=f"ADMIN|rate_edit|{code}"),
+                   InlineKeyboardButton(f"🗑 {code}", callback_data=f"ADMIN|rate_del|{code}"))
+        if len(lines) == 1:
+            lines.append("لا توجد عملات بعد.")
+        kb.row(InlineKeyboardButton("➕ عملة", callback_data="ADMIN|rate_add"),
+               InlineKeyboardButton("📜 السجل", callback_data="ADMIN|rate_history"))
+        bot.send_message(aid, "\n".join(lines), reply_markup=kb)
+        return
+    if action.startswith("rate_edit|"):
+        code = action.split("|", 1)[1]
+        bot.send_message(aid, f"أرسل سعر {code} مقابل $1 (مثال: 15000):")
+        admin_sessions[aid] = {"action": "set_rate_step1", "currency": code}
+        return
+    if action == "rate_add":
+        bot.send_message(aid, "أرسل رمز العملة والسعر مقابل $1 والرمز المعروض اختيارياً، مثال: TRY 34 ₺")
+        admin_sessions[aid] = {"action": "set_rate_step1"}
+        return
+    if action.startswith("rate_del|"):
+        code = action.split("|", 1)[1]
+        bot.send_message(aid, f"🗑 تم حذف {code}." if PRICING.remove(code, by=aid) else "العملة غير موجودة.")
+        return
+    if action == "rate_history":
+        rows = PRICING.history[-20:]
+        lines = ["📜 آخر تغييرات الأسعار:"] + [f"{h['at'][:16].replace('T', ' ')} {h['currency']}: {format_number(h['rate']) if h.get('rate') is not None else 'حذف'}"
+                                             for h in reversed(rows)]
+        bot.send_message(aid, "\n".join(lines) if rows else "لا يوجد سجل.")
+        return
+    if action.startswith("rate_notify|"):
+        code = action.split("|", 1)[1]
+        r = PRICING.rates.get(code)
+        if r:
+            job_id = BROADCASTER.submit(f"🔁 تم تحديث سعر الصرف إلى {format_number(r['rate'])} {r.get('symbol', '')} لكل $1",
+                                        aid, kind="rate", currency=code)
+            bot.send_message(aid, f"📢 تمت جدولة الإشعار ({job_id}) لمستخدمي {code}.")
         return
     if action == "set_layout":
         kb = InlineKeyboardMarkup()
@@ -825,18 +3975,31 @@ def handle_admin_action(call, action):
         bot.send_message(aid, "إدارة المشرفين:", reply_markup=kb)
         return
     if action == "stats":
-        users_count = len(USERS)
-        orders_count = len(ORDERS)
-        counts = {}
-        for o in ORDERS:
-            key = o.get("button_text","unknown")
-            counts[key] = counts.get(key,0)+1
+        t = stats_view().totals()
+        counts = t["buttons"]
         most_used = max(counts.items(), key=lambda x:x[1])[0] if counts else "لا يوجد"
-        bot.send_message(aid, f"📊 إحصائيات:\n👥 المستخدمين: {users_count}\n📦 الطلبات: {orders_count}\n⭐ الأكثر استخدامًا: {most_used}")
+        kb = InlineKeyboardMarkup()
+        kb.row(*[InlineKeyboardButton(label, callback_data=f"ADMIN|stats_{key}") for key, (label, _) in STATS_WINDOWS.items()])
+        bot.send_message(aid, f"📊 إحصائيات:\n👥 المستخدمين: {len(USERS)}\n🟢 نشطون اليوم: {t['dau']}\n📦 الطلبات: {t['total']}\n"
+                              f"{_status_line(t['status'])}\n⭐ الأكثر استخدامًا: {most_used}\n"
+                              f"⏱ زمن الموافقة: {_latency_line(t['approval'])}", reply_markup=kb)
+        return
+    if action.startswith("stats_") and action[6:] in STATS_WINDOWS:
+        label, hours = STATS_WINDOWS[action[6:]]
+        w = stats_view().window(hours)
+        top = sorted(w["created"].items(), key=lambda x: -x[1])[:5]
+        lines = [f"📊 آخر {label}:", f"📦 طلبات جديدة: {sum(w['created'].values())}",
+                 f"معالجة: {_status_line(w['status'])}",
+                 f"⏱ زمن الموافقة: {_latency_line(w['approval'])}",
+                 f"🟢 متوسط النشطين يومياً: {w['dau_avg']:.0f} (الأعلى {w['dau_max']})"]
+        if top:
+            lines.append("⭐ الأزرار:")
+            lines += [f"  • {text}: {n}" for text, n in top]
+        bot.send_message(aid, "\n".join(lines))
         return
     if action == "toggle":
         CONFIG["BOT_STATUS"] = "off" if CONFIG.get("BOT_STATUS","on")=="on" else "on"
-        save_json(CONFIG_FILE, CONFIG)
+        save_config()
         bot.send_message(aid, f"🔁 تم تغيير حالة البوت إلى: {CONFIG['BOT_STATUS']}")
         return
     if action == "add_button":
@@ -934,15 +4097,15 @@ def layout_handlers(call):
         return
     if action == "layout_vertical":
         CONFIG.setdefault("BUTTON_LAYOUT", {})["type"] = "vertical"
-        save_json(CONFIG_FILE, CONFIG)
+        save_config()
         bot.send_message(aid, "✅ تم تعيين شكل العرض: vertical")
     elif action == "layout_horizontal":
         CONFIG.setdefault("BUTTON_LAYOUT", {})["type"] = "horizontal"
-        save_json(CONFIG_FILE, CONFIG)
+        save_config()
         bot.send_message(aid, "✅ تم تعيين شكل العرض: horizontal")
     elif action == "layout_grid":
         CONFIG.setdefault("BUTTON_LAYOUT", {})["type"] = "grid"
-        save_json(CONFIG_FILE, CONFIG)
+        save_config()
         bot.send_message(aid, "أرسل عدد الأعمدة للشبكة (مثال: 2):")
         admin_sessions[aid] = {"action":"set_layout_columns"}
     bot.answer_callback_query(call.id)
@@ -950,24 +4113,217 @@ def layout_handlers(call):
 # ---------------- admin session helpers (broadcast etc.) ----------------
 # (already handled in handle_admin_session_input) - no duplication here
 
+# ---------------- webhook server ----------------
+# Telegram POSTs each update here; we check the secret token, hand the update
+# to DISPATCHER and answer 200 right away (503 when the backlog is full so
+# Telegram retries later).
+class WebhookHandler(BaseHTTPRequestHandler):
+    path_prefix = "/telegram"
+    secret = ""
+
+    def log_message(self, fmt, *args):
+        logger.debug("webhook: " + fmt, *args)
+
+    def _reply(self, code):
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0] != self.path_prefix:
+            self._reply(404)
+            return
+        if self.secret and not hmac.compare_digest(self.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.secret):
+            self._reply(403)
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            update = telebot.types.Update.de_json(body.decode("utf-8"))
+        except Exception as e:
+            logger.warning("bad webhook payload: %s", e)
+            self._reply(400)
+            return
+        self._reply(200 if DISPATCHER.submit(update, block=False) else 503)
+
+def make_webhook_server(host, port, path, secret="", certfile="", keyfile=""):
+    handler = type("BotWebhookHandler", (WebhookHandler,), {"path_prefix": path, "secret": secret})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if certfile:
+        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ctx.load_cert_chain(certfile, keyfile or None)
+        server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    return server
+
+def run_webhook():
+    path = CONFIG.get("WEBHOOK_PATH", "/telegram") or "/telegram"
+    secret = CONFIG.get("WEBHOOK_SECRET", "") or ""
+    server = make_webhook_server(CONFIG.get("WEBHOOK_HOST", "0.0.0.0"), int(CONFIG.get("WEBHOOK_PORT", 8443)), path,
+                                 secret, CONFIG.get("WEBHOOK_CERT", ""), CONFIG.get("WEBHOOK_KEY", ""))
+    if CONFIG.get("WEBHOOK_URL"):
+        bot.set_webhook(url=CONFIG["WEBHOOK_URL"], secret_token=secret or None, drop_pending_updates=True)
+    logger.info("Webhook listening on %s:%s%s", *server.server_address[:2], path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
 # ---------------- start polling ----------------
-def save_all():
-    save_json(CONFIG_FILE, CONFIG)
-    save_json(BUTTONS_FILE, BUTTONS)
-    save_json(SERVICES_FILE, SERVICES)
-    save_json(USERS_FILE, USERS)
-    save_json(ORDERS_FILE, ORDERS)
-    save_json("admins.json", ADMINS)
+def rss_mb():
+    # current resident set size (Linux), else the peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def log_startup():
+    logger.info("Started in %.2fs, RSS %.1f MB, %d users (%d cached)", time.perf_counter() - BOOT_STARTED, rss_mb(),
+                len(USERS), USERS.stats()["cached"])
 
 def restore_schedules():
-    # placeholder if you want to add schedule restore behavior
-    return
+    BROADCASTER.resume()
+
+# ---------------- multi-process workers (main_workers.py) ----------------
+# the supervisor routes every update by chat id to one worker, so a chat's
+# updates, its admin_sessions/order_views and its flood bucket stay in one
+# process. Orders live only in SQLite; the cached users/admins/buttons and
+# config/rates are re-read when another worker logs a change. Jobs that must
+# run once (compaction, archiving, pruning the change log) run on the leader:
+# whichever worker holds an flock on LEADER_LOCK_FILE.
+LEADER_JOBS = ("compact_store", "archive_orders", "prune_changes")
+
+class ChangeFeed:
+    def __init__(self, store, interval=0.5):
+        self.store = store
+        self.interval = interval
+        self.seq = store.last_change()
+        self.applied = 0
+
+    def poll(self):
+        rows = self.store.changes_since(self.seq)
+        if not rows:
+            return 0
+        self.seq = rows[-1][0]
+        kinds = {kind for _, kind, _ in rows}
+        users = {key for _, kind, key in rows if kind == "user"}
+        if users:
+            # a profile this process changed but hasn't flushed yet wins
+            self.store.reload_users(users - WRITE_BEHIND.pending())
+        if "buttons" in kinds:
+            self.store.reload_buttons()
+            rebuild_button_index()
+        if "admins" in kinds:
+            self.store.reload_admins()
+        if "config" in kinds:
+            reload_config()
+        if "rates" in kinds:
+            PRICING.reload()
+        self.applied += len(rows)
+        return len(rows)
+
+    def start(self):
+        threading.Thread(target=self._loop, name="change-feed", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.exception("change feed failed: %s", e)
+
+class LeaderElection:
+    def __init__(self, path, on_elected, interval=5.0):
+        self.path = path
+        self.on_elected = on_elected
+        self.interval = interval
+        self.leader = False
+        self._fd = None
+
+    def try_acquire(self):
+        import fcntl
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        # held until this process exits (the kernel drops the lock with the fd)
+        os.ftruncate(self._fd, 0)
+        os.write(self._fd, f"{os.getpid()} worker {WORKER_ID}\n".encode())
+        self.leader = True
+        logger.info("worker %s is the leader", WORKER_ID)
+        self.on_elected()
+        return True
+
+    def start(self):
+        if not self.try_acquire():
+            threading.Thread(target=self._loop, name="leader-election", daemon=True).start()
+
+    def _loop(self):
+        while not self.leader:
+            time.sleep(self.interval)
+            try:
+                self.try_acquire()
+            except Exception as e:
+                logger.exception("leader election failed: %s", e)
+
+def prune_changes():
+    try:
+        STORE.prune_changes()
+    except Exception as e:
+        logger.exception("Pruning the change log failed: %s", e)
+
+def _on_elected():
+    for job_id in LEADER_JOBS:
+        scheduler.resume_job(job_id)
+
+def run_worker(updates, ready=None):
+    """Body of one main_workers.py process: handles the updates routed to it."""
+    if STORE.name != "sqlite":
+        raise SystemExit("main_workers.py needs STORAGE_BACKEND=sqlite")
+    scheduler.add_job(prune_changes, "interval", minutes=10, id="prune_changes")
+    for job_id in LEADER_JOBS:
+        scheduler.pause_job(job_id)
+    ChangeFeed(STORE, float(CONFIG.get("WORKER_SYNC_SECONDS", 0.5) or 0.5)).start()
+    LeaderElection(LEADER_LOCK_FILE, _on_elected).start()
+    restore_schedules()  # this worker's own broadcasts file
+    install_dispatcher()
+    if METRICS.enabled:
+        start_metrics_server(int(CONFIG.get("METRICS_PORT", 9108)) + int(WORKER_ID))
+    log_startup()
+    if ready is not None:
+        ready.set()
+    try:
+        while True:
+            raw = updates.get()
+            if raw is None:
+                break
+            DISPATCHER.submit(telebot.types.Update.de_json(raw))
+    finally:
+        DISPATCHER.stop(timeout=10)
+        WRITE_BEHIND.stop()
+        save_stats()
 
 def main():
-    save_all()
     restore_schedules()
-    logger.info("Starting polling...")
-    bot.infinity_polling(skip_pending=True)
+    install_dispatcher()
+    if METRICS.enabled:
+        start_metrics_server()
+    log_startup()
+    try:
+        if CONFIG.get("MODE", "polling") == "webhook":
+            run_webhook()
+        else:
+            bot.remove_webhook()
+            logger.info("Starting polling with %d workers...", DISPATCHER.workers)
+            bot.infinity_polling(skip_pending=True)
+    finally:
+        DISPATCHER.stop(timeout=10)
+        WRITE_BEHIND.stop()
+        save_stats()
 
 if __name__ == "__main__":
     main()
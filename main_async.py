@@ -0,0 +1,251 @@
+# main_async.py
+# تشغيل غير متزامن (asyncio) لنفس البوت: نفس القوائم والطلبات ولوحة الأدمن الموجودة في main.py
+# - كل طلبات Bot API تمر عبر جلسة aiohttp واحدة (connection pool مشترك)
+# - منطق المعالجات يعمل في عدد صغير من الخيوط (مع التخزين) بدون انتظار الشبكة،
+#   أما انتظار الشبكة فيتم داخل حلقة asyncio فقط
+# - تحديثات نفس المحادثة تُعالج بالترتيب، ورسائلها الصادرة تُرسل بالترتيب
+#
+# تثبيت: pip install aiohttp
+# تشغيل: python main_async.py
+# للتجربة محلياً: python fake_api.py ثم "API_URL": "http://127.0.0.1:8081" في config.json
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+except ImportError:
+    raise SystemExit("main_async.py يحتاج aiohttp: pip install aiohttp")
+
+import telebot
+from telebot import types
+
+import main
+
+logger = logging.getLogger("main_async")
+
+# bot methods used by the handlers -> positional parameter names
+SIGNATURES = {
+    "send_message": ("chat_id", "text"),
+    "edit_message_text": ("text", "chat_id", "message_id"),
+    "send_photo": ("chat_id", "photo"),
+    "answer_callback_query": ("callback_query_id", "text"),
+}
+PARSE_MODE_METHODS = ("send_message", "edit_message_text", "send_photo")
+
+_tls = threading.local()  # in_handler: set on executor threads running handlers
+
+def _camel(name):
+    first, *rest = name.split("_")
+    return first + "".join(p.title() for p in rest)
+
+def _form(params):
+    out = {}
+    for k, v in params.items():
+        if v is None:
+            continue
+        if hasattr(v, "to_json"):
+            v = v.to_json()
+        elif isinstance(v, bool):
+            v = "true" if v else "false"
+        out[k] = str(v)
+    return out
+
+class AsyncApi:
+    """Bot API over one shared aiohttp session."""
+
+    def __init__(self, token, base_url, pool_size=100):
+        self.url = f"{base_url}/bot{token}/"
+        self.pool_size = pool_size
+        self.session = None
+
+    async def open(self):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60))
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def call(self, method, params=None, timeout=None):
+        # same timeouts / backoff / circuit breaker / counters as the sync client
+        policy = main.API
+        polling = method == "getUpdates"
+        attempts = 1 if polling else policy.retries + 1
+        for attempt in range(attempts):
+            if not polling and not policy.breaker.allow():
+                policy.record(method, "circuit_open")
+                raise main.ApiUnavailable(f"Telegram API unavailable, retrying in {policy.breaker.remaining():.0f}s")
+            t0 = time.perf_counter()
+            try:
+                result = await self._call(method, params, timeout or policy.timeout_for(method))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                outcome, wait = policy.classify(method, e, attempt)
+                policy.record(method, outcome, time.perf_counter() - t0)
+                if wait is None or attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(wait)
+                continue
+            policy.breaker.success()
+            policy.record(method, "ok", time.perf_counter() - t0)
+            return result
+
+    async def _call(self, method, params, timeout):
+        try:
+            async with self.session.post(self.url + method, data=_form(params or {}),
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                payload = await resp.json(content_type=None)
+        except aiohttp.ClientConnectionError as e:
+            # builtin ConnectionError is what main.API.classify treats as a network failure
+            raise ConnectionError(str(e)) from e
+        if not payload.get("ok"):
+            raise telebot.apihelper.ApiTelegramException(method, None, payload)
+        return payload.get("result")
+
+class AsyncRuntime:
+    def __init__(self, bot, api, handler_threads=4, max_pending=1000):
+        self.bot = bot
+        self.api = api
+        self.loop = None
+        self.executor = ThreadPoolExecutor(max_workers=handler_threads, thread_name_prefix="handler")
+        self.max_pending = max_pending
+        self._slots = None
+        self._inbound = {}   # chat id -> tail task of that chat's update chain
+        self._outbound = {}  # chat id -> tail task of that chat's outgoing calls
+
+    # ---- outgoing calls (called from handler / background threads) ----
+    def install(self):
+        for name in SIGNATURES:
+            setattr(self.bot, name, self._make_method(name))
+
+    def _make_method(self, name):
+        def method(*args, **kwargs):
+            params = dict(zip(SIGNATURES[name], args))
+            params.update(kwargs)
+            if name in PARSE_MODE_METHODS and params.get("parse_mode") is None:
+                params["parse_mode"] = self.bot.parse_mode
+            if getattr(_tls, "in_handler", False):
+                # handlers don't use results: queue it in chat order and move on
+                chat = params.get("chat_id")
+                fut = asyncio.run_coroutine_threadsafe(self._chained(self._outbound, chat, self._send(name, params)), self.loop)
+                fut.add_done_callback(self._log_failure)
+                return None
+            # broadcaster / scheduler threads need the result (and 429/403 errors)
+            result = asyncio.run_coroutine_threadsafe(self.api.call(_camel(name), params), self.loop).result()
+            return types.Message.de_json(result) if isinstance(result, dict) and "message_id" in result else result
+        method.__name__ = name
+        return method
+
+    @staticmethod
+    def _log_failure(fut):
+        if not fut.cancelled() and fut.exception():
+            logger.warning("API call failed: %s", fut.exception())
+
+    async def _send(self, name, params):
+        try:
+            result = await self.api.call(_camel(name), params)
+            if name == "send_photo" and isinstance(result, dict) and result.get("photo"):
+                # handlers don't see results here: record the file_id for main.MEDIA
+                main.MEDIA.remember(params.get("photo"), result["photo"][-1].get("file_id"))
+            return result
+        except telebot.apihelper.ApiTelegramException as e:
+            # same fallbacks the sync handlers do in their except branches; a
+            # 403/429/5xx is about the chat or the API and is not retried as text
+            if e.error_code != 400:
+                raise
+            if name == "edit_message_text" and "not modified" not in (e.description or ""):
+                fb = {k: params.get(k) for k in ("chat_id", "text", "parse_mode", "reply_markup")}
+                return await self.api.call("sendMessage", fb)
+            if name == "send_photo":
+                if main.is_bad_file_id(e):
+                    urls = main.MEDIA.forget_file_id(params.get("photo"))
+                    if urls:
+                        return await self._send(name, dict(params, photo=urls[0]))
+                fb = {"chat_id": params.get("chat_id"), "text": params.get("caption") or "",
+                      "parse_mode": params.get("parse_mode"), "reply_markup": params.get("reply_markup")}
+                return await self.api.call("sendMessage", fb)
+            raise
+
+    async def _chained(self, tails, key, coro):
+        if key is None:
+            return await coro
+        prev = tails.get(key)
+        me = asyncio.current_task()
+        tails[key] = me
+        try:
+            if prev is not None:
+                await asyncio.wait([prev])
+            return await coro
+        finally:
+            if tails.get(key) is me:
+                del tails[key]
+
+    # ---- incoming updates ----
+    def _process(self, update):
+        _tls.in_handler = True
+        try:
+            main.handle_update(update)
+        except Exception as e:
+            logger.exception("update %s failed: %s", update.update_id, e)
+
+    async def _handle(self, update):
+        try:
+            await self.loop.run_in_executor(self.executor, self._process, update)
+        finally:
+            self._slots.release()
+
+    async def poll(self, skip_pending=True):
+        offset = 0
+        if skip_pending:
+            last = await self.api.call("getUpdates", {"offset": -1, "timeout": 0})
+            if last:
+                offset = last[-1]["update_id"] + 1
+        while True:
+            try:
+                raw = await self.api.call("getUpdates", {"offset": offset, "timeout": 25}, timeout=40)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(3)
+                continue
+            for item in raw:
+                offset = item["update_id"] + 1
+                await self._slots.acquire()
+                update = types.Update.de_json(item)
+                asyncio.ensure_future(self._chained(self._inbound, main.update_chat_id(update), self._handle(update)))
+
+    async def run(self, skip_pending=True, on_ready=None):
+        self.loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        await self.api.open()
+        self.install()
+        if on_ready:
+            on_ready()
+        try:
+            await self.poll(skip_pending)
+        finally:
+            await self.api.close()
+            self.executor.shutdown(wait=False)
+
+def run():
+    if main.METRICS.enabled:
+        main.start_metrics_server()
+    main.log_startup()
+    api = AsyncApi(main.BOT_TOKEN, main.API_URL, pool_size=int(main.CONFIG.get("HTTP_POOL_SIZE", 100) or 100))
+    runtime = AsyncRuntime(main.bot, api,
+                           handler_threads=int(main.CONFIG.get("ASYNC_HANDLER_THREADS", 4) or 4),
+                           max_pending=int(main.CONFIG.get("MAX_PENDING_UPDATES", 1000) or 1000))
+    logger.info("Starting asyncio polling...")
+    try:
+        # resume broadcasts only once the async API is installed on the bot
+        asyncio.run(runtime.run(on_ready=main.restore_schedules))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,210 @@
+# main_workers.py
+# تشغيل البوت بعدة عمليات (processes) على نفس الجهاز تتشارك قاعدة SQLite واحدة:
+# - عملية مشرفة واحدة تستقبل التحديثات (polling أو webhook) وتوزعها على العمّال
+#   حسب رقم المحادثة، فتبقى تحديثات المحادثة الواحدة بالترتيب وفي نفس العملية
+# - كل عامل يشغّل معالجات main.py كما هي؛ الطلبات في SQLite (معاملات + أقفال بين العمليات)
+#   وتغييرات المستخدمين/الأزرار/الأدمن/الإعدادات/الأسعار تصل للعمّال الآخرين عبر جدول changes
+# - مهام الجدولة المشتركة (ضغط/أرشفة) يشغّلها القائد فقط: العامل الذي يملك قفل leader.lock
+# - عامل يتوقف يُعاد تشغيله بنفس الرقم (المحادثات نفسها تبقى عنده)
+#
+# يحتاج: "STORAGE_BACKEND": "sqlite" في config.json
+# تشغيل: python main_workers.py --workers 4
+
+import argparse
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+CONFIG_FILE = "config.json"
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("main_workers")
+
+def raw_chat_id(raw):
+    # same choice as main.update_chat_id, on the raw JSON (no telebot parsing here)
+    for key in ("message", "edited_message", "callback_query"):
+        obj = raw.get(key)
+        if not obj:
+            continue
+        msg = obj.get("message", obj) if key == "callback_query" else obj
+        chat = msg.get("chat")
+        if chat:
+            return chat.get("id")
+        return (obj.get("from") or {}).get("id")
+    return None
+
+def worker_main(index, count, updates, ready):
+    os.environ["BOT_WORKER_ID"] = str(index)
+    os.environ["BOT_WORKER_COUNT"] = str(count)
+    import main
+    try:
+        main.run_worker(updates, ready)
+    except KeyboardInterrupt:
+        pass
+
+class Supervisor:
+    def __init__(self, workers, config, max_pending=1000):
+        self.count = workers
+        self.config = config
+        self.ctx = multiprocessing.get_context("spawn")
+        # one bounded queue per worker: a slow worker only backs up its own chats
+        self.queues = [self.ctx.Queue(max(max_pending // workers, 10)) for _ in range(workers)]
+        self.ready = [self.ctx.Event() for _ in range(workers)]
+        self.procs = [None] * workers
+        self.routed = 0
+        self.stopping = threading.Event()
+
+    def _spawn(self, i):
+        self.ready[i].clear()
+        p = self.ctx.Process(target=worker_main, args=(i, self.count, self.queues[i], self.ready[i]),
+                             name=f"bot-worker-{i}", daemon=True)
+        p.start()
+        self.procs[i] = p
+        return p
+
+    def start(self, timeout=120):
+        # worker 0 alone first: it creates / migrates the database
+        self._spawn(0)
+        self.ready[0].wait(timeout)
+        for i in range(1, self.count):
+            self._spawn(i)
+        for ev in self.ready:
+            ev.wait(timeout)
+        logger.info("%d workers ready", self.count)
+        threading.Thread(target=self._watch, name="supervisor", daemon=True).start()
+
+    def _watch(self, interval=1.0):
+        while not self.stopping.wait(interval):
+            self.check()
+
+    def check(self):
+        for i, p in enumerate(self.procs):
+            if self.stopping.is_set():
+                return
+            if p is not None and not p.is_alive():
+                logger.warning("worker %d exited (code %s), restarting", i, p.exitcode)
+                # a worker killed inside Queue.get() leaves the queue's read lock held forever:
+                # the replacement gets a fresh queue, updates still buffered in the old one are lost
+                old = self.queues[i]
+                try:
+                    lost = old.qsize()
+                except NotImplementedError:
+                    lost = "?"
+                if lost:
+                    logger.warning("worker %d: %s queued updates dropped", i, lost)
+                self.queues[i] = self.ctx.Queue(old._maxsize)
+                self._spawn(i)
+
+    def route(self, raw):
+        chat = raw_chat_id(raw)
+        self.queues[(chat or 0) % self.count].put(raw)
+        self.routed += 1
+
+    def stop(self, timeout=15):
+        self.stopping.set()
+        for q in self.queues:
+            q.put(None)
+        for p in self.procs:
+            if p is not None:
+                p.join(timeout)
+                if p.is_alive():
+                    p.terminate()
+
+# ---------------- update intake ----------------
+def api_base(config):
+    return (config.get("API_URL") or "https://api.telegram.org").rstrip("/") + f"/bot{config['BOT_TOKEN']}/"
+
+def poll(sup, config, skip_pending=True):
+    session = requests.Session()
+    url = api_base(config)
+    session.post(url + "deleteWebhook", timeout=30)
+    offset = 0
+    if skip_pending:
+        last = session.post(url + "getUpdates", data={"offset": -1, "timeout": 0}, timeout=30).json().get("result") or []
+        if last:
+            offset = last[-1]["update_id"] + 1
+    logger.info("Polling for %d workers...", sup.count)
+    while not sup.stopping.is_set():
+        try:
+            resp = session.post(url + "getUpdates", data={"offset": offset, "timeout": 25}, timeout=40).json()
+        except Exception as e:
+            logger.warning("getUpdates failed: %s", e)
+            time.sleep(3)
+            continue
+        if sup.stopping.is_set():
+            break  # not confirmed: the next getUpdates (after a restart) receives them again
+        for raw in resp.get("result") or []:
+            offset = raw["update_id"] + 1
+            sup.route(raw)
+
+def make_intake_server(sup, host, port, path, secret=""):
+    class IntakeHandler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            logger.debug("webhook: " + fmt, *args)
+
+        def _reply(self, code):
+            self.send_response(code)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0] != path:
+                self._reply(404)
+                return
+            if secret and not hmac.compare_digest(self.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret):
+                self._reply(403)
+                return
+            try:
+                raw = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8"))
+            except Exception as e:
+                logger.warning("bad webhook payload: %s", e)
+                self._reply(400)
+                return
+            sup.route(raw)
+            self._reply(200)
+
+    server = ThreadingHTTPServer((host, port), IntakeHandler)
+    server.daemon_threads = True
+    return server
+
+def serve_webhook(sup, config):
+    # TLS is expected to be terminated by a reverse proxy in this mode
+    path = config.get("WEBHOOK_PATH", "/telegram") or "/telegram"
+    secret = config.get("WEBHOOK_SECRET", "") or ""
+    server = make_intake_server(sup, config.get("WEBHOOK_HOST", "0.0.0.0"), int(config.get("WEBHOOK_PORT", 8443)), path, secret)
+    if config.get("WEBHOOK_URL"):
+        requests.post(api_base(config) + "setWebhook", timeout=30,
+                      data={"url": config["WEBHOOK_URL"], "secret_token": secret, "drop_pending_updates": "true"})
+    logger.info("Webhook listening on %s:%s%s", *server.server_address[:2], path)
+    threading.Thread(target=server.serve_forever, name="intake", daemon=True).start()
+    while True:
+        time.sleep(3600)
+
+def run(workers):
+    with open(CONFIG_FILE, encoding="utf-8") as f:
+        config = json.load(f)
+    if config.get("STORAGE_BACKEND", "json") != "sqlite":
+        raise SystemExit('main_workers.py يحتاج "STORAGE_BACKEND": "sqlite" في config.json')
+    sup = Supervisor(workers, config, int(config.get("MAX_PENDING_UPDATES", 1000) or 1000))
+    sup.start()
+    try:
+        if config.get("MODE", "polling") == "webhook":
+            serve_webhook(sup, config)
+        else:
+            poll(sup, config)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sup.stop()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Run the bot as several worker processes sharing one SQLite store")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    run(ap.parse_args().workers)
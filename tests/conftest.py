@@ -0,0 +1,91 @@
+# main.py reads config.json and creates its data files in the working
+# directory at import time: import it once per session from a temp dir,
+# pointed at a local fake_api server instead of api.telegram.org.
+import json
+import os
+import sys
+
+import pytest
+import telebot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import fake_api
+
+@pytest.fixture(scope="session")
+def api_server():
+    fake, server = fake_api.serve(port=0)
+    yield fake, server
+    server.shutdown()
+
+@pytest.fixture(scope="session")
+def main(api_server, tmp_path_factory):
+    _, server = api_server
+    home = tmp_path_factory.mktemp("bot")
+    config = {"BOT_TOKEN": "123:TEST", "ADMIN_IDS": [1], "EXCHANGE_RATE": 15000,
+              "API_URL": f"http://127.0.0.1:{server.server_address[1]}",
+              "API_BACKOFF": 0.01, "API_BREAKER_COOLDOWN": 0.2}
+    (home / "config.json").write_text(json.dumps(config), encoding="utf-8")
+    # stays there: everything main saves later is relative to the cwd too
+    cwd = os.getcwd()
+    os.chdir(home)
+    import main as module
+    module.scheduler.pause()
+    yield module
+    module.scheduler.shutdown(wait=False)
+    os.chdir(cwd)
+
+@pytest.fixture
+def fake(api_server, main):
+    # a healthy server with an empty call log for every test
+    fake = api_server[0]
+    with fake.cond:
+        fake.calls.clear()
+        fake.file_ids.clear()
+        fake.fetches = 0
+    fake.latency = fake.error_rate = fake.flood_every = 0
+    fake.retry_after = 1
+    yield fake
+    fake.error_rate = fake.flood_every = 0
+
+@pytest.fixture
+def workdir(main, tmp_path, monkeypatch):
+    # stores use relative file names and keep journal handles open per name
+    def close_journals():
+        for path in list(main._JOURNAL_HANDLES):
+            main._close_journal(path)
+    close_journals()
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    close_journals()
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, main, workdir, monkeypatch):
+    # a fresh STORE of each backend in the test's own directory
+    if request.param == "sqlite":
+        s = main.SqliteStore("bot.db")
+    else:
+        main.ensure_file(main.USERS_FILE, main.DEFAULT_USERS)
+        main.ensure_file(main.ORDERS_FILE, main.DEFAULT_ORDERS)
+        s = main.JsonStore()
+    monkeypatch.setattr(main, "STORE", s)
+    return s
+
+_ids = iter(range(1000, 10 ** 9))
+
+@pytest.fixture
+def callback():
+    def make(uid, data):
+        return telebot.types.CallbackQuery.de_json({
+            "id": str(next(_ids)), "data": data, "chat_instance": "x",
+            "from": {"id": uid, "is_bot": False, "first_name": f"u{uid}"},
+            "message": {"message_id": next(_ids), "date": 0, "text": "x", "chat": {"id": uid, "type": "private"}}})
+    return make
+
+@pytest.fixture
+def json_store(main, workdir):
+    main.ensure_file(main.USERS_FILE, main.DEFAULT_USERS)
+    main.ensure_file(main.ORDERS_FILE, main.DEFAULT_ORDERS)
+    return main.JsonStore()
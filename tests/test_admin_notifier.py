@@ -0,0 +1,66 @@
+import pytest
+
+class Outbox:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+@pytest.fixture(autouse=True)
+def outbox(main, monkeypatch):
+    box = Outbox()
+    monkeypatch.setattr(main, "OUTBOX", box)
+    return box
+
+def new_order(main, n, status="pending"):
+    order = {"order_id": f"O{n}", "user_id": 500 + n, "user_name": f"u{n}", "button_id": "b1", "button_text": "Netflix 5$",
+             "status": status, "created_at": f"2026-01-01T00:00:{n:02d}", "handled_at": None}
+    main.STORE.add_order(order)
+    return main.STORE.get_order(order["order_id"])
+
+@pytest.fixture
+def digest(main, store, monkeypatch):
+    # builds one digest of O1..O3 and returns its id
+    sent = []
+    notifier = main.AdminNotifier(mode="digest", window=60)
+    monkeypatch.setattr(notifier, "notify", lambda text, **kw: sent.append((text, kw)))
+    for n in (1, 2, 3):
+        notifier.order_created(new_order(main, n), "new order")
+    notifier._timer.cancel()
+    notifier.flush()
+    (text, kw), = sent
+    assert text.startswith("📥 3 ")
+    approve_all = kw["reply_markup"].keyboard[-1][0].callback_data
+    assert approve_all.startswith("DIGEST|") and approve_all.endswith("|approve")
+    return approve_all.split("|")[1]
+
+def test_digest_is_shared_through_the_store(main, store, digest):
+    # another worker process / a restarted one has its own notifier
+    assert main.AdminNotifier(mode="digest").digest_orders(digest) == ["O1", "O2", "O3"]
+    reopened = main.SqliteStore("bot.db") if store.name == "sqlite" else main.JsonStore()
+    assert reopened.digest_orders(digest) == ["O1", "O2", "O3"]
+
+def test_digest_keeps_the_latest(main, store):
+    for n in range(main.DIGESTS_KEEP + 5):
+        store.save_digest(f"d{n}", [f"O{n}"])
+    assert store.digest_orders("d4") is None
+    assert store.digest_orders("d5") == ["O5"]
+    assert store.digest_orders(f"d{main.DIGESTS_KEEP + 4}") == [f"O{main.DIGESTS_KEEP + 4}"]
+
+def test_approve_all_skips_handled_orders(main, store, digest, fake, callback, outbox):
+    main.STORE.update_order(main.STORE.get_order("O2"), {"status": "rejected"})
+    main.callback_handler(callback(1, f"DIGEST|{digest}|approve"))
+    assert [main.STORE.get_order(f"O{n}")["status"] for n in (1, 2, 3)] == ["approved", "rejected", "approved"]
+    texts = [c["params"].get("text", "") for c in fake.calls if c["method"] == "sendMessage" and c["params"].get("chat_id") == "1"]
+    assert any("تمت معالجة 2 طلب (تم تخطي 1)" in t for t in texts)
+    assert [chat for chat, _ in outbox.sent] == [501, 503]
+
+def test_unknown_digest_expires(main, store, fake, callback):
+    main.callback_handler(callback(1, "DIGEST|nope|approve"))
+    answers = [c["params"] for c in fake.calls if c["method"] == "answerCallbackQuery"]
+    assert "انتهت" in answers[-1]["text"]
+
+def test_digest_needs_an_admin(main, store, digest, fake, callback):
+    main.callback_handler(callback(77, f"DIGEST|{digest}|approve"))
+    assert main.STORE.get_order("O1")["status"] == "pending"
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+import telebot
+
+def make_client(main, fake, after_call=None, **kwargs):
+    # the plain TeleBot request function (main.API wraps it), plus a hook run
+    # after every attempt so a test can heal the fake server mid-retry
+    def make_request(*args, **kw):
+        try:
+            return main.API._make_request(*args, **kw)
+        finally:
+            if after_call:
+                after_call()
+    kwargs.setdefault("backoff", 0.01)
+    return main.ApiClient(make_request, **kwargs)
+
+def sent(fake):
+    # chat 5 only: queued notifications from other tests may still be going out
+    return [c for c in fake.calls if c["method"] == "sendMessage" and c["params"].get("chat_id") == "5"]
+
+def test_retries_5xx_until_success(main, fake):
+    fake.error_rate = 1
+    def heal():
+        if len(sent(fake)) == 2:
+            fake.error_rate = 0
+    client = make_client(main, fake, heal, retries=2)
+    result = client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert result["text"] == "hi"
+    assert len(sent(fake)) == 3
+    assert client.stats()["calls"] == {"sendMessage:502": 2, "sendMessage:ok": 1}
+
+def test_gives_up_after_retries(main, fake):
+    fake.error_rate = 1
+    client = make_client(main, fake, retries=2, breaker=main.CircuitBreaker(10, 1))
+    with pytest.raises(telebot.apihelper.ApiTelegramException) as err:
+        client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert err.value.error_code == 502
+    assert len(sent(fake)) == 3
+
+def test_4xx_is_not_retried(main, fake):
+    client = make_client(main, fake, retries=2)
+    with pytest.raises(telebot.apihelper.ApiTelegramException) as err:
+        client.request("123:TEST", "sendPhoto", params={"chat_id": 5, "photo": "not-a-file-id"})
+    assert err.value.error_code == 400
+    assert len([c for c in fake.calls if c["method"] == "sendPhoto"]) == 1
+
+def test_honours_retry_after(main, fake, monkeypatch):
+    paused = []
+    monkeypatch.setattr(main.SEND_LIMITER, "pause", paused.append)
+    fake.flood_every, fake.retry_after = 1, 1
+    def heal():
+        fake.flood_every = 0
+    client = make_client(main, fake, heal, retries=2)
+    t0 = time.monotonic()
+    client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert time.monotonic() - t0 >= 1
+    assert paused == [1]
+    assert len(sent(fake)) == 2
+    assert client.breaker.state == "closed"
+
+def test_long_retry_after_goes_back_to_caller(main, fake, monkeypatch):
+    monkeypatch.setattr(main.SEND_LIMITER, "pause", lambda seconds: None)
+    fake.flood_every, fake.retry_after = 1, 30
+    client = make_client(main, fake, retries=2, max_retry_after=10)
+    t0 = time.monotonic()
+    with pytest.raises(telebot.apihelper.ApiTelegramException) as err:
+        client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert err.value.error_code == 429
+    assert time.monotonic() - t0 < 5
+    assert len(sent(fake)) == 1
+
+def test_circuit_opens_and_closes(main, fake):
+    breaker = main.CircuitBreaker(threshold=3, cooldown=0.3)
+    client = make_client(main, fake, retries=0, breaker=breaker)
+    fake.error_rate = 1
+    for _ in range(3):
+        with pytest.raises(telebot.apihelper.ApiTelegramException):
+            client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert breaker.state == "open"
+    # refused without touching the network
+    with pytest.raises(main.ApiUnavailable):
+        client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert len(sent(fake)) == 3
+
+    # a failed probe after the cooldown opens it again
+    time.sleep(0.35)
+    assert breaker.state == "half_open"
+    with pytest.raises(telebot.apihelper.ApiTelegramException):
+        client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert breaker.state == "open"
+    assert breaker.opened == 1
+
+    # a successful one closes it
+    fake.error_rate = 0
+    time.sleep(0.35)
+    client.request("123:TEST", "sendMessage", params={"chat_id": 5, "text": "hi"})
+    assert breaker.state == "closed"
+    assert client.stats()["calls"]["sendMessage:circuit_open"] == 1
+
+def test_half_open_lets_one_probe_through(main):
+    breaker = main.CircuitBreaker(threshold=1, cooldown=0)
+    breaker.failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.allow()
+
+def test_getupdates_bypasses_open_circuit(main, fake):
+    breaker = main.CircuitBreaker(threshold=1, cooldown=60)
+    breaker.failure()
+    client = make_client(main, fake, breaker=breaker)
+    assert client.request("123:TEST", "getUpdates", params={"offset": -1, "timeout": 1}) == []
+    assert breaker.state == "closed"
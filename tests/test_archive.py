@@ -0,0 +1,69 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+def iso(**delta):
+    return (datetime.now() - timedelta(**delta)).isoformat(timespec="seconds")
+
+def new_order(n, status, handled=None, user_id=None):
+    return {"order_id": f"O{n}", "user_id": user_id or 500 + n, "button_id": "b1", "button_text": "Netflix 5$",
+            "status": status, "created_at": iso(days=90), "handled_at": handled}
+
+@pytest.fixture
+def archive(main, store, tmp_path, monkeypatch):
+    arc = main.OrderArchive(str(tmp_path / "archive"))
+    monkeypatch.setattr(main, "ARCHIVE", arc)
+    monkeypatch.setitem(main.CONFIG, "ARCHIVE_AFTER_DAYS", 30)
+    return arc
+
+def test_old_handled_orders_move_to_the_archive(main, store, archive):
+    store.add_order(new_order(1, "approved", iso(days=40)))
+    store.add_order(new_order(2, "rejected", iso(days=70)))
+    store.add_order(new_order(3, "approved", iso(days=2)))
+    store.add_order(new_order(4, "pending"))
+    store.add_order(new_order(5, "needs_more"))
+    assert main.archive_orders() == 2
+    assert store.get_order("O1") is None and store.get_order("O2") is None
+    assert [store.get_order(f"O{n}")["status"] for n in (3, 4, 5)] == ["approved", "pending", "needs_more"]
+    assert archive.find("O1")["status"] == "approved"
+    assert archive.find("O2")["status"] == "rejected"
+    assert archive.find("O3") is None
+    assert main.archive_orders() == 0
+
+def test_partitions_by_handled_month(main, archive):
+    archive.write([new_order(1, "approved", "2026-01-05T10:00:00"), new_order(2, "approved", "2026-03-01T10:00:00")])
+    archive.write([new_order(3, "rejected", "2026-01-20T10:00:00")])
+    assert archive.partitions() == ["2026-03", "2026-01"]
+    # one gzip member per write, each partition readable as a whole
+    with gzip.open(os.path.join(archive.path, "orders-2026-01.jsonl.gz"), "rt") as f:
+        assert len(f.read().splitlines()) == 2
+    assert [o["order_id"] for o in archive.iter_orders()] == ["O1", "O3", "O2"]
+
+def test_lookups_only_open_matching_partitions(main, archive, monkeypatch):
+    archive.write([new_order(1, "approved", "2026-01-05T10:00:00", user_id=9),
+                   new_order(2, "approved", "2026-02-05T10:00:00", user_id=8),
+                   new_order(3, "rejected", "2026-03-05T10:00:00", user_id=9)])
+    scanned = []
+    scan = archive._scan
+    monkeypatch.setattr(archive, "_scan", lambda part: scanned.append(part) or scan(part))
+    assert archive.find("O2")["user_id"] == 8
+    assert archive.find("O404") is None
+    assert scanned == ["2026-02"]
+    assert [o["order_id"] for o in archive.for_user(9)] == ["O3", "O1"]
+    assert scanned == ["2026-02", "2026-03", "2026-01"]
+
+def test_duplicate_after_crash_is_returned_once(main, archive):
+    # archived, then the process died before the store dropped it
+    archive.write([new_order(1, "approved", "2026-01-05T10:00:00")])
+    archive.write([new_order(1, "approved", "2026-01-05T10:00:00")])
+    assert [o["order_id"] for o in archive.iter_orders()] == ["O1"]
+    assert [o["order_id"] for o in archive.for_user(501)] == ["O1"]
+
+def test_archiving_disabled(main, store, archive, monkeypatch):
+    monkeypatch.setitem(main.CONFIG, "ARCHIVE_AFTER_DAYS", 0)
+    store.add_order(new_order(1, "approved", iso(days=400)))
+    assert main.archive_orders() == 0
+    assert store.get_order("O1") is not None
+    assert archive.partitions() == []
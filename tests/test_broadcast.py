@@ -0,0 +1,53 @@
+import json
+import time
+
+import pytest
+
+@pytest.fixture
+def users(main, monkeypatch):
+    users = {str(uid): main.UserRecord(id=uid, name=f"u{uid}") for uid in (11, 12, 13, 14)}
+    users["13"]["blocked"] = True
+    monkeypatch.setattr(main, "USERS", users)
+    monkeypatch.setattr(main, "save_user", lambda uid: None)
+    return users
+
+def wait_done(b, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while b.jobs.get(job_id, {}).get("status") in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    return b.jobs.get(job_id)
+
+def sent_to(fake, text):
+    return sorted(int(c["params"]["chat_id"]) for c in fake.calls if c["method"] == "sendMessage" and c["params"].get("text") == text)
+
+def test_sends_to_every_reachable_user(main, users, fake, tmp_path):
+    b = main.Broadcaster(str(tmp_path / "broadcasts.json"))
+    job = wait_done(b, b.submit("hello all", admin_id=1))
+    assert (job["status"], job["sent"], job["total"]) == ("done", 3, 4)
+    assert sent_to(fake, "hello all") == [11, 12, 14]
+
+def test_resumes_after_the_cursor(main, users, fake, tmp_path):
+    path = tmp_path / "broadcasts.json"
+    path.write_text(json.dumps({"j1": {"id": "j1", "kind": "broadcast", "text": "again", "admin_id": 1, "status": "running",
+                                       "currency": None, "cursor": "12", "sent": 2, "failed": 0, "blocked": 0, "total": 4,
+                                       "created_at": "2026-01-01T00:00:00", "progress_msg": None}}), encoding="utf-8")
+    b = main.Broadcaster(str(path))
+    b.resume()
+    job = wait_done(b, "j1")
+    assert job["sent"] == 3
+    assert sent_to(fake, "again") == [14]
+
+def test_finished_jobs_are_pruned(main, users, fake, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.Broadcaster, "KEEP_FINISHED", 3)
+    path = tmp_path / "broadcasts.json"
+    old = {f"d{n}": {"id": f"d{n}", "status": "done" if n % 2 else "failed"} for n in range(6)}
+    old["q"] = {"id": "q", "status": "queued"}
+    path.write_text(json.dumps(old), encoding="utf-8")
+    b = main.Broadcaster(str(path))
+    assert list(b.jobs) == ["d3", "d4", "d5", "q"]
+    b.jobs.pop("q")
+    job_id = b.submit("news", admin_id=1)
+    wait_done(b, job_id)
+    assert list(b.jobs) == ["d4", "d5", job_id]
+    assert list(json.loads(path.read_text(encoding="utf-8"))) == ["d4", "d5", job_id]
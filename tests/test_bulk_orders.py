@@ -0,0 +1,53 @@
+import pytest
+
+@pytest.fixture
+def outbox(main, monkeypatch):
+    sent = []
+    monkeypatch.setattr(main.OUTBOX, "send", lambda chat_id, text, **kw: sent.append((chat_id, text)))
+    return sent
+
+@pytest.fixture
+def orders(main, store):
+    for n in range(1, 8):
+        store.add_order({"order_id": f"O{n}", "user_id": 500 + n, "user_name": f"u{n}", "button_id": "b1" if n < 6 else "b2",
+                         "button_text": "Netflix 5$", "status": "pending", "created_at": f"2026-01-01T00:00:0{n}", "handled_at": None})
+    return store
+
+@pytest.fixture
+def view(main):
+    main.order_views.pop(1, None)
+    yield main._order_view(1)
+    main.order_views.pop(1, None)
+
+def statuses(store):
+    return {f"O{n}": store.get_order(f"O{n}")["status"] for n in range(1, 8)}
+
+def test_selected_orders_in_one_write(main, orders, outbox, view, callback, fake, monkeypatch):
+    orders.update_order(orders.get_order("O3"), {"status": "approved"})
+    writes = []
+    update_orders = orders.update_orders
+    monkeypatch.setattr(orders, "update_orders", lambda os_, fields, expect=None: writes.append(len(os_)) or update_orders(os_, fields, expect))
+    view["selected"].update({"O1", "O2", "O3"})
+    main.callback_handler(callback(1, "OQ|bulk|reject|sel"))
+    assert writes == [2]
+    assert [s for oid, s in statuses(orders).items() if oid in ("O1", "O2", "O3")] == ["rejected", "rejected", "approved"]
+    assert sorted(chat for chat, _ in outbox) == [501, 502]
+    assert view["selected"] == set()
+    texts = [c["params"].get("text", "") for c in fake.calls if c["method"] == "sendMessage" and c["params"].get("chat_id") == "1"]
+    assert any("تمت معالجة 2 طلب (تم تخطي 1)" in t for t in texts)
+
+def test_whole_button_asks_first(main, orders, outbox, view, callback):
+    view["button_id"] = "b1"
+    main.callback_handler(callback(1, "OQ|bulk|approve|button"))
+    assert set(statuses(orders).values()) == {"pending"}
+    main.callback_handler(callback(1, "OQ|bulkgo|approve"))
+    assert statuses(orders) == {"O1": "approved", "O2": "approved", "O3": "approved", "O4": "approved", "O5": "approved",
+                                "O6": "pending", "O7": "pending"}
+    assert len(outbox) == 5
+
+def test_bulk_needs_an_admin(main, orders, outbox, callback):
+    main.order_views.setdefault(77, main._order_view(77))["selected"].add("O1")
+    main.callback_handler(callback(77, "OQ|bulk|approve|sel"))
+    main.order_views.pop(77, None)
+    assert orders.get_order("O1")["status"] == "pending"
+    assert outbox == []
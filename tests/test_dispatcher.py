@@ -0,0 +1,73 @@
+import random
+import threading
+import time
+
+import pytest
+import telebot
+
+def update(n, chat):
+    return telebot.types.Update.de_json({"update_id": n, "message": {
+        "message_id": n, "date": 0, "text": str(n), "chat": {"id": chat, "type": "private"},
+        "from": {"id": chat, "is_bot": False, "first_name": "u"}}})
+
+@pytest.fixture
+def dispatcher(main):
+    made = []
+    def make(handle, **kwargs):
+        d = main.ChatDispatcher(handle, **kwargs)
+        d.start()
+        made.append(d)
+        return d
+    yield make
+    for d in made:
+        d.stop(5)
+
+def wait_idle(d, timeout=10):
+    deadline = time.monotonic() + timeout
+    while d.pending:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_per_chat_order_with_parallel_chats(dispatcher):
+    seen, lock = {}, threading.Lock()
+    running, peak = [0], [0]
+    def handle(u):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(random.uniform(0, 0.005))
+        with lock:
+            running[0] -= 1
+            seen.setdefault(u.message.chat.id, []).append(u.update_id)
+    d = dispatcher(handle, workers=4)
+    sent = {}
+    for n in range(400):
+        chat = random.choice((1, 2, 3, 4, 5))
+        sent.setdefault(chat, []).append(n)
+        d.submit(update(n, chat))
+    wait_idle(d)
+    assert seen == sent
+    assert peak[0] > 1
+    assert d.stats()["busy_chats"] == 0
+
+def test_failed_update_does_not_stall_its_chat(dispatcher):
+    seen = []
+    def handle(u):
+        if u.update_id == 1:
+            raise RuntimeError("boom")
+        seen.append(u.update_id)
+    d = dispatcher(handle, workers=2)
+    for n in range(4):
+        d.submit(update(n, 7))
+    wait_idle(d)
+    assert seen == [0, 2, 3]
+
+def test_backpressure(dispatcher):
+    gate = threading.Event()
+    d = dispatcher(lambda u: gate.wait(5), workers=1, max_pending=2)
+    assert d.submit(update(1, 1), block=False)
+    assert d.submit(update(2, 2), block=False)
+    assert not d.submit(update(3, 3), block=False)
+    gate.set()
+    wait_idle(d)
+    assert d.submit(update(4, 4), block=False)
@@ -0,0 +1,77 @@
+import pytest
+from telebot import types
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(main, monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(main.time, "monotonic", c)
+    return c
+
+def test_burst_then_notify_once_then_drop(main, clock):
+    guard = main.FloodGuard({"message": (1, 3)})
+    assert [guard.check(5, "message") for _ in range(6)] == ["ok", "ok", "ok", "notify", "drop", "drop"]
+    assert guard.check(6, "message") == "ok"  # per chat
+    assert guard.check(5, "callback") == "ok"  # class without a limit
+
+def test_idle_chat_refills(main, clock):
+    guard = main.FloodGuard({"command": (0.5, 2)})
+    assert [guard.check(5, "command") for _ in range(3)] == ["ok", "ok", "notify"]
+    clock.now += 2  # one token back
+    assert [guard.check(5, "command") for _ in range(3)] == ["ok", "notify", "drop"]
+    clock.now += 3600  # never more than the burst
+    assert [guard.check(5, "command") for _ in range(3)] == ["ok", "ok", "notify"]
+
+def test_global_rate(main, clock):
+    guard = main.FloodGuard({"message": (10, 10)}, global_rate=2)
+    assert [guard.check(chat, "message") for chat in (1, 2, 3, 4)] == ["ok", "ok", "notify", "notify"]
+    clock.now += 0.5
+    assert guard.check(5, "message") == "ok"
+
+def test_tracked_chats_are_bounded(main, clock):
+    guard = main.FloodGuard({"message": (1, 1)}, max_chats=2)
+    assert guard.check(1, "message") == "ok"
+    guard.check(2, "message")
+    assert guard.check(1, "message") == "notify"  # 1 is now the most recent
+    guard.check(3, "message")  # evicts 2
+    assert guard.stats()["tracked"] == 2
+    assert guard.check(1, "message") == "drop"  # still tracked, still empty
+    assert guard.check(2, "message") == "ok"  # forgotten, full bucket again
+
+def message_update(uid, text="hi", n=1):
+    return types.Update.de_json({"update_id": n, "message": {
+        "message_id": n, "date": 1700000000, "text": text, "chat": {"id": uid, "type": "private"},
+        "from": {"id": uid, "is_bot": False, "first_name": "u"}}})
+
+@pytest.fixture
+def guard(main, clock, monkeypatch):
+    g = main.FloodGuard({"message": (1, 2), "command": (1, 1)})
+    monkeypatch.setattr(main, "FLOOD", g)
+    monkeypatch.setitem(main.CONFIG, "FLOOD_ENABLED", True)
+    return g
+
+def notices(main, fake, uid):
+    return [c for c in fake.calls if c["method"] == "sendMessage" and c["params"].get("chat_id") == str(uid)
+            and c["params"].get("text") == main.FLOOD_NOTICE]
+
+def test_flooding_user_gets_one_notice(main, guard, fake):
+    assert [main.flood_blocked(message_update(42, n=n), 42) for n in range(5)] == [False, False, True, True, True]
+    assert len(notices(main, fake, 42)) == 1
+    assert guard.stats()["throttled"] == {"message": 3} and guard.stats()["notified"] == 1
+    assert main.flood_blocked(message_update(42, "/start"), 42) is False
+
+def test_admins_are_exempt(main, guard, fake, monkeypatch):
+    monkeypatch.setitem(main.CONFIG, "ADMIN_IDS", [1])
+    assert not any(main.flood_blocked(message_update(1, n=n), 1) for n in range(5))
+    assert notices(main, fake, 1) == []
+    assert guard.stats()["throttled"] == {}
+
+def test_disabled(main, guard, monkeypatch):
+    monkeypatch.setitem(main.CONFIG, "FLOOD_ENABLED", False)
+    assert not any(main.flood_blocked(message_update(42, n=n), 42) for n in range(5))
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+
+def order(n, status="pending", **extra):
+    return dict({"order_id": f"O{n}", "user_id": 100 + n % 3, "button_id": "b1", "button_text": "Netflix 5$",
+                 "status": status, "created_at": f"2026-01-01T00:00:{n:02d}", "handled_at": None}, **extra)
+
+def users_of(store):
+    return {uid: dict(store.users[uid]) for uid in store.users}
+
+def orders_of(store):
+    return [dict(o) for o in store.iter_orders()]
+
+def fill(main, store):
+    store.save_users([(str(n), main.UserRecord({"id": n, "balance": n * 1.5, "name": f"u{n}"})) for n in range(1, 6)])
+    store.save_user("3", main.UserRecord({"id": 3, "balance": 99, "name": "u3 renamed"}))
+    store.save_user("4", None)
+    for n in range(1, 7):
+        store.add_order(order(n))
+    store.update_orders([store.get_order("O2"), store.get_order("O3")], {"status": "approved", "handled_at": "2026-01-02T00:00:00"},
+                        expect=("pending",))
+    store.update_order(store.get_order("O2"), {"status": "rejected"}, expect=("pending",))  # already handled: no-op
+    store.remove_orders(["O5"])
+
+EXPECTED_USERS = {"1": {"id": 1, "balance": 1.5, "name": "u1"}, "2": {"id": 2, "balance": 3.0, "name": "u2"},
+                  "3": {"id": 3, "balance": 99, "name": "u3 renamed"}, "5": {"id": 5, "balance": 7.5, "name": "u5"}}
+
+def expected_orders():
+    out = [order(n) for n in (1, 2, 3, 4, 6)]
+    for o in out[1:3]:
+        o.update(status="approved", handled_at="2026-01-02T00:00:00")
+    return out
+
+def reopen_json(main):
+    for path in list(main._JOURNAL_HANDLES):
+        main._close_journal(path)
+    return main.JsonStore()
+
+def test_journal_replay(main, json_store):
+    fill(main, json_store)
+    # nothing folded into the snapshots yet: it all lives in the journals
+    with open(main.USERS_FILE, encoding="utf-8") as f:
+        assert json.load(f) == {}
+    assert os.path.exists(main.USERS_FILE + main.JOURNAL_SUFFIX)
+    assert os.path.exists(main.ORDERS_FILE + main.JOURNAL_SUFFIX)
+
+    store = reopen_json(main)
+    assert users_of(store) == EXPECTED_USERS
+    assert orders_of(store) == expected_orders()
+    assert store.count_orders("approved") == 2
+    assert store.count_orders("pending") == 3
+
+def test_compaction_round_trip(main, json_store):
+    fill(main, json_store)
+    json_store.orders  # compaction only folds orders once they are loaded
+    json_store.compact()
+    assert not os.path.exists(main.USERS_FILE + main.JOURNAL_SUFFIX)
+    assert not os.path.exists(main.ORDERS_FILE + main.JOURNAL_SUFFIX)
+    with open(main.USERS_FILE, encoding="utf-8") as f:
+        assert json.load(f) == EXPECTED_USERS
+    with open(main.ORDERS_FILE, encoding="utf-8") as f:
+        assert json.load(f) == expected_orders()
+    # the live store keeps answering from the new snapshot
+    assert users_of(json_store) == EXPECTED_USERS
+    assert json_store.index.changed == {}
+
+    # changes after a compaction land in a new journal on top of it
+    json_store.save_user("6", main.UserRecord({"id": 6, "name": "u6"}))
+    json_store.add_order(order(7))
+    store = reopen_json(main)
+    assert users_of(store) == dict(EXPECTED_USERS, **{"6": {"id": 6, "name": "u6"}})
+    assert orders_of(store) == expected_orders() + [order(7)]
+
+def test_torn_journal_line_is_skipped(main, json_store):
+    json_store.save_user("1", main.UserRecord({"id": 1}))
+    with open(main.USERS_FILE + main.JOURNAL_SUFFIX, "a", encoding="utf-8") as f:
+        f.write('{"op":"set","key":"2","val')
+    store = reopen_json(main)
+    assert users_of(store) == {"1": {"id": 1}}
+
+def test_compaction_does_not_block_appends(main, json_store, monkeypatch):
+    fill(main, json_store)
+    json_store.orders
+    write_temp = main._write_temp
+    appended = []
+    def slow_write(path, payload, tmp=None):
+        # an order placed while the orders snapshot is being written must not wait for it
+        if path == main.ORDERS_FILE and tmp:
+            t = threading.Thread(target=lambda: (json_store.add_order(order(8)), appended.append(True)))
+            t.start()
+            t.join(5)
+        return write_temp(path, payload, tmp)
+    monkeypatch.setattr(main, "_write_temp", slow_write)
+    json_store.compact()
+    assert appended == [True]
+    store = reopen_json(main)
+    assert [o["order_id"] for o in orders_of(store)][-1] == "O8"
+    assert users_of(store) == EXPECTED_USERS
+
+def test_compaction_without_loaded_orders(main, json_store):
+    # a process that never looked at orders still folds their journal
+    for n in range(1, 4):
+        json_store.add_order(order(n))
+    json_store.compact()
+    assert json_store._repo is None
+    assert not os.path.exists(main.ORDERS_FILE + main.JOURNAL_SUFFIX)
+    with open(main.ORDERS_FILE, encoding="utf-8") as f:
+        assert json.load(f) == [order(n) for n in range(1, 4)]
+    assert orders_of(json_store) == [order(n) for n in range(1, 4)]
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+USERS = {"5": {"id": 5, "name": "سارة", "first_seen": "2026-01-01T00:00:00"},
+         "6": {"id": 6, "name": "a \"quoted\" }, name", "awaiting": {"step": 1}},
+         "م\"x": {"id": 7, "name": "odd key"}}
+
+def write(path, data, **kw):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **kw)
+
+@pytest.fixture
+def users_file(main, workdir):
+    write(main.USERS_FILE, USERS, indent=2)
+    write(main.ORDERS_FILE, [{"order_id": "O1", "user_id": 5, "status": "pending", "created_at": "2026-01-01T00:00:00"}], indent=2)
+    return main.USERS_FILE
+
+def test_orders_are_parsed_on_first_use(main, users_file, monkeypatch):
+    loads = []
+    load_json = main.load_json
+    monkeypatch.setattr(main, "load_json", lambda path, default: loads.append(path) or load_json(path, default))
+    store = main.JsonStore()
+    assert store._repo is None and main.ORDERS_FILE not in loads
+    store.add_order({"order_id": "O2", "user_id": 6, "status": "pending", "created_at": "2026-01-02T00:00:00"})
+    assert store._repo is None  # journal only
+    assert store.get_order("O2")["user_id"] == 6
+    assert loads.count(main.ORDERS_FILE) == 1
+    assert [o["order_id"] for o in store.iter_orders()] == ["O1", "O2"]
+    assert store.get_order("O1")["status"] == "pending"
+    assert loads.count(main.ORDERS_FILE) == 1
+
+def test_profiles_are_parsed_when_asked_for(main, users_file):
+    index = main.JsonUserIndex(users_file)
+    assert sorted(index.spans) == sorted(USERS)
+    assert index.count_users() == 3
+    for uid, user in USERS.items():
+        assert dict(index.load_user(uid)) == user
+    assert index.load_user("404") is None and not index.has_user("404")
+
+def test_journal_sits_on_top_of_the_snapshot(main, users_file):
+    index = main.JsonUserIndex(users_file)
+    index.save([("5", main.UserRecord(id=5, name="new")), ("6", None), ("8", main.UserRecord(id=8))])
+    reopened = main.JsonUserIndex(users_file)
+    for idx in (index, reopened):
+        assert idx.load_user("5")["name"] == "new"
+        assert idx.load_user("6") is None and not idx.has_user("6")
+        assert sorted(idx.user_ids()) == sorted(["5", "م\"x", "8"])
+        assert idx.count_users() == 3
+
+def test_compaction_keeps_untouched_profiles_byte_for_byte(main, users_file):
+    with open(users_file, encoding="utf-8") as f:
+        before = f.read()
+    index = main.JsonUserIndex(users_file)
+    index.save([("6", None), ("9", main.UserRecord(id=9, name="n"))])
+    assert index.compact()
+    with open(users_file, encoding="utf-8") as f:
+        after = f.read()
+    assert json.loads(after) == {"5": USERS["5"], "م\"x": USERS["م\"x"], "9": {"id": 9, "name": "n"}}
+    assert after.startswith(before[:before.index('  "6"')])
+    assert index.changed == {}
+    assert dict(main.JsonUserIndex(users_file).load_user("9")) == {"id": 9, "name": "n"}
+
+def test_minified_file_is_rewritten_once(main, workdir):
+    write(main.USERS_FILE, USERS)
+    index = main.JsonUserIndex(main.USERS_FILE)
+    assert dict(index.load_user("6")) == USERS["6"]
+    with open(main.USERS_FILE, encoding="utf-8") as f:
+        assert f.read() == main._dump(USERS)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import pytest
+import telebot
+
+URL = "https://example.com/netflix.png"
+
+@pytest.fixture
+def media(main, tmp_path, monkeypatch):
+    cache = main.MediaCache(str(tmp_path / "media_cache.json"))
+    monkeypatch.setattr(main, "MEDIA", cache)
+    return cache
+
+def photos(fake):
+    return [c["params"]["photo"] for c in fake.calls if c["method"] == "sendPhoto"]
+
+def test_remember_and_resolve(media, main):
+    assert media.resolve(URL) == URL
+    media.remember(URL, "FID1")
+    assert media.resolve(URL) == "FID1"
+    assert media.resolve("FID1") == "FID1"  # already a file_id
+    # persisted and read back
+    assert main.MediaCache(media.path).resolve(URL) == "FID1"
+
+def test_send_reuses_file_id(media, main, fake):
+    first = main.send_cached_photo(5, URL, caption="a")
+    second = main.send_cached_photo(6, URL, caption="b")
+    fid = first.photo[-1].file_id
+    assert second.photo[-1].file_id == fid
+    assert photos(fake) == [URL, fid]
+    assert fake.fetches == 1
+    assert media.resolve(URL) == fid
+
+def test_rejected_file_id_falls_back_to_url(media, main, fake):
+    media.remember(URL, "Fexpired")
+    msg = main.send_cached_photo(5, URL)
+    assert photos(fake) == ["Fexpired", URL]
+    assert media.resolve(URL) == msg.photo[-1].file_id
+
+def test_prune_keeps_used_urls(media):
+    media.remember(URL, "FID1")
+    media.remember("https://example.com/old.png", "FID2")
+    assert media.prune({URL, None}) == 1
+    assert media.prune({URL}) == 0
+    with open(media.path, encoding="utf-8") as f:
+        assert json.load(f) == {URL: {"file_id": "FID1"}}
+
+def test_forget_file_id(media):
+    media.remember(URL, "FID1")
+    media.forget_file_id("FID1")
+    assert media.resolve(URL) == URL
+
+def api_error(code, description):
+    return telebot.apihelper.ApiTelegramException("sendPhoto", None, {"ok": False, "error_code": code, "description": description})
+
+@pytest.mark.parametrize("code, description", [
+    (403, "Forbidden: bot was blocked by the user"),
+    (429, "Too Many Requests: retry after 5"),
+    (400, "Bad Request: chat not found"),
+    (502, "Bad Gateway"),
+])
+def test_other_errors_keep_the_file_id(media, main, monkeypatch, code, description):
+    media.remember(URL, "FID1")
+    calls = []
+    def send_photo(chat_id, photo, **kwargs):
+        calls.append(photo)
+        raise api_error(code, description)
+    monkeypatch.setattr(main.bot, "send_photo", send_photo)
+    with pytest.raises(telebot.apihelper.ApiTelegramException):
+        main.send_cached_photo(5, URL)
+    assert calls == ["FID1"]
+    assert media.resolve(URL) == "FID1"
+
+class FakeAsyncApi:
+    def __init__(self, errors):
+        self.errors = errors  # photo -> exception
+        self.calls = []
+
+    async def call(self, method, params=None, timeout=None):
+        self.calls.append((method, dict(params or {})))
+        err = self.errors.get(params.get("photo")) if method == "sendPhoto" else None
+        if err:
+            raise err
+        if method == "sendPhoto":
+            return {"message_id": 1, "photo": [{"file_id": "FID2"}]}
+        return {"message_id": 2}
+
+def run_async_send(main, api, params):
+    main_async = pytest.importorskip("main_async")
+    rt = main_async.AsyncRuntime(main.bot, api, handler_threads=1)
+    try:
+        return asyncio.run(rt._send("send_photo", params))
+    finally:
+        rt.executor.shutdown(wait=False)
+
+def test_async_bad_file_id_retries_with_url(media, main):
+    media.remember(URL, "FID1")
+    api = FakeAsyncApi({"FID1": api_error(400, "Bad Request: wrong file identifier/HTTP URL specified")})
+    run_async_send(main, api, {"chat_id": 5, "photo": "FID1", "caption": "c"})
+    assert [(m, p.get("photo")) for m, p in api.calls] == [("sendPhoto", "FID1"), ("sendPhoto", URL)]
+    assert media.resolve(URL) == "FID2"
+
+@pytest.mark.parametrize("code", [403, 429])
+def test_async_chat_errors_are_not_sent_as_text(media, main, code):
+    media.remember(URL, "FID1")
+    api = FakeAsyncApi({"FID1": api_error(code, "Forbidden: bot was blocked by the user")})
+    with pytest.raises(telebot.apihelper.ApiTelegramException):
+        run_async_send(main, api, {"chat_id": 5, "photo": "FID1", "caption": "c"})
+    assert [m for m, _ in api.calls] == ["sendPhoto"]
+    assert media.resolve(URL) == "FID1"
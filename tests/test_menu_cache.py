@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+MENU = {"main_menu": [
+    {"id": "b1", "text": "Netflix 5$", "type": "content", "content": "x"},
+    {"id": "s1", "text": "ألعاب", "type": "submenu", "submenu": [
+        {"id": "b2", "text": "PUBG 60 UC 1.5$", "type": "content", "content": "y"}]}]}
+
+@pytest.fixture
+def menu(main, monkeypatch):
+    monkeypatch.setattr(main, "BUTTONS", json.loads(json.dumps(MENU)))
+    monkeypatch.setitem(main.CONFIG, "CURRENCY_DEFAULT", "SYP")
+    monkeypatch.setitem(main.CONFIG, "BUTTON_LAYOUT", {"type": "vertical", "grid_columns": 2})
+    main.rebuild_button_index()
+    yield main
+    main.PRICING.set_rate("SYP", 15000, save=False)
+    monkeypatch.undo()
+    main.rebuild_button_index()
+
+def labels(kb):
+    # without the currency toggle / home rows every menu ends with
+    return [(b.text, b.callback_data) for row in kb.keyboard[:-2] for b in row]
+
+def test_index_knows_every_button(menu):
+    assert set(menu.BUTTON_INDEX) == {"b1", "s1", "b2"}
+    assert menu.BUTTON_PARENT == {"b1": None, "s1": None, "b2": "s1"}
+    assert menu.BUTTON_INDEX["b2"] is menu.BUTTONS["main_menu"][1]["submenu"][0]
+
+def test_keyboards_are_built_once(menu):
+    menu.PRICING.set_rate("SYP", 100, save=False)
+    kb = menu.build_main_menu()
+    assert menu.build_main_menu() is kb
+    assert labels(kb) == [("Netflix 500 ل.س", "BTN|b1"), ("ألعاب", "BTN|s1")]
+    assert labels(menu.build_menu_kb("s1")) == [("PUBG 60 UC 150 ل.س", "BTN|b2")]
+    assert kb.to_json() is kb.to_json()
+
+def test_rate_change_rebuilds(menu):
+    menu.PRICING.set_rate("SYP", 100, save=False)
+    kb = menu.build_main_menu()
+    menu.PRICING.set_rate("SYP", 200, save=False)
+    fresh = menu.build_main_menu()
+    assert fresh is not kb
+    assert labels(fresh)[0] == ("Netflix 1,000 ل.س", "BTN|b1")
+
+def test_button_edit_rebuilds(menu, monkeypatch):
+    kb = menu.build_main_menu()
+    menu.BUTTONS["main_menu"][0]["text"] = "Netflix 6$"
+    menu.rebuild_button_index()
+    assert menu.build_main_menu() is not kb
+    monkeypatch.setitem(menu.CONFIG, "BUTTON_LAYOUT", {"type": "horizontal", "grid_columns": 2})
+    assert len(menu.build_main_menu().keyboard) == 3
@@ -0,0 +1,51 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+def test_histogram_buckets_and_quantile(main):
+    h = main.Histogram((0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(v)
+    assert h.counts == [2, 1, 1]
+    assert h.quantile(0.5) == 0.1
+    assert h.quantile(0.75) == 1.0
+    assert h.quantile(1.0) == float("inf")
+
+def test_render_is_prometheus_text(main):
+    m = main.Metrics()
+    m.inc("updates_total", kind="message")
+    m.inc("updates_total", 2, kind="message")
+    m.inc("errors_total", kind='say "hi"')
+    m.observe("handler_seconds", 0.003, kind="callback")
+    m.gauge("queue_depth", lambda: 7)
+    m.gauge("broken", lambda: 1 / 0)
+    lines = m.render().splitlines()
+    assert 'bot_updates_total{kind="message"} 3' in lines
+    assert 'bot_errors_total{kind="say \\"hi\\""} 1' in lines
+    assert 'bot_handler_seconds_bucket{kind="callback",le="0.0025"} 0' in lines
+    assert 'bot_handler_seconds_bucket{kind="callback",le="0.005"} 1' in lines
+    assert 'bot_handler_seconds_bucket{kind="callback",le="+Inf"} 1' in lines
+    assert 'bot_handler_seconds_count{kind="callback"} 1' in lines
+    assert "bot_queue_depth 7" in lines
+    assert not any(line.startswith("bot_broken") for line in lines)
+
+@pytest.fixture
+def endpoint(main, monkeypatch):
+    m = main.Metrics()
+    m.inc("updates_total", kind="message")
+    monkeypatch.setattr(main, "METRICS", m)
+    monkeypatch.setitem(main.CONFIG, "METRICS_HOST", "127.0.0.1")
+    monkeypatch.setitem(main.CONFIG, "METRICS_PORT", 0)  # any free port
+    server = main.start_metrics_server()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_metrics_endpoint(endpoint):
+    with urllib.request.urlopen(endpoint + "/metrics", timeout=5) as resp:
+        assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert 'bot_updates_total{kind="message"} 1' in resp.read().decode()
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(endpoint + "/other", timeout=5)
+    assert e.value.code == 404
@@ -0,0 +1,43 @@
+import pytest
+
+@pytest.fixture
+def admins(main, monkeypatch):
+    monkeypatch.setitem(main.CONFIG, "ADMIN_IDS", [1, 2])
+
+@pytest.fixture
+def updates(main, monkeypatch):
+    seen = []
+    monkeypatch.setattr(main.STATS, "order_updated", lambda order, old: seen.append((order["order_id"], old, order["status"])))
+    monkeypatch.setattr(main.OUTBOX, "send", lambda chat_id, text, **kw: None)
+    return seen
+
+@pytest.fixture
+def order(main, store):
+    store.add_order({"order_id": "O1", "user_id": 500, "user_name": "u", "button_id": "b1", "button_text": "Netflix 5$",
+                     "status": "pending", "created_at": "2026-01-01T00:00:00", "handled_at": None})
+    return "O1"
+
+def admin_texts(fake, aid):
+    return [c["params"].get("text", "") for c in fake.calls if c["method"] == "sendMessage" and c["params"].get("chat_id") == str(aid)]
+
+@pytest.mark.parametrize("second", ["approve", "reject", "askmore"])
+def test_first_admin_wins(main, admins, updates, order, fake, callback, second):
+    main.callback_handler(callback(1, f"ORDER|{order}|approve"))
+    main.callback_handler(callback(2, f"ORDER|{order}|{second}"))
+    assert main.STORE.get_order(order)["status"] == "approved"
+    assert updates == [(order, "pending", "approved")]
+    assert any("معالج مسبقاً" in t for t in admin_texts(fake, 2))
+    assert main.admin_sessions.get(2) is None
+
+def test_askmore_then_approve(main, admins, updates, order, fake, callback):
+    main.callback_handler(callback(1, f"ORDER|{order}|askmore"))
+    assert main.STORE.get_order(order)["status"] == "needs_more"
+    assert main.admin_sessions.get(1) == {"action": "askmore_input", "order_id": order}
+    main.admin_sessions.pop(1, None)
+    main.callback_handler(callback(2, f"ORDER|{order}|approve"))
+    assert main.STORE.get_order(order)["status"] == "approved"
+
+def test_order_callback_needs_an_admin(main, updates, order, fake, callback):
+    main.callback_handler(callback(77, f"ORDER|{order}|approve"))
+    assert main.STORE.get_order(order)["status"] == "pending"
+    assert updates == []
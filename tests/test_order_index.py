@@ -0,0 +1,36 @@
+def order(n, status="pending", user_id=None):
+    return {"order_id": f"O{n}", "user_id": user_id or 100 + n % 2, "button_id": "b1", "status": status}
+
+def test_lookups(main):
+    repo = main.OrderRepo([order(1), order(2, "approved"), order(3)])
+    assert repo.get("O2")["status"] == "approved"
+    assert repo.get("missing") is None
+    assert sorted(repo.by_status["pending"]) == ["O1", "O3"]
+
+def test_status_change_moves_buckets(main):
+    repo = main.OrderRepo([order(1), order(2)])
+    repo.update(repo.get("O1"), {"status": "rejected", "handled_at": "2026-01-01T00:00:00"})
+    assert list(repo.by_status["pending"]) == ["O2"]
+    assert list(repo.by_status["rejected"]) == ["O1"]
+    # the record itself is updated in place (it is what the list holds)
+    assert repo.orders[0]["status"] == "rejected"
+    repo.update(repo.get("O2"), {"note": "x"})
+    assert list(repo.by_status["pending"]) == ["O2"]
+
+def test_add_and_remove(main):
+    repo = main.OrderRepo([order(1)])
+    repo.add(order(2))
+    assert repo.get("O2") is repo.orders[-1]
+    repo.remove(["O1", "nope"])
+    assert repo.get("O1") is None
+    assert [o["order_id"] for o in repo.orders] == ["O2"]
+    assert "O1" not in repo.by_status["pending"]
+
+def test_store_lookups(store):
+    for n in range(1, 6):
+        store.add_order(dict(order(n), button_id="b1" if n < 4 else "b2"))
+    store.update_order(store.get_order("O2"), {"status": "approved"})
+    assert store.get_order("O4")["button_id"] == "b2"
+    assert store.count_orders("pending") == 4
+    assert store.count_orders("pending", "b1") == 2
+    assert store.count_orders("approved", "b1") == 1
@@ -0,0 +1,62 @@
+def add_orders(store, n):
+    for i in range(1, n + 1):
+        store.add_order({"order_id": f"O{i}", "user_id": 100 + i % 3, "user_name": f"u{i % 3}",
+                         "button_id": "b1" if i % 2 else "b2", "button_text": "Netflix 5$",
+                         "status": "pending", "created_at": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}", "handled_at": None})
+
+def ids(page):
+    return [o["order_id"] for o in page["orders"]]
+
+def walk(store, limit=4, **filters):
+    # every page from the newest one, following "older"
+    out, before = [], None
+    while True:
+        page = store.orders_page(before=before, limit=limit, **filters)
+        out += ids(page)
+        if page["older"] is None:
+            return out
+        before = page["older"]
+
+def set_status(store, oid, status):
+    store.update_order(store.get_order(oid), {"status": status})
+
+def test_pages_newest_first(store):
+    add_orders(store, 10)
+    assert walk(store) == [f"O{i}" for i in range(10, 0, -1)]
+    assert walk(store, status="pending", button_id="b1") == ["O9", "O7", "O5", "O3", "O1"]
+    assert walk(store, user_id=101, button_id="b1") == ["O7", "O1"]
+
+def test_newer_goes_back(store):
+    add_orders(store, 10)
+    first = store.orders_page(limit=4)
+    second = store.orders_page(before=first["older"], limit=4)
+    assert ids(second) == ["O6", "O5", "O4", "O3"]
+    assert second["newer"] is not None
+    back = store.orders_page(after=second["newer"], limit=4)
+    assert ids(back) == ids(first)
+    assert back["newer"] is None
+
+def test_status_round_trip_keeps_place(store):
+    add_orders(store, 5)
+    set_status(store, "O1", "needs_more")
+    set_status(store, "O1", "pending")
+    assert walk(store, status="pending") == ["O5", "O4", "O3", "O2", "O1"]
+    assert walk(store, status="pending", button_id="b1") == ["O5", "O3", "O1"]
+
+def test_cursor_survives_status_changes(store):
+    add_orders(store, 10)
+    first = store.orders_page(status="pending", limit=4)
+    assert ids(first) == ["O10", "O9", "O8", "O7"]
+    # other admins handle orders on both sides of the cursor meanwhile
+    for oid in ("O9", "O5", "O2"):
+        set_status(store, oid, "approved")
+    rest = store.orders_page(status="pending", before=first["older"], limit=4)
+    assert ids(rest) == ["O6", "O4", "O3", "O1"]
+
+def test_cursor_survives_archiving(store):
+    add_orders(store, 10)
+    first = store.orders_page(limit=3)
+    store.remove_orders(["O10", "O6", "O3"])
+    rest = store.orders_page(before=first["older"], limit=3)
+    assert ids(rest) == ["O7", "O5", "O4"]
+    assert walk(store) == ["O9", "O8", "O7", "O5", "O4", "O2", "O1"]
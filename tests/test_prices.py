@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+# convert_text_prices before the precompiled templates (copied from the
+# baseline main.py): a regex substitution on every call
+def format_number(n):
+    try:
+        if abs(n - int(n)) < 0.001:
+            return f"{int(n):,}"
+        return f"{n:,.2f}"
+    except Exception:
+        return str(n)
+
+def old_convert_text_prices(main, text, target_currency, rate):
+    def repl(m):
+        val = float(m.group(1))
+        if target_currency == "USD":
+            return f"{int(val)}$" if val.is_integer() else f"{val}$"
+        if target_currency == "SYP":
+            if rate is None:
+                return f"{int(val)}$" if val.is_integer() else f"{val}$"
+            converted = val * float(rate)
+            return f"{format_number(converted)} ل.س"
+        return m.group(0)
+    return main.PRICE_PATTERN.sub(repl, text)
+
+WORDS = ["نتفليكس", "شهر", "Netflix", "1 month", "—", "(", ")", "VIP", "x2", "$", "٥$", "\n", "🔥"]
+RATES = [15000, 14750.5, 1, 0.5, 13.333, 123456789]
+
+def random_price(rnd):
+    whole = str(rnd.choice([0, 1, 5, 12, 100, 2500, rnd.randint(0, 10 ** 6)]))
+    if rnd.random() < 0.4:
+        whole += "." + str(rnd.randint(0, 999)).rjust(rnd.randint(1, 3), "0")
+    if rnd.random() < 0.1:
+        whole = "-" + whole
+    return whole + " " * rnd.choice([0, 0, 1, 2]) + "$"
+
+def random_texts(n, seed=18):
+    rnd = random.Random(seed)
+    texts = ["", "بدون سعر", "5$", "5 $", "5.0$", "0.99$", "-3$", "1$ 2$ 3$", "3$$", "$5", "1.$", "10.50$"]
+    while len(texts) < n:
+        parts = [rnd.choice(WORDS) if rnd.random() < 0.6 else random_price(rnd) for _ in range(rnd.randint(1, 8))]
+        texts.append(" ".join(parts))
+    return texts
+
+@pytest.fixture
+def syp(main):
+    yield main.PRICING
+    main.PRICING.set_rate("SYP", 15000, save=False)
+
+def test_matches_old_conversion(main, syp):
+    texts = random_texts(3000)
+    for text in texts:
+        assert main.convert_text_prices(text, "USD") == old_convert_text_prices(main, text, "USD", None), text
+    for rate in RATES:
+        syp.set_rate("SYP", rate, save=False)
+        for text in texts:
+            assert main.convert_text_prices(text, "SYP") == old_convert_text_prices(main, text, "SYP", rate), (text, rate)
+
+def test_template_parses_once(main):
+    t = main.price_template("باقة 2$ و 0.5$ (عرض)")
+    assert main.price_template("باقة 2$ و 0.5$ (عرض)") is t
+    assert t.values == [2.0, 0.5]
+    assert t.render("USD") == t.usd == "باقة 2$ و 0.5$ (عرض)"
+    assert main.price_template("بدون سعر").render("SYP") == "بدون سعر"
+
+def test_button_price(main):
+    assert main.button_price({"text": "Netflix 1 month 4.5$ (2$ off)"}) == 4.5
+    assert main.button_price({"text": "no price"}) is None
+    assert main.button_price(None) is None
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+@pytest.fixture
+def pricing(main, workdir, monkeypatch):
+    p = main.Pricing("rates.json", {"EXCHANGE_RATE": 15000})
+    monkeypatch.setattr(main, "PRICING", p)
+    return p
+
+def test_exchange_rate_seeds_syp_once(main, pricing):
+    assert pricing.currencies() == ["SYP"]
+    assert pricing.rate("SYP") == 15000
+    assert [h["rate"] for h in pricing.history] == [15000]
+    pricing.set_rate("try", 32.5, by=1)
+    again = main.Pricing("rates.json", {"EXCHANGE_RATE": 9})
+    assert again.currencies() == ["SYP", "TRY"]
+    assert again.rate("SYP") == 15000 and again.rates["TRY"]["symbol"] == "₺"
+    assert again.version == pricing.version
+    assert again.last_change("TRY")["by"] == 1
+
+def test_converters_are_cached_per_version(main, pricing):
+    conv = pricing.converter("SYP")
+    assert pricing.converter("SYP") is conv
+    assert pricing.converter("EUR") is None
+    version = pricing.version
+    pricing.set_rate("SYP", 16000, save=False)
+    assert pricing.version == version + 1
+    assert pricing.converter("SYP") is not conv
+    assert pricing.converter("SYP").format(2) == "32,000 ل.س"
+
+def test_quote_snapshots_the_rate(main, pricing):
+    assert pricing.quote(5, "SYP") == {"price_usd": 5, "currency": "SYP", "price": 75000, "rate": 15000}
+    assert pricing.quote(5, "EUR") == {"price_usd": 5, "currency": "USD", "price": 5}
+    assert pricing.quote(5, "USD") == {"price_usd": 5, "currency": "USD", "price": 5}
+    order = pricing.quote(5, "SYP")
+    pricing.set_rate("SYP", 20000, save=False)
+    assert main.order_price_text(order) == "75,000 ل.س (5$ @ 15,000)"
+    assert main.order_price_text(pricing.quote(1.5, "USD")) == "1.50$"
+
+def test_remove_is_recorded(main, pricing):
+    assert pricing.remove("EUR") is False
+    assert pricing.remove("SYP", by=1) is True
+    assert pricing.currencies() == []
+    assert pricing.last_change("SYP") == {"currency": "SYP", "rate": None, "at": pricing.history[-1]["at"], "by": 1}
+    with open("rates.json", encoding="utf-8") as f:
+        assert json.load(f)["rates"] == {}
+
+def test_history_is_capped(main, pricing, monkeypatch):
+    monkeypatch.setattr(main, "RATE_HISTORY_LIMIT", 5)
+    for n in range(1, 9):
+        pricing.set_rate("SYP", n, save=False)
+    assert [h["rate"] for h in pricing.history] == [4, 5, 6, 7, 8]
+
+def test_rendered_text_follows_rate_changes(main, pricing):
+    t = main.price_template("باقة 2$ و 0.5$")
+    pricing.set_rate("SYP", 100, save=False)
+    assert t.render("SYP") == "باقة 200 ل.س و 50 ل.س"
+    assert t.render("SYP") is t.render("SYP")  # cached per rate version
+    pricing.set_rate("SYP", 200, save=False)
+    assert t.render("SYP") == "باقة 400 ل.س و 100 ل.س"
+    pricing.set_rate("EUR", 0.5, save=False)
+    assert t.render("EUR") == "باقة 1 € و 0.25 €"
+
+def test_no_rate_shows_usd(main, pricing):
+    pricing.remove("SYP")
+    assert main.convert_text_prices("شهر 7.5$", "SYP") == "شهر 7.5$"
+    assert main.auto_currency() == "USD"
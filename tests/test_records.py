@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+ORDER = {"order_id": "O1", "user_id": 501, "user_name": "سارة", "button_id": "b1", "button_text": "Netflix 5$",
+         "info": "email@x", "status": "pending", "created_at": "2026-01-02T03:04:05", "price_usd": 5.0,
+         "currency": "SYP", "price": 65000, "rate": 13000, "handled_at": None, "note": {"by": 1}}
+
+@pytest.mark.parametrize("stamp", ["2026-01-02T03:04:05", "2026-01-02T03:04:05.000123", "1969-12-31T23:59:59",
+                                   "2026-01-02T03:04:05+03:00", "2026-01-02 03:04:05", "2026-01-02", "yesterday", ""])
+def test_times_round_trip_exactly(main, stamp):
+    rec = main.OrderRecord({"order_id": "O1", "created_at": stamp})
+    assert rec["created_at"] == stamp
+    assert dict(rec) == {"order_id": "O1", "created_at": stamp}
+
+def test_only_plain_isoformat_is_packed(main):
+    rec = main.OrderRecord(ORDER)
+    assert type(rec.created_at) is int
+    rec["handled_at"] = "2026-01-02T03:04:05+03:00"
+    assert type(rec.handled_at) is str
+
+def test_order_keeps_its_json_shape(main):
+    rec = main.OrderRecord(ORDER)
+    assert dict(rec) == ORDER
+    assert list(rec) == list(ORDER)
+    assert json.loads(json.dumps(rec, default=main._json_default)) == ORDER
+    assert json.loads(main._dump([rec])) == [ORDER]
+
+def test_mapping_behaviour(main):
+    rec = main.UserRecord({"id": 5, "name": "u"})
+    assert rec.get("currency_pref") is None and "currency_pref" not in rec
+    with pytest.raises(KeyError):
+        rec["awaiting"]
+    rec.setdefault("awaiting", {"step": 1})["step"] = 2
+    rec.update(currency_pref="SYP", extra=[1])
+    assert rec == {"id": 5, "name": "u", "awaiting": {"step": 2}, "currency_pref": "SYP", "extra": [1]}
+    del rec["awaiting"], rec["extra"]
+    with pytest.raises(KeyError):
+        del rec["extra"]
+    assert rec.pop("currency_pref") == "SYP"
+    assert rec.to_dict() == {"id": 5, "name": "u"} and len(rec) == 2
+
+def test_repeated_strings_are_shared(main):
+    a = main.OrderRecord(json.loads(json.dumps(ORDER)))
+    b = main.OrderRecord(json.loads(json.dumps(ORDER)))
+    assert a.status is b.status and a.button_id is b.button_id and a.currency is b.currency
+
+def test_compact_helpers(main):
+    users = main.compact_users({"5": {"id": 5}, "6": main.UserRecord(id=6)})
+    assert all(isinstance(u, main.UserRecord) for u in users.values())
+    assert users["5"] == {"id": 5}
+    orders = main.compact_orders([ORDER, main.OrderRecord(ORDER)])
+    assert all(isinstance(o, main.OrderRecord) for o in orders)
+    assert main.compact_users(None) is None and main.compact_orders(None) is None
+
+def test_stores_return_what_was_saved(main, store):
+    store.add_order(dict(ORDER))
+    assert dict(store.get_order("O1")) == ORDER
+    store.update_order(store.get_order("O1"), {"status": "approved", "handled_at": "2026-01-03T00:00:00.500000"})
+    again = main.SqliteStore("bot.db") if store.name == "sqlite" else main.JsonStore()
+    assert dict(again.get_order("O1")) == dict(ORDER, status="approved", handled_at="2026-01-03T00:00:00.500000")
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(main, monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(main.time, "time", c)
+    return c
+
+@pytest.fixture
+def sessions(main, workdir, clock):
+    return main.SessionStore("sessions.json", ttl=60, max_entries=3, tick=5, slots=4, key_type=int)
+
+def test_entries_expire_after_ttl(main, sessions, clock):
+    sessions[1] = {"action": "add_button"}
+    clock.now += 30
+    sessions[2] = {"action": "broadcast"}
+    clock.now += 31
+    assert 1 not in sessions  # past its TTL even before the wheel gets there
+    assert sessions[2] == {"action": "broadcast"}
+    clock.now += 30
+    assert sessions.advance() == 1
+    assert len(sessions) == 0 and sessions.stats()["expired"] == 2
+
+def test_wheel_wraps_around(main, sessions, clock):
+    # ttl 60 is three turns of a 4-slot, 5s wheel
+    sessions[1] = "x"
+    for _ in range(11):
+        clock.now += 5
+        assert sessions.advance() == 0
+    clock.now += 5
+    assert sessions.advance() == 1
+    assert sessions.get(1) is None
+
+def test_long_pause_visits_every_slot_once(main, sessions, clock):
+    for key in (1, 2, 3):
+        sessions[key] = key
+        clock.now += 3
+    clock.now += 3600
+    assert sessions.advance() == 3
+
+def test_touch_restarts_the_ttl(main, sessions, clock):
+    sessions[1] = {"step": 1}
+    clock.now += 50
+    sessions[1]["step"] = 2
+    sessions.touch(1)
+    clock.now += 50
+    assert sessions.advance() == 0
+    assert sessions[1] == {"step": 2}
+    sessions.touch(404)
+    assert 404 not in sessions
+
+def test_least_recently_used_are_evicted(main, sessions, clock):
+    for key in (1, 2, 3):
+        sessions[key] = key
+    sessions[1]  # used again
+    sessions[4] = 4
+    assert sorted(sessions) == [1, 3, 4]
+    assert sessions.stats() == {"active": 3, "expired": 0, "evicted": 1}
+
+def test_survives_a_restart(main, sessions, clock):
+    sessions[1] = {"action": "a"}
+    sessions[2] = {"action": "b"}
+    del sessions[2]
+    clock.now += 30
+    sessions[3] = {"action": "c"}
+    reopened = main.SessionStore("sessions.json", ttl=60, tick=5, key_type=int)
+    assert dict(reopened) == {1: {"action": "a"}, 3: {"action": "c"}}
+    clock.now += 31  # 1 expired while the bot was down
+    assert dict(main.SessionStore("sessions.json", ttl=60, tick=5, key_type=int)) == {3: {"action": "c"}}
+
+def test_journal_is_folded_into_the_snapshot(main, sessions, clock, monkeypatch):
+    monkeypatch.setattr(main.SessionStore, "COMPACT_AFTER", 5)
+    for n in range(6):
+        sessions[n % 2] = n
+    assert os.path.exists("sessions.json" + main.JOURNAL_SUFFIX)
+    sessions.advance()
+    assert not os.path.exists("sessions.json" + main.JOURNAL_SUFFIX)
+    assert main.load_json("sessions.json", {}) == {"0": {"v": 4, "exp": clock.now + 60}, "1": {"v": 5, "exp": clock.now + 60}}
+    assert dict(main.SessionStore("sessions.json", ttl=60, key_type=int)) == {0: 4, 1: 5}
+
+def test_string_keys_for_awaiting(main, workdir, clock):
+    awaiting = main.SessionStore("awaiting.json", ttl=3600)
+    awaiting["42"] = {"button_id": "b1"}
+    assert dict(main.SessionStore("awaiting.json", ttl=3600)) == {"42": {"button_id": "b1"}}
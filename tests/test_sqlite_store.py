@@ -0,0 +1,32 @@
+import pytest
+
+from test_journal import EXPECTED_USERS, expected_orders, fill, orders_of, users_of
+
+def test_round_trip(main, workdir):
+    store = main.SqliteStore("bot.db")
+    fill(main, store)
+    store.compact()
+    store = main.SqliteStore("bot.db")
+    assert users_of(store) == EXPECTED_USERS
+    assert orders_of(store) == expected_orders()
+    assert store.count_orders("approved") == 2
+    assert store.get_order("O5") is None
+
+def test_migrates_json_snapshot_and_journal(main, json_store):
+    # switching backends imports snapshot + journal
+    fill(main, json_store)
+    store = main.SqliteStore("bot.db")
+    assert users_of(store) == EXPECTED_USERS
+    assert orders_of(store) == expected_orders()
+
+def test_commits_are_fsynced(main, workdir):
+    # FULL (2): a committed order survives power loss, like the json journal
+    store = main.SqliteStore("bot.db")
+    assert store._db().execute("PRAGMA synchronous").fetchone()[0] == 2
+
+def test_update_orders_expect(main, workdir):
+    store = main.SqliteStore("bot.db")
+    fill(main, store)
+    done = store.update_orders([store.get_order("O1"), store.get_order("O2")], {"status": "rejected"}, expect=("pending",))
+    assert [o["order_id"] for o in done] == ["O1"]
+    assert store.get_order("O2")["status"] == "approved"
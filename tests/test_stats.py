@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+def iso(**delta):
+    return (datetime.now() - timedelta(**delta)).isoformat(timespec="seconds")
+
+def new_order(n, status="pending", created=None, handled=None):
+    return {"order_id": f"O{n}", "user_id": 500 + n, "button_id": "b1", "button_text": "Netflix 5$", "status": status,
+            "created_at": created or iso(minutes=30), "handled_at": handled}
+
+@pytest.fixture
+def stats(main, store):
+    agg = main.StatsAggregator("stats.json")
+    agg.load(store)
+    return agg
+
+def handle(stats, store, oid, fields):
+    o = store.get_order(oid)
+    old = o.get("status")
+    store.update_order(o, fields)
+    stats.order_updated(store.get_order(oid), old)
+
+def test_only_approve_and_reject_count_as_handled(main, store, stats):
+    for n in (1, 2, 3):
+        store.add_order(new_order(n))
+        stats.order_created(new_order(n))
+    handle(stats, store, "O1", {"status": "needs_more"})
+    handle(stats, store, "O1", {"status": "pending"})
+    handle(stats, store, "O2", {"status": "approved", "handled_at": iso(minutes=1)})
+    handle(stats, store, "O3", {"status": "rejected", "handled_at": iso(minutes=1)})
+    w = stats.window(24)
+    assert w["status"] == {"approved": 1, "rejected": 1}
+    assert w["created"] == {"Netflix 5$": 3}
+    assert w["approval"].count == 1
+    assert stats.totals()["status"] == {"pending": 1, "needs_more": 0, "approved": 1, "rejected": 1}
+
+def test_handled_counted_in_the_hour_it_happened(main, store, stats):
+    store.add_order(new_order(1, created=iso(days=3)))
+    stats.order_created(new_order(1, created=iso(days=3)))
+    handle(stats, store, "O1", {"status": "approved", "handled_at": iso(days=2)})
+    assert stats.window(24)["status"] == {}
+    assert stats.window(24 * 7)["status"] == {"approved": 1}
+
+def test_rebuild_uses_handled_at(main, store):
+    store.add_order(new_order(1, "approved", created=iso(days=10), handled=iso(days=9)))
+    store.add_order(new_order(2, "needs_more", created=iso(days=10)))
+    store.add_order(new_order(3, "rejected", created=iso(hours=3), handled=iso(hours=2)))
+    agg = main.StatsAggregator("stats.json")
+    agg.load(store)
+    assert agg.window(24)["status"] == {"rejected": 1}
+    assert agg.window(24 * 30)["status"] == {"approved": 1, "rejected": 1}
+    assert agg.totals()["status"] == {"pending": 0, "approved": 1, "needs_more": 1, "rejected": 1}
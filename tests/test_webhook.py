@@ -0,0 +1,64 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+# as Telegram posts it
+START_UPDATE = {"update_id": 7001, "message": {
+    "message_id": 11, "date": 1700000000, "text": "/start",
+    "chat": {"id": 42, "type": "private", "first_name": "Sam"},
+    "from": {"id": 42, "is_bot": False, "first_name": "Sam"},
+    "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}
+
+@pytest.fixture
+def webhook(main, monkeypatch):
+    received = []
+    def submit(update, block=True):
+        received.append(update)
+        return True
+    monkeypatch.setattr(main.DISPATCHER, "submit", submit)
+    server = main.make_webhook_server("127.0.0.1", 0, "/telegram", secret="s3cret")
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", received
+    server.shutdown()
+    server.server_close()
+
+def post(url, body, secret=None):
+    req = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+    if secret is not None:
+        req.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def test_update_with_secret_is_dispatched(webhook):
+    base, received = webhook
+    assert post(base + "/telegram", json.dumps(START_UPDATE).encode(), "s3cret") == 200
+    assert [u.update_id for u in received] == [7001]
+    assert received[0].message.text == "/start"
+    assert received[0].message.chat.id == 42
+
+@pytest.mark.parametrize("secret", [None, "", "wrong", "s3cret "])
+def test_secret_mismatch_is_rejected(webhook, secret):
+    base, received = webhook
+    assert post(base + "/telegram", json.dumps(START_UPDATE).encode(), secret) == 403
+    assert received == []
+
+def test_unknown_path_is_404(webhook):
+    base, received = webhook
+    assert post(base + "/other", json.dumps(START_UPDATE).encode(), "s3cret") == 404
+    assert received == []
+
+def test_bad_payload_is_400(webhook):
+    base, received = webhook
+    assert post(base + "/telegram", b"{not json", "s3cret") == 400
+    assert received == []
+
+def test_full_queue_is_503(webhook, main, monkeypatch):
+    base, _ = webhook
+    monkeypatch.setattr(main.DISPATCHER, "submit", lambda update, block=True: False)
+    assert post(base + "/telegram", json.dumps(START_UPDATE).encode(), "s3cret") == 503
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+URL = "https://example.com/netflix.png"
+
+def worker_import(tmp_path, worker_id, code):
+    # main as main_workers.py starts it: BOT_WORKER_ID/BOT_WORKER_COUNT in the environment
+    env = dict(os.environ, BOT_WORKER_ID=str(worker_id), BOT_WORKER_COUNT="2", PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-c", "import main\n" + code + "\nmain.scheduler.shutdown(wait=False)"],
+                         cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    return out.stdout.strip()
+
+def test_media_cache_per_worker(tmp_path):
+    (tmp_path / "config.json").write_text(json.dumps({"BOT_TOKEN": "123:TEST", "STORAGE_BACKEND": "sqlite"}), encoding="utf-8")
+    (tmp_path / "media_cache.json").write_text(json.dumps({URL: {"file_id": "FID0"}}), encoding="utf-8")
+    code = f"print(main.MEDIA.path, main.MEDIA.resolve({URL!r})); main.MEDIA.remember('https://example.com/x.png', 'FIDW')"
+    assert worker_import(tmp_path, 0, code) == "media_cache.w0.json FID0"
+    assert worker_import(tmp_path, 1, code) == "media_cache.w1.json FID0"
+    # each worker wrote its own file: neither overwrote the other's file_ids
+    for n in (0, 1):
+        cached = json.loads((tmp_path / f"media_cache.w{n}.json").read_text(encoding="utf-8"))
+        assert cached == {URL: {"file_id": "FID0"}, "https://example.com/x.png": {"file_id": "FIDW"}}
+    assert json.loads((tmp_path / "media_cache.json").read_text(encoding="utf-8")) == {URL: {"file_id": "FID0"}}
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+@pytest.fixture
+def users(main, store, monkeypatch):
+    monkeypatch.setattr(main, "USERS", store.users)
+    return store.users
+
+@pytest.fixture
+def writes(store, monkeypatch):
+    calls = []
+    save_users = store.save_users
+    def spy(items):
+        items = list(items)
+        calls.append(sorted(uid for uid, _ in items))
+        save_users(items)
+    monkeypatch.setattr(store, "save_users", spy)
+    return calls
+
+@pytest.fixture
+def write_behind(main, store):
+    made = []
+    def make(**kwargs):
+        wb = main.UserWriteBehind(store, **kwargs)
+        made.append(wb)
+        return wb
+    yield make
+    for wb in made:
+        wb.stop()
+
+def reopen(main, store):
+    return main.SqliteStore("bot.db") if store.name == "sqlite" else main.JsonStore()
+
+def test_changes_are_coalesced(main, store, users, writes, write_behind):
+    wb = write_behind(interval=60)
+    for n in range(5):
+        users["1"] = main.UserRecord(id=1, balance=n)
+        wb.mark("1")
+    users["2"] = main.UserRecord(id=2)
+    wb.mark("2")
+    assert writes == []
+    assert wb.flush() == 2
+    assert writes == [["1", "2"]]
+    assert wb.flush() == 0
+    assert reopen(main, store).users["1"]["balance"] == 4
+
+def test_full_batch_flushes_early(main, store, users, writes, write_behind):
+    wb = write_behind(interval=60, max_dirty=3)
+    for n in range(3):
+        users[str(n)] = main.UserRecord(id=n)
+        wb.mark(str(n))
+    deadline = time.monotonic() + 5
+    while wb.pending():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert writes == [["0", "1", "2"]]
+
+def test_dirty_profiles_stay_cached_until_written(main, store, users, write_behind):
+    wb = write_behind(interval=60)
+    users.capacity = 1
+    for n in range(3):
+        users[str(n)] = main.UserRecord(id=n)
+        wb.mark(str(n))
+    # nothing written yet: evicting them would lose the changes
+    assert [users.get(str(n))["id"] for n in range(3)] == [0, 1, 2]
+    wb.flush()
+    assert [users.get(str(n))["id"] for n in range(3)] == [0, 1, 2]
+
+def test_deletes_and_stop_flush(main, store, users, write_behind):
+    wb = write_behind(interval=60)
+    users["1"] = main.UserRecord(id=1)
+    users["2"] = main.UserRecord(id=2)
+    wb.mark("1")
+    wb.mark("2")
+    wb.flush()
+    del users["2"]
+    wb.mark("2")
+    wb.stop()
+    assert sorted(reopen(main, store).users) == ["1"]